@@ -0,0 +1,343 @@
+"""
+Reproducible timings of the hot paths on seeded synthetic data, no API keys or excel files needed
+
+    python benchmark_suite.py                      time everything, write benchmark_results.json (not committed)
+                                                   and flag regressions against the committed benchmark_baseline.json
+    python benchmark_suite.py --save-baseline      store the run as the new baseline instead
+    python benchmark_suite.py --baseline other.json   compare against another run
+"""
+from utils import stock_utils, synthetic_data, intraday_parser
+from utils.bars import Bars
+from utils.online_indicators import OnlineTicker
+from utils.panel import PricePanel
+from utils.replay import ReplayEngine, frameSources
+from utils.universe import Universe
+import strategies
+import pandas
+import numpy as np
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_PATH = os.path.join(BENCHMARK_DIR, 'benchmark_results.json')
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'benchmark_baseline.json')
+
+# A benchmark is slower than its baseline when its median grows by more than this fraction
+DEFAULT_TOLERANCE = 0.25
+
+
+def setupPivots(size):
+    return (synthetic_data.dailyBars(size, seed=size),)
+
+
+def setupTrendLine(size):
+    _, resistance = stock_utils.getPivotPoints(synthetic_data.dailyBars(size, seed=size))
+    return (resistance,)
+
+
+def runTrendLine(resistance):
+    return stock_utils.generateTrendLine(resistance, reverse=True)
+
+
+def runHullTrendLine(resistance):
+    return stock_utils.generateTrendLine(resistance, reverse=True, mode='hull')
+
+
+def setupSplitCandles(size):
+    return (synthetic_data.minuteBars(size, seed=size),)
+
+
+def setupDays(size):
+    return (synthetic_data.minuteDays(size, seed=size),)
+
+
+def runDailyChartStats(days):
+    for tradeDate, chart in days:
+        chart = strategies.DailyChartBase(chart, tradeDate, 0)
+        chart.getPremarketHigh()
+        chart.getPremarketHighTime()
+        chart.getPremarketLow()
+        chart.getPremarketLowTime()
+        chart.getPremarketVolume()
+        chart.getRegularVolume()
+
+
+def runDipAndRip(days):
+    for tradeDate, chart in days:
+        strategies.DipAndRip(chart, tradeDate, 0).backTest(shareCount=100)
+
+
+def setupOnlineBars(size):
+    chart = synthetic_data.minuteBars(size, seed=size)
+    return ([(stamp.to_pydatetime(),) + tuple(row) for stamp, row
+             in zip(chart['Datetime'], chart[['Open', 'High', 'Low', 'Close', 'Volume']].itertuples(index=False))],)
+
+
+def runOnlineTicker(bars):
+    ticker = OnlineTicker('SYN')
+    for bar in bars:
+        ticker.update(*bar)
+
+
+def setupIntradayCsv(size):
+    return (synthetic_data.intradayCsv(size, seed=size),)
+
+
+def parseIntradayCsvLoop(content):
+    """
+    csv.reader parser getIntradayDataAV used before parseIntradayCsv, kept as the reference it is timed against
+    """
+    decoded_content = content.decode('utf-8')
+    cr = csv.reader(decoded_content.splitlines(), delimiter=',')
+    ls = list(cr)
+
+    columns = [i.title() for i in ls[0]]
+    data = ls[1:]
+    df = pandas.DataFrame(data[::-1], columns=columns)
+
+    df['Datetime'] = pandas.to_datetime(df['Time'])
+
+    df['Date'] = pandas.to_datetime(df['Datetime']).dt.date
+    df['Time'] = pandas.to_datetime(df['Datetime']).dt.time
+
+    typeMap = {
+        'Open': float,
+        'High': float,
+        'Low': float,
+        'Close': float,
+        'Volume': int,
+    }
+
+    return df.astype(typeMap)
+
+
+def setupEmaBackTest(size):
+    chart = synthetic_data.dailyBars(size, seed=size)
+    ema = strategies.EMACrossoverTrading('SYN', chart.index[0].date(), chart.index[-1].date())
+    ema.generateEMAData(chart)
+    return ema, chart
+
+
+def runEmaBackTest(ema, chart):
+    return ema.backTest(chart, 10000)
+
+
+def setupPanel(size):
+    # Tickers listing on different days
+    charts = {'T{0}'.format(i): synthetic_data.dailyBars(750, seed=i).iloc[i % 200:] for i in range(size)}
+    return (PricePanel.fromCharts(charts),)
+
+
+def runPanelIndicators(panel):
+    panel.sma(50)
+    panel.ema(5)
+    panel.ema(20)
+
+
+def setupReplay(size):
+    return ({'T{0}'.format(i): synthetic_data.minuteBars(1, seed=i) for i in range(size)},)
+
+
+def runReplay(frames):
+    return ReplayEngine(frameSources(frames)).run()
+
+
+# Small caps trading at least a million shares
+UNIVERSE_RANGES = {'Market Cap': (None, 300000000), 'Volume': (1000000, None)}
+
+
+def setupUniverse(size):
+    return (Universe(synthetic_data.universeFrame(size, seed=size)),)
+
+
+def runUniversePositions(universe):
+    for _ in range(100):
+        universe.positions(UNIVERSE_RANGES)
+
+
+def runUniverseMask(universe):
+    df = universe.data
+    for _ in range(100):
+        df[(df['Market Cap'] < 300000000) & (df['Volume'] >= 1000000)]
+
+
+def setupBarsFrame(size):
+    return (synthetic_data.minuteBars(size, seed=size),)
+
+
+def runBarsFromFrame(chart):
+    for _, day in Bars.fromFrame(chart, 'TEST', np.float32).iterDays():
+        day.sessions()
+
+
+def barsMemory(days=20):
+    """
+    Bytes per minute bar of a chart dataframe against Bars with float64 and float32 prices
+    :return: Dict of the sizes, the float32 size of a year of minute bars for 5,000 tickers, and whether
+             session slices share the Bars memory
+    """
+    chart = synthetic_data.minuteBars(days, seed=7)
+    memory = {'Chart Bytes Per Bar': float(chart.memory_usage(index=True, deep=True).sum() / len(chart))}
+    for priceType in [np.float64, np.float32]:
+        bars = Bars.fromFrame(chart, 'TEST', priceType)
+        memory['{0} Bytes Per Bar'.format(np.dtype(priceType).name)] = bars.nbytes / len(bars)
+
+    memory['float32 GB Per Year Of 5000 Tickers'] = memory['float32 Bytes Per Bar'] * 960 * 252 * 5000 / 1024 ** 3
+    _, day = next(bars.iterDays())
+    memory['Sessions Share Memory'] = bool(np.shares_memory(day.sessions()[1].High, bars.High))
+    return memory
+
+
+# name: (setup(size) -> args, function(*args), sizes)
+BENCHMARKS = {
+    'getPivotPoints': (setupPivots, stock_utils.getPivotPoints, [250, 1250, 5000]),
+    'generateTrendLine': (setupTrendLine, runTrendLine, [250, 1250, 5000]),
+    'generateTrendLine hull': (setupTrendLine, runHullTrendLine, [250, 1250, 5000]),
+    'splitCandles': (setupSplitCandles, stock_utils.splitCandles, [1, 20, 60]),
+    'parseIntradayCsv': (setupIntradayCsv, intraday_parser.parseIntradayCsv, [1, 22]),
+    'parseIntradayCsv csv.reader': (setupIntradayCsv, parseIntradayCsvLoop, [1, 22]),
+    'DailyChartBase stats': (setupDays, runDailyChartStats, [1, 10, 50]),
+    'EMACrossoverTrading.backTest': (setupEmaBackTest, runEmaBackTest, [250, 1250, 5000]),
+    'DipAndRip.backTest': (setupDays, runDipAndRip, [1, 10, 50]),
+    'OnlineTicker.update': (setupOnlineBars, runOnlineTicker, [1, 5]),
+    'PricePanel indicators': (setupPanel, runPanelIndicators, [50, 500]),
+    'ReplayEngine.run': (setupReplay, runReplay, [20, 200]),
+    'Universe.positions x100': (setupUniverse, runUniversePositions, [1000, 8000]),
+    'Universe boolean mask x100': (setupUniverse, runUniverseMask, [1000, 8000]),
+    'Bars.fromFrame sessions': (setupBarsFrame, runBarsFromFrame, [1, 20]),
+}
+
+
+# Benchmark: the reference implementation it replaced, both timed on the same input
+REFERENCES = {
+    'parseIntradayCsv': 'parseIntradayCsv csv.reader',
+    'Universe.positions x100': 'Universe boolean mask x100',
+}
+
+
+def timeBenchmark(setup, function, size, repeat):
+    """
+    Time one benchmark at one size, setup is not timed
+    :return: Dict with the Min, Median and every run in seconds
+    """
+    args = setup(size)
+    function(*args)
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        runs.append(time.perf_counter() - start)
+
+    return {'Min': min(runs), 'Median': statistics.median(runs), 'Runs': runs}
+
+
+def runSuite(names=None, repeat=5, quick=False):
+    """
+    Run the benchmarks
+    :param names: Benchmarks to run, defaults to all
+    :param repeat: Timed runs per benchmark and size
+    :param quick: Only the smallest size of each benchmark
+    :return: Dict of the run with environment info and results by benchmark and size
+    """
+    results = {}
+    for name, (setup, function, sizes) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = {}
+        for size in sizes[:1] if quick else sizes:
+            timing = timeBenchmark(setup, function, size, repeat)
+            results[name][str(size)] = timing
+            print('{0:<30} {1:>6} {2:>10.5f}s median {3:>10.5f}s min'.format(name, size, timing['Median'],
+                                                                                timing['Min']))
+
+    return {
+        'Created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'Python': platform.python_version(),
+        'Machine': platform.platform(),
+        'Repeat': repeat,
+        'Results': results,
+    }
+
+
+def compareToBaseline(run, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Find benchmarks whose median got slower than the baseline by more than tolerance
+    :return: List of dicts with Benchmark, Size, Baseline, Current and Ratio
+    """
+    regressions = []
+    for name, sizes in run['Results'].items():
+        for size, timing in sizes.items():
+            before = baseline['Results'].get(name, {}).get(size)
+            if before is None:
+                continue
+            ratio = timing['Median'] / before['Median'] if before['Median'] > 0 else float('inf')
+            if ratio > 1 + tolerance:
+                regressions.append({'Benchmark': name, 'Size': size, 'Baseline': before['Median'],
+                                    'Current': timing['Median'], 'Ratio': ratio})
+    return regressions
+
+
+def speedups(run):
+    """
+    Median speedup of each benchmark over its reference at every size both ran
+    :return: List of dicts with Benchmark, Reference, Size and Speedup
+    """
+    found = []
+    results = run['Results']
+    for name, reference in REFERENCES.items():
+        for size, timing in results.get(name, {}).items():
+            before = results.get(reference, {}).get(size)
+            if before is not None and timing['Median'] > 0:
+                found.append({'Benchmark': name, 'Reference': reference, 'Size': size,
+                              'Speedup': before['Median'] / timing['Median']})
+    return found
+
+
+def saveJson(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def loadJson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the stock analysis hot paths on synthetic data')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help='Where to write this run')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline json to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run to the baseline path instead')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown fraction')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark and size')
+    parser.add_argument('--quick', action='store_true', help='Only the smallest size of each benchmark')
+    parser.add_argument('--only', nargs='*', help='Benchmark names to run')
+    args = parser.parse_args()
+
+    run = runSuite(args.only, args.repeat, args.quick)
+    for speedup in speedups(run):
+        print('{Benchmark} at {Size}: {Speedup:.1f}x faster than {Reference}'.format(**speedup))
+    run['Memory'] = barsMemory()
+    for name, value in run['Memory'].items():
+        print('{0:<36} {1}'.format(name, round(value, 2) if isinstance(value, float) else value))
+    saveJson(run, args.output)
+    if args.save_baseline:
+        saveJson(run, args.baseline)
+    elif not os.path.exists(args.baseline):
+        print('No baseline at {0}, run with --save-baseline to create one'.format(args.baseline))
+    else:
+        regressions = compareToBaseline(run, loadJson(args.baseline), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {Benchmark} at {Size}: {Baseline:.5f}s -> {Current:.5f}s ({Ratio:.2f}x)'.format(
+                **regression))
+        if regressions:
+            sys.exit(1)
+        print('No regressions against {0}'.format(args.baseline))
@@ -1,12 +1,16 @@
-from utils import stock_utils
+from utils import async_fetcher, universe, metrics
+from utils.bar_store import DAILY
 import pandas as pd
 import datetime
 
-def findPotentialDipAndRipTrades(stockData, saveToExcel=False, savePath='D:/The Fastlane Project/Coding Projects/Stock Analysis/results/stock_high_volume_data'):
+def findPotentialDipAndRipTrades(stockData, saveToExcel=False, savePath='D:/The Fastlane Project/Coding Projects/Stock Analysis/results/stock_high_volume_data',
+                                 sync=None):
     """
     Scan through list of stocks between 0 - 300 M Market Cap
     Find high volume trade days. Fetch and save.
     We apply Dip and Rip in separate function
+    :param stockData: Finviz stock list, the cached finviz_stocks_list universe is used when empty or None
+    :param sync: DataSync. When given only the days missing from its store are fetched and the rest read locally
     :return:
     """
     dateTimeStrStart = '2019-9-20 9:30'
@@ -17,15 +21,22 @@ def findPotentialDipAndRipTrades(stockData, saveToExcel=False, savePath='D:/The
             columns=['Ticker','Dates'])
 
 
-    df = stockData if not stockData.empty else stock_utils.getStockList()
-    df = df[df['Market Cap'] < 300000000]
+    stocks = universe.Universe(stockData) if stockData is not None and not stockData.empty else universe.loadUniverse()
+    tickers = stocks.tickers({'Market Cap': (None, 300000000)})
 
-    tickers = df['Ticker'].to_list()
+    print("Fetching data for {0} tickers".format(len(tickers)))
+    if sync is not None:
+        errors = sync.syncMany(tickers, dateTimeStart, dateTimeEnd)
+        fetched = {t: errors[t] if t in errors else sync.store.readBars(t, DAILY, dateTimeStart.date(), dateTimeEnd.date())
+                   for t in tickers}
+    else:
+        fetched = async_fetcher.fetchMany(tickers, dateTimeStart, dateTimeEnd)
 
     for t in tickers:
         try:
-            print("Fetching data for {0}".format(t))
-            tickerData = stock_utils.getYearlyDataTD(t,dateTimeStart, dateTimeEnd)
+            tickerData = fetched[t]
+            if isinstance(tickerData, Exception):
+                raise tickerData
             tickerData = tickerData[tickerData['Volume'] > 1000000]
             tickerData = tickerData.sort_values('Date')
 
@@ -51,5 +62,6 @@ def findPotentialDipAndRipTrades(stockData, saveToExcel=False, savePath='D:/The
 
 
 if __name__ == '__main__':
-    data = pd.read_excel('D:\The Fastlane Project\Coding Projects\Stock Analysis\stocks\stock_data_3.xlsx')
-    findPotentialDipAndRipTrades(data, True)
\ No newline at end of file
+    metrics.enable()
+    findPotentialDipAndRipTrades(None, True)
+    metrics.report('D:/The Fastlane Project/Coding Projects/Stock Analysis/results/metrics/import_stock_data.prom')
\ No newline at end of file
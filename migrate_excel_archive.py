@@ -0,0 +1,65 @@
+from utils.bar_store import BarStore, DAILY, MINUTE
+from strategies import readIntradayDataAV
+from os import listdir
+from os.path import join
+import pandas as pd
+import datetime
+
+STOCK_DATA_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/stock_data/'
+INTRADAY_DATA_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/intraday_data/'
+
+def migrateDailyData(store, rootPath=STOCK_DATA_PATH):
+    """
+    Move every {symbol}_Data.xlsx daily file into the bar store
+    :param store: BarStore to write into
+    :param rootPath: Folder of daily excel files
+    :return: List of (file, error) for files that could not be migrated
+    """
+    failed = []
+
+    for file in listdir(rootPath):
+        if not file.endswith('_Data.xlsx'):
+            continue
+        symbol = file[:-len('_Data.xlsx')]
+        try:
+            df = pd.read_excel(join(rootPath, file), index_col=0)
+            store.writeBars(symbol, df, DAILY)
+            print("Migrated {0}".format(file))
+        except Exception as e:
+            print("Something went wrong for {0}".format(file))
+            print(e)
+            failed.append((file, str(e)))
+
+    return failed
+
+def migrateIntradayData(store, rootPath=INTRADAY_DATA_PATH):
+    """
+    Move every {ticker}_{date}.xlsx intraday file into the bar store
+    :param store: BarStore to write into
+    :param rootPath: Folder of intraday excel files
+    :return: List of (file, error) for files that could not be migrated
+    """
+    failed = []
+
+    for file in listdir(rootPath):
+        if not file.endswith('.xlsx'):
+            continue
+        ticker, date = file[:-len('.xlsx')].split('_')[:2]
+        try:
+            date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+            df = readIntradayDataAV(pd.read_excel(join(rootPath, file)))
+            # Files can hold a whole month slice, only keep the day the file is named after
+            store.writeBars(ticker, df[df['Date'] == date], MINUTE)
+            print("Migrated {0}".format(file))
+        except Exception as e:
+            print("Something went wrong for {0}".format(file))
+            print(e)
+            failed.append((file, str(e)))
+
+    return failed
+
+
+if __name__ == '__main__':
+    barStore = BarStore()
+    failedFiles = migrateDailyData(barStore) + migrateIntradayData(barStore)
+    print("{0} files failed to migrate".format(len(failedFiles)))
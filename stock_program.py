@@ -1,6 +1,6 @@
 from pandas_datareader import data
 from pandas_datareader._utils import RemoteDataError
-from utils import math_calcs
+from utils import math_calcs, pivot_engine, trendline_engine
 import mplfinance as fplt
 import numpy as np
 
@@ -14,10 +14,10 @@ class Trendline():
         self.score = 0
 
     def calcTouchPoints(self):
-        touchPoint = 0
-        for p in self.pivots:
-            if abs(self.yIntercept + self.slope * p[2] - p[1]) < ((self.yIntercept + self.slope * p[2]) * self.marginOfError):
-                touchPoint += 1
+        touchPoint = int(trendline_engine.scoreLines([self.startPivot[2]], [self.startPivot[1]],
+                                                     [self.endPivot[2]], [self.endPivot[1]],
+                                                     [p[2] for p in self.pivots], [p[1] for p in self.pivots],
+                                                     self.marginOfError)[0])
 
         self.score = touchPoint
 
@@ -45,30 +45,13 @@ def getPivotPoints(df):
     Swing lows are reversals when the bars go from red to green
     Swing highs are reversals when bars go from green to red
     :param df: Stock Chart
-    :return:
+    :return: Support pivots and resistance pivots as (datetime, price, counter) tuples
     """
-    resistancePivots = []
-    supportPivots = []
-    prevBarIsGreen = df['Close'].iloc[0] > df['Open'].iloc[0]
-    prevClose = df['Close'].iloc[0]
-    prevOpen = df['Open'].iloc[0]
-    print(prevBarIsGreen)
-
-    for index, row in df.iloc[1:].iterrows():
-        if row['Close'] > row['Open'] and prevBarIsGreen == False:
-            num = prevClose if prevClose < row['Open'] else row['Open']
-            supportPivots.append((index.to_pydatetime(),num, row['Counter'])) # Note: You could have prev red candle as start of pivot (OR?)
-            prevBarIsGreen = True
-        elif row['Close'] < row['Open'] and prevBarIsGreen:
-            num = prevClose if prevClose > row['Open'] else row['Open']
-            resistancePivots.append((index.to_pydatetime(),num, row['Counter']))
-            prevBarIsGreen = False
-        prevClose = row['Close']
-        prevOpen = row['Open']
-
-    return supportPivots, resistancePivots
+    support, resistance = pivot_engine.getPivotArrays(df)
+    return pivot_engine.toPivotTuples(support), pivot_engine.toPivotTuples(resistance)
 
-def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False):
+def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False, mode='bruteforce',
+                      marginOfError=trendline_engine.MARGIN_OF_ERROR):
     """
     Sort the pivots by ascending or descending order
     Graph a line between the 2 points and check how many pivot points touch it
@@ -77,28 +60,12 @@ def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False):
     :param pivots:
     :param startTime:
     :param endTime:
+    :param mode: 'bruteforce' scores lines from the extreme pivot to every other pivot,
+                 'hull' only scores the edges of the lower (upper when reverse) convex hull of the pivots
+    :param marginOfError: Allowed distance from the line as a fraction of the line value
     :return:
     """
-    sortedPivots = sorted(pivots,key=lambda x:x[1],reverse=reverse)
-    p1 = sortedPivots[0]
-    prevDate = p1[0]
-    highScore = 0
-    pair = {}
-
-    for piv in sortedPivots[1:]:
-        if not (prevDate > piv[0]):
-            trendPoint = Trendline(p1, piv, sortedPivots).calcTouchPoints()
-            if highScore < trendPoint:
-                highScore = trendPoint
-                pair = {
-                        'Date1': p1[0], # .strftime("%Y-%m-%d"),
-                        'Pivot1': p1[1],
-                        'Date2': piv[0], # .strftime("%Y-%m-%d"),
-                        'Pivot2': piv[1]
-                    }
-                prevDate = pair['Date2']
-
-    return pair
+    return trendline_engine.trendLine(pivots, reverse, mode, marginOfError)
 
 if __name__ == '__main__':
     stock = 'AAPL'
@@ -1,40 +1,146 @@
 from pandas_datareader import data
 from pandas_datareader._utils import RemoteDataError
 from pandas.tseries.offsets import BDay
-from utils import stock_utils
+from utils import stock_utils, backtest_engine, intraday_parser, indicator_cache, metrics, sessions
+from utils.bar_store import MINUTE
 import pandas as pd
-from os import listdir
+from os import listdir, cpu_count
 from os.path import isfile, join
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 import datetime
+import time
 import mplfinance as fplt
 
-def backTestDipAndRip(rootPath='D:/The Fastlane Project/Coding Projects/Stock Analysis/results/intraday_data/'):
+def backTestDipAndRip(rootPath='D:/The Fastlane Project/Coding Projects/Stock Analysis/results/intraday_data/', store=None,
+                      workers=1, sink=None, shareCount=100, tickerDates=None):
     """
     Backtest Dip and Rip on all intraday charts
-    :return:
+    :param rootPath: Folder of {ticker}_{date}.xlsx intraday files
+    :param store: BarStore with minute bars. When given the excel folder is not read
+    :param workers: Number of processes. 1 runs in this process, None uses every core
+    :param sink: Object with write(record) such as CsvResultSink, called as each chart finishes.
+                 Results are not kept in memory when a sink is given
+    :param shareCount: Shares bought each trade
+    :param tickerDates: Only run these (ticker, date) pairs, e.g. VolumeIndex.tickerDates()
+    :return: All trades, or the per chart timing and error log when a sink is given
     """
-    intradayData = [f for f in listdir(rootPath)]
+    charts = listIntradayCharts(rootPath, store)
+    if tickerDates is not None:
+        wanted = {(ticker.upper(), pd.Timestamp(date).date()) for ticker, date in tickerDates}
+        charts = [chart for chart in charts if (chart[0].upper(), chart[1]) in wanted]
     dataList = list()
+    logList = list()
+
+    def collect(record, registry=None):
+        metrics.merge(registry)
+        result = record['Result']
+        metrics.observe(metrics.BACKTEST, record['Seconds'], record['Ticker'])
+        metrics.increment('backtest_errors' if record['Error'] else 'charts_tested', ticker=record['Ticker'])
+        if record['Error']:
+            print("Ticker: {0} {1}".format(record['Ticker'], record['Error']))
+        elif result is not None:
+            print("Ticker: {0}".format(record['Ticker']))
+            print(result.to_string())
+
+        if sink is not None:
+            sink.write(record)
+            logList.append({k: v for k, v in record.items() if k != 'Result'})
+        elif result is not None:
+            dataList.append(result)
+
+    if workers == 1:
+        for ticker, date, path in charts:
+            collect(backTestIntradayChart(ticker, date, path, store, shareCount))
+    else:
+        # Only a couple of charts per process are in flight, so finished results are not held until the pool exits
+        maxPending = 2 * (workers or cpu_count() or 1)
+        enabled = metrics.enabled()
+        pending = set()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for ticker, date, path in charts:
+                if len(pending) >= maxPending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(*future.result())
+                pending.add(executor.submit(metrics.workerTask, enabled, backTestIntradayChart, ticker, date, path,
+                                            store, shareCount))
+            for future in wait(pending).done:
+                collect(*future.result())
+
+    if sink is not None:
+        return pd.DataFrame(logList)
+
+    return pd.concat(dataList) if dataList else pd.DataFrame()
+
+
+def backTestIntradayChart(ticker, date, path=None, store=None, shareCount=100):
+    """
+    Load and backtest one ticker-day. Never raises so one bad file does not stop a batch
+    :param ticker: Ticker
+    :param date: Trade date
+    :param path: Excel file of the chart, read from the store when not given
+    :param store: BarStore with minute bars
+    :param shareCount: Shares bought each trade
+    :return: Dict with Ticker, Trade Date, File, Seconds, Error and the Result dataframe
+    """
+    start = time.perf_counter()
+    record = {'Ticker': ticker, 'Trade Date': date, 'File': path, 'Seconds': 0.0, 'Error': None, 'Result': None}
+
+    try:
+        df = loadIntradayChart(ticker, date, path, store)
+        result = DipAndRip(df, date, 10000000).backTest(shareCount=shareCount)
+        if result is not None:
+            result.insert(loc=0, column='Ticker', value=ticker)
+        record['Result'] = result
+    except Exception as e:
+        record['Error'] = '{0}: {1}'.format(type(e).__name__, e)
+
+    record['Seconds'] = time.perf_counter() - start
+    return record
+
 
-    for dataPath in intradayData:
+def listIntradayCharts(rootPath=None, store=None):
+    """
+    List every stored ticker-day of intraday data without loading it
+    :param rootPath: Folder of {ticker}_{date}.xlsx intraday files
+    :param store: BarStore with minute bars, preferred over the excel folder
+    :return: List of ticker, date, file path (None for store charts)
+    """
+    charts = []
+
+    if store is not None:
+        for ticker in store.tickers(MINUTE):
+            for partition in store.partitions(ticker, MINUTE):
+                charts.append((ticker, datetime.datetime.strptime(partition, '%Y-%m-%d').date(), None))
+        return charts
+
+    for dataPath in listdir(rootPath):
         file = dataPath.split('/')[-1]
         ticker = file.split('_')[0]
         date = file.split('_')[1]
         date = datetime.datetime.strptime(date.split('.')[0], '%Y-%m-%d').date()
+        charts.append((ticker, date, join(rootPath, dataPath)))
+
+    return charts
+
 
-        df = pd.read_excel(join(rootPath, dataPath))
-        df = readIntradayDataAV(df)
+def loadIntradayChart(ticker, date, path=None, store=None):
+    with metrics.timer(metrics.PARSE, ticker):
+        if path is None:
+            return store.readDay(ticker, date)
+        return readIntradayDataAV(pd.read_excel(path))
 
-        dipRip = DipAndRip(df, date, 10000000)
-        try:
-            print("Ticker: {0}".format(ticker))
-            dataList.append(dipRip.backTest(shareCount=100))
-            print(dipRip.backTest(shareCount=100).to_string())
-        except Exception as e:
-            print(e)
 
-    return pd.concat(dataList)
+def iterIntradayCharts(rootPath=None, store=None):
+    """
+    Yield every stored ticker-day of intraday data
+    :param rootPath: Folder of {ticker}_{date}.xlsx intraday files
+    :param store: BarStore with minute bars, preferred over the excel folder
+    :return: Generator of ticker, date, intraday dataframe
+    """
+    for ticker, date, path in listIntradayCharts(rootPath, store):
+        yield ticker, date, loadIntradayChart(ticker, date, path, store)
 
 
 def readIntradayDataAV(df):
@@ -42,22 +148,7 @@ def readIntradayDataAV(df):
     Read and convert AV intraday data
     :return:
     """
-    df['Datetime'] = pd.to_datetime(df['Time'])
-
-    df['Date'] = pd.to_datetime(df['Datetime']).dt.date
-    df['Time'] = pd.to_datetime(df['Datetime']).dt.time
-
-    typeMap = {
-        'Open': float,
-        'High': float,
-        'Low': float,
-        'Close': float,
-        'Volume': int,
-    }
-
-    df = df.astype(typeMap)
-
-    return df
+    return intraday_parser.readIntradayFrame(df)
 
 class MATrading:
     """
@@ -65,16 +156,20 @@ class MATrading:
     The key is to trade or enter when the stock is near but not breaking down
     past the 50 MA level
     """
-    def __init__(self, ticker, startDate, endDate, ma=50):
+    def __init__(self, ticker, startDate, endDate, ma=50, sync=None, cache=None):
         self.ticker = ticker
         self.ma = ma
         self.startDate = startDate
         self.endDate = endDate
         self.marginOfError = 0.05
         self.datesCloseToMa = []
+        self.sync = sync
+        self.cache = cache
 
     def generateStockDate(self):
         start = self.startDate - BDay(self.ma)
+        if self.sync is not None:
+            return self.sync.dailyChart(self.ticker, start, self.endDate)
         start = start.strftime('%Y-%m-%d')
         end = self.endDate.strftime('%Y-%m-%d')
 
@@ -82,7 +177,11 @@ class MATrading:
 
     def generateMAData(self,stockData=None):
         df = stockData if stockData else self.generateStockDate()
-        df['MA'] = df.rolling(window=self.ma)['Close'].mean()
+        with metrics.timer(metrics.INDICATOR, self.ticker):
+            if self.cache is not None:
+                df['MA'] = self.cache.rollingMean(self.ticker, df['Close'], self.ma)
+            else:
+                df['MA'] = df.rolling(window=self.ma)['Close'].mean()
         df['Date'] = df.index.date
         return df
 
@@ -138,16 +237,20 @@ class MACrossoverTrading:
         self.lookback = self.ma2 if self.ma2 > self.ma1 else self.ma1
 
 class EMACrossoverTrading:
-    def __init__(self, ticker, startDate, endDate, ema1=5, ema2=20):
+    def __init__(self, ticker, startDate, endDate, ema1=5, ema2=20, sync=None, cache=None):
         self.ticker = ticker
         self.ema1 = ema1
         self.ema2 = ema2
         self.startDate = startDate
         self.endDate = endDate
         self.lookback = self.ema2 if self.ema2 > self.ema1 else self.ema1
+        self.sync = sync
+        self.cache = cache
 
     def generateStockData(self):
         start = self.startDate - BDay(self.lookback)
+        if self.sync is not None:
+            return self.sync.dailyChart(self.ticker, start, self.endDate)
         start = start.strftime('%Y-%m-%d')
         end = self.endDate.strftime('%Y-%m-%d')
 
@@ -157,8 +260,14 @@ class EMACrossoverTrading:
         df = stockData if not stockData.empty else self.generateStockData()
         ema1 = 'EMA_{0}'.format(self.ema1)
         ema2 = 'EMA_{0}'.format(self.ema2)
-        df[ema1] = df['Close'].ewm(span=self.ema1).mean()
-        df[ema2] = df['Close'].ewm(span=self.ema2).mean()
+        with metrics.timer(metrics.INDICATOR, self.ticker):
+            if self.cache is not None:
+                version = indicator_cache.dataVersion(df['Close'])
+                df[ema1] = self.cache.ewmMean(self.ticker, df['Close'], self.ema1, version)
+                df[ema2] = self.cache.ewmMean(self.ticker, df['Close'], self.ema2, version)
+            else:
+                df[ema1] = df['Close'].ewm(span=self.ema1).mean()
+                df[ema2] = df['Close'].ewm(span=self.ema2).mean()
         df['Is Positive'] = df[ema1].ge(df[ema2])
         return df[[ema1,ema2,'Is Positive']]
 
@@ -167,67 +276,51 @@ class EMACrossoverTrading:
         Back test this strategy against this stock and generate df of number of success failures and profit and losses
         :return: df
         """
-        backTestData = pd.DataFrame(columns=['Start Date', 'End Date', 'Entry Price', 'Shares Bought', 'Exit Price', 'PnL', 'Win or Loss'])
-
-        enterPrice = 0
-        enterDate = datetime.date.today()
-        sharesBought = 0
-
-        prevIsNegative = df['EMA_{0}'.format(self.ema1)].iloc[0] < df['EMA_{0}'.format(self.ema2)].iloc[0]
-
-        for index, row in df.iloc[1:].iterrows():
-            isCrossedOverPositive = prevIsNegative and (row['EMA_{0}'.format(self.ema1)] > row['EMA_{0}'.format(self.ema2)])
-            isCrossedOverNegative = not prevIsNegative and (
-                row['EMA_{0}'.format(self.ema1)] < row['EMA_{0}'.format(self.ema2)])
-
-            if isCrossedOverPositive:
-                enterPrice = row['Open']
-                enterDate = index.to_pydatetime()
-                sharesBought = shareCount if shareCount else moneySpent//enterPrice
-                prevIsNegative = False
-
-            if isCrossedOverNegative:
-                exitPrice = row['Close']
-                exitDate = index.to_pydatetime()
-                backTestData = backTestData.append(
-                    {'Start Date':enterDate,
-                     'End Date': exitDate,
-                     'Entry Price': enterPrice,
-                     'Exit Price': exitPrice,
-                     'Shares Bought': sharesBought,
-                     'PnL': (exitPrice - enterPrice) * sharesBought,
-                     'Win or Loss': 'Win' if exitPrice - enterPrice > 0 else 'Loss'}, ignore_index=True)
-
-                prevIsNegative = True
-
-        backTestData = backTestData.set_index('Start Date')
-
-        return backTestData.iloc[1:]
+        return backtest_engine.crossoverLedger(df.index, df['Open'].to_numpy(), df['Close'].to_numpy(),
+                                               df['EMA_{0}'.format(self.ema1)].to_numpy(),
+                                               df['EMA_{0}'.format(self.ema2)].to_numpy(),
+                                               moneySpent, shareCount)
 
 class DailyChartBase:
 
     def __init__(self, data, tradeDate, dayVolume):
-        self.premarket, self.regularMarket, self.afterHourMarket = stock_utils.splitCandles(data)
+        self.sessions = sessions.SessionIndex(data)
+        self.premarket, self.regularMarket, self.afterHourMarket = self.sessions.split()
         self.tradeDate = tradeDate
         self.dayVolume = dayVolume
+        self.stats = None
+
+    def getStats(self):
+        """
+        Premarket and regular market stats, computed on first use in one pass over the day
+        """
+        if self.stats is None:
+            self.stats = self.sessions.stats()
+        return self.stats
+
+    def getPremarketStat(self, name):
+        value = self.getStats()[name]
+        if value is None:
+            raise IndexError('No premarket candles on {0}'.format(self.tradeDate))
+        return value
 
     def getPremarketHigh(self):
-        return self.premarket.sort_values(by=['High'], ascending=False).iloc[0]['High']
+        return self.getPremarketStat('Premarket High')
 
     def getPremarketVolume(self):
-        return self.premarket['Volume'].sum()
+        return self.getStats()['Premarket Volume']
 
     def getRegularVolume(self):
-        return self.regularMarket['Volume'].sum()
+        return self.getStats()['Regular Volume']
 
     def getPremarketHighTime(self):
-        return self.premarket.sort_values(by=['High'], ascending=False).iloc[0]['Time']
+        return self.getPremarketStat('Premarket High Time')
 
     def getPremarketLow(self):
-        return self.premarket.sort_values(by=['Low'], ascending=True).iloc[0]['Low']
+        return self.getPremarketStat('Premarket Low')
 
     def getPremarketLowTime(self):
-        return self.premarket.sort_values(by=['Low'], ascending=True).iloc[0]['Time']
+        return self.getPremarketStat('Premarket Low Time')
 
 class DipAndRip(DailyChartBase):
     """
@@ -246,75 +339,194 @@ class DipAndRip(DailyChartBase):
         Test Dip and Rip Strategy
         :param moneySpent:
         :param shareCount:
-        :return:
+        :return: One row dataframe of the trade, None if the day never reached an exit
+        """
+        if self.premarket.empty or self.regularMarket.empty:
+            raise IndexError('No premarket or regular market candles on {0}'.format(self.tradeDate))
+
+        start, _, closeAt, _ = self.sessions.bounds
+        day = self.sessions.rows(start, closeAt)
+        seconds = backtest_engine.secondsOfDay(day)
+        order = np.argsort(seconds, kind='stable')
+
+        trades = backtest_engine.dipAndRipTrades(np.zeros(len(day), dtype=np.int64), seconds[order],
+                                                 np.asarray(day['High'])[order], np.asarray(day['Low'])[order],
+                                                 np.asarray(day['Volume'])[order], self.exitTime,
+                                                 moneySpent, shareCount)
+        if not len(trades['Group']):
+            return None
+
+        return backtest_engine.dipAndRipFrame(trades, [self.tradeDate])
+
+
+class DipAndRipState:
+    """
+    Where one ticker is in its Dip and Rip day
+    """
+    __slots__ = ['date', 'premarketHigh', 'premarketHighSeconds', 'premarketVolume', 'stopLevel', 'runningHigh',
+                 'highSeconds', 'entered', 'entrySeconds', 'entryPrice', 'done']
+
+    def __init__(self, date):
+        self.date = date
+        self.premarketHigh = -np.inf
+        self.premarketHighSeconds = 0
+        self.premarketVolume = 0
+        self.stopLevel = None
+        self.runningHigh = None
+        self.highSeconds = 0
+        self.entered = False
+        self.entrySeconds = 0
+        self.entryPrice = 0.0
+        self.done = False
+
+
+class DipAndRipScanner:
+    """
+    Dip and Rip run live: every bar moves its ticker through premarket high -> opening dip -> reclaim -> stop or exit
+    and raises an alert when the ticker reclaims the premarket high, gets stopped out or reaches the exit time
+    Same rules as DipAndRip.backTest, so the trades it closes match the backtest of the same days
+    Feed it from a ReplayEngine, with storeSources for local files or a StubBarFeed for testing
+    """
+    def __init__(self, exitTime=datetime.time(11, 0), moneySpent=0, shareCount=100, onAlert=None):
+        """
+        :param exitTime: Time the trade is closed if the stop was not hit
+        :param moneySpent: Money put in each trade when shareCount is not given
+        :param shareCount: Shares bought each trade
+        :param onAlert: Function called with every alert dict as it is raised
+        """
+        self.exitSeconds = exitTime.hour * 3600 + exitTime.minute * 60 + exitTime.second
+        self.moneySpent = moneySpent
+        self.shareCount = shareCount
+        self.onAlert = onAlert
+        self.states = {}
+        self.alerts = []
+        self.trades = []
+        self.latencies = []
+
+    def onBar(self, bar):
+        start = time.perf_counter_ns()
+        self.processBar(bar)
+        self.latencies.append(time.perf_counter_ns() - start)
+
+    def processBar(self, bar):
+        stamp = bar.Datetime
+        seconds = stamp.hour * 3600 + stamp.minute * 60 + stamp.second
+        state = self.states.get(bar.Ticker)
+        if state is None or state.date != stamp.date():
+            state = self.states[bar.Ticker] = DipAndRipState(stamp.date())
+
+        if state.done:
+            return
+
+        if seconds < backtest_engine.MARKET_OPEN:
+            if bar.High > state.premarketHigh:
+                state.premarketHigh = bar.High
+                state.premarketHighSeconds = seconds
+            state.premarketVolume += bar.Volume
+            return
+
+        if seconds >= backtest_engine.MARKET_CLOSE:
+            return
+
+        if state.premarketHigh == -np.inf:
+            # No premarket, nothing to reclaim
+            state.done = True
+            return
+
+        if state.stopLevel is None:
+            state.stopLevel = bar.Low
+            state.runningHigh = state.premarketHigh
+            state.highSeconds = state.premarketHighSeconds
+
+        stopLevel = state.stopLevel
+        stopHit = bar.Low < stopLevel
+
+        if not state.entered and bar.High > state.premarketHigh:
+            state.entered = True
+            state.entrySeconds = seconds
+            state.entryPrice = bar.High
+            self.alert(bar, 'Reclaim', bar.High, min(stopLevel, bar.Low))
+
+        if bar.High > state.runningHigh:
+            state.runningHigh = bar.High
+            state.highSeconds = seconds
+
+        if (stopHit and state.entered) or (not stopHit and seconds > self.exitSeconds):
+            self.closeTrade(bar, state, seconds, stopHit, stopLevel)
+        else:
+            state.stopLevel = min(stopLevel, bar.Low)
+
+    def closeTrade(self, bar, state, seconds, stopHit, stopLevel):
+        state.done = True
+        entryPrice = state.entryPrice if state.entered else 0.0
+        if not state.entered:
+            sharesBought = 0.0
+        elif self.shareCount:
+            sharesBought = float(self.shareCount)
+        else:
+            sharesBought = self.moneySpent // entryPrice
+        defaultEntry = backtest_engine.DEFAULT_ENTRY_TIME
+
+        self.trades.append({
+            'Ticker': bar.Ticker,
+            'Trade Date': state.date,
+            'Start Seconds': state.entrySeconds if state.entered else defaultEntry.hour * 3600 + defaultEntry.minute * 60,
+            'End Seconds': seconds if stopHit else self.exitSeconds,
+            'Entry Price': entryPrice,
+            'Shares Bought': sharesBought,
+            'High Price': state.runningHigh,
+            'High Seconds': state.highSeconds,
+            'Premarket Volume': state.premarketVolume,
+            'Stop Loss': stopLevel,
+            'Max Profit': (state.runningHigh - entryPrice) * sharesBought,
+            'Max Loss': (stopLevel - entryPrice) * sharesBought,
+        })
+        self.alert(bar, 'Stop' if stopHit else 'Exit', stopLevel if stopHit else bar.Close)
+
+    def alert(self, bar, kind, price, dipLow=None):
+        alert = {'Datetime': bar.Datetime, 'Ticker': bar.Ticker, 'Alert': kind, 'Price': price, 'Dip Low': dipLow}
+        self.alerts.append(alert)
+        if self.onAlert is not None:
+            self.onAlert(alert)
+
+    def tradeFrame(self):
         """
-        backTestData = pd.DataFrame(
-            columns=['Trade Date', 'Start Time', 'End Time', 'Entry Price', 'Shares Bought', 'High Price', 'High Price Time'])
-
-        enterPrice = 0
-        enterTime = datetime.time(7,0)
-
-        sharesBought = 0
-        lowStopPrice = self.regularMarket.iloc[0]['Low']# Low Stop Level
-        highOfPattern = self.getPremarketHigh()
-        highTime = self.getPremarketHighTime()
-        tradeEntered = False
-
-        for index, row in self.regularMarket.iterrows():
-            if row['High'] > highOfPattern:
-                if not tradeEntered:
-                    tradeEntered = True
-                    enterTime = row['Time']
-                    enterPrice = row['High']
-                    sharesBought = shareCount if shareCount else moneySpent // enterPrice
-                highOfPattern = row['High']
-                highTime = row['Time']
-
-            if row['Low'] <  lowStopPrice:
-                if tradeEntered:
-                    # Exit Trade
-                    self.exitTime = row['Time']
-                    backTestData = backTestData.append(
-                        {
-                            'Trade Date': self.tradeDate,
-                            'Start Time': enterTime,
-                            'End Time': self.exitTime,
-                            'Entry Price': enterPrice,
-                            'Premarket Volume': self.getPremarketVolume(),
-                            'Shares Bought': sharesBought,
-                            'Stop Loss': lowStopPrice,
-                            'High Price': highOfPattern,
-                            'High Price Time': highTime,
-                            'Time To Reach High Price': datetime.datetime.combine(self.tradeDate, highTime) - datetime.datetime.combine(self.tradeDate, enterTime),
-                            'Max Profit': (highOfPattern - enterPrice) * sharesBought,
-                            'Max Loss': (lowStopPrice - enterPrice) * sharesBought,
-                            'Time Elapsed Till Exit': datetime.datetime.combine(self.tradeDate, self.exitTime) - datetime.datetime.combine(self.tradeDate, enterTime)
-                        }, ignore_index=True
-                    )
-                    return backTestData
-
-                lowStopPrice = row['Low']
-
-            elif row['Time'] > self.exitTime:
-                backTestData = backTestData.append(
-                    {
-                            'Trade Date': self.tradeDate,
-                            'Start Time': enterTime,
-                            'End Time': self.exitTime,
-                            'Entry Price': enterPrice,
-                            'Premarket Volume': self.getPremarketVolume(),
-                            'Shares Bought': sharesBought,
-                            'Stop Loss': lowStopPrice,
-                            'High Price': highOfPattern,
-                            'High Price Time': highTime,
-                            'Time To Reach High Price': datetime.datetime.combine(self.tradeDate, highTime) - datetime.datetime.combine(self.tradeDate, enterTime),
-                            'Max Profit': (highOfPattern - enterPrice) * sharesBought,
-                            'Max Loss': (lowStopPrice - enterPrice) * sharesBought,
-                            'Time Elapsed Till Exit': datetime.datetime.combine(self.tradeDate, self.exitTime) - datetime.datetime.combine(self.tradeDate, enterTime)
-                    }, ignore_index=True
-                )
-                return backTestData
+        Closed trades in the DipAndRip.backTest layout with a Ticker column
+        """
+        if not self.trades:
+            return pd.DataFrame(columns=['Ticker'] + backtest_engine.DIP_AND_RIP_COLUMNS)
+
+        trades = {key: np.array([trade[key] for trade in self.trades]) for key in self.trades[0]}
+        result = backtest_engine.dipAndRipFrame(trades, trades['Trade Date'])
+        result.insert(loc=0, column='Ticker', value=trades['Ticker'])
+        return result
 
+    def latencyStats(self):
+        """
+        :return: Dict of per bar processing latency percentiles in microseconds
+        """
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies) / 1000.0
+        return {
+            'Bars': len(latencies),
+            'Latency p50 us': float(np.percentile(latencies, 50)),
+            'Latency p90 us': float(np.percentile(latencies, 90)),
+            'Latency p99 us': float(np.percentile(latencies, 99)),
+            'Latency max us': float(latencies.max()),
+        }
+
+    def run(self, engine, speed=None):
+        """
+        Scan every bar of a replay engine
+        :param engine: ReplayEngine
+        :param speed: None for max speed, otherwise the replay speed multiplier
+        :return: Replay stats with the latency percentiles
+        """
+        engine.subscribe(self)
+        stats = engine.run(speed)
+        stats.update(self.latencyStats())
+        return stats
 
 
 if __name__ == '__main__':
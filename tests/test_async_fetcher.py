@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from aiohttp import web
+
+from utils import async_fetcher, stock_utils, metrics
+from utils.bar_store import BarStore, DAILY
+from utils.response_cache import ResponseCache, ALPHA_VANTAGE, TD
+
+START = datetime.datetime(2021, 2, 1)
+END = datetime.datetime(2021, 2, 6)
+
+
+class StubServer:
+    """
+    Local stand in for the TD price history endpoint
+    :param failures: Dict of symbol to the (status, headers) responses sent before it succeeds
+    """
+    def __init__(self, failures=None):
+        self.failures = {symbol: list(responses) for symbol, responses in (failures or {}).items()}
+        self.hits = {}
+        self.times = []
+        self.slices = []
+        self.runner = None
+        self.url = None
+
+    async def priceHistory(self, request):
+        symbol = request.match_info['symbol']
+        self.hits[symbol] = self.hits.get(symbol, 0) + 1
+        self.times.append(time.perf_counter())
+
+        if self.failures.get(symbol):
+            status, headers = self.failures[symbol].pop(0)
+            return web.Response(status=status, headers=headers)
+        if symbol == 'MISSING':
+            return web.Response(status=404)
+
+        first = int(datetime.datetime(2021, 2, 1, 20, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+        return web.json_response({'symbol': symbol, 'candles': [
+            {'open': 1.0 + i, 'high': 2.0 + i, 'low': 0.5 + i, 'close': 1.5 + i, 'volume': 1000 * (i + 1),
+             'datetime': first + i * 86400000} for i in range(5)]})
+
+    async def intraday(self, request):
+        symbol = request.query['symbol']
+        self.hits[symbol] = self.hits.get(symbol, 0) + 1
+        self.slices.append(request.query['slice'])
+        return web.Response(body=b'time,open,high,low,close,volume\r\n'
+                                 b'2021-02-01 04:01:00,1.5,2.5,1.0,2.0,200\r\n'
+                                 b'2021-02-01 04:00:00,1.0,2.0,0.5,1.5,100\r\n', content_type='text/csv')
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/{symbol}/pricehistory', self.priceHistory)
+        app.router.add_get('/query', self.intraday)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        self.url = 'http://127.0.0.1:{0}'.format(self.runner.addresses[0][1])
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+def fetch(tickers, failures=None, store=None, cache=None, provider=TD, **settings):
+    async def run():
+        async with StubServer(failures) as server:
+            fetcher = async_fetcher.AsyncMarketDataFetcher(provider, baseUrl=server.url, **settings)
+            started = time.perf_counter()
+            results = await fetcher.fetchManyAsync(tickers, START, END, DAILY, store, cache)
+            return results, server, fetcher, time.perf_counter() - started
+
+    return asyncio.run(run())
+
+
+def testRetriesServerErrors():
+    results, server, fetcher, _ = fetch(['FLAKY', 'MISSING'], {'FLAKY': [(503, {}), (500, {})]}, backoff=0.01)
+
+    assert len(results['FLAKY']) == 5
+    assert server.hits['FLAKY'] == 3
+    assert fetcher.retried == 2
+    assert isinstance(results['MISSING'], Exception)
+    assert server.hits['MISSING'] == 1
+
+
+def testGivesUpAfterRetries():
+    results, server, _, _ = fetch(['DOWN'], {'DOWN': [(502, {})] * 5}, retries=2, backoff=0.01)
+
+    assert isinstance(results['DOWN'], async_fetcher.RetryableError)
+    assert server.hits['DOWN'] == 3
+
+
+def testHonorsRetryAfter():
+    # The backoff alone would wait at least 10 seconds
+    results, server, _, elapsed = fetch(['LIMITED'], {'LIMITED': [(429, {'Retry-After': '0.3'})]}, backoff=10)
+
+    assert len(results['LIMITED']) == 5
+    assert server.hits['LIMITED'] == 2
+    assert 0.3 <= server.times[1] - server.times[0] < 2
+    assert elapsed < 2
+
+
+def testRetryAfterValues():
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+
+    assert async_fetcher.retryAfterSeconds('2') == 2.0
+    assert 25 < async_fetcher.retryAfterSeconds(later.strftime('%a, %d %b %Y %H:%M:%S GMT')) <= 30
+    assert async_fetcher.retryAfterSeconds('soon') is None
+    assert async_fetcher.retryAfterSeconds(None) is None
+
+
+def testTokenBucketLimitsRate():
+    tickers = ['T{0}'.format(i) for i in range(10)]
+    results, server, _, _ = fetch(tickers, rate=20, burst=2, concurrency=10)
+
+    assert all(len(results[t]) == 5 for t in tickers)
+    # Two requests go out at once, the other eight wait for a token each
+    assert server.times[-1] - server.times[0] >= 8 / 20 * 0.9
+
+
+def testQueueTimeKeptOutOfFetch(monkeypatch):
+    monkeypatch.setattr(metrics, 'REGISTRY', metrics.MetricsRegistry(enabled=True))
+    tickers = ['T{0}'.format(i) for i in range(10)]
+    fetch(tickers, rate=20, burst=1, concurrency=10)
+
+    queue = metrics.REGISTRY.histograms[(metrics.QUEUE, None)]
+    fetched = metrics.REGISTRY.histograms[(metrics.FETCH, None)]
+    assert queue.count == fetched.count == 10
+    assert fetched.count == sum(metrics.REGISTRY.histograms[(metrics.FETCH, t)].count for t in tickers)
+    # Request i waits about i / 20 seconds for a token, the stub answers far faster
+    assert queue.sum >= sum(i / 20 for i in range(10)) * 0.9
+    assert fetched.sum < queue.sum / 2
+
+
+def testCacheAndStore(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    store = BarStore(str(tmp_path / 'bars'))
+
+    first, server, _, _ = fetch(['AAA', 'BBB'], cache=cache, store=store)
+    assert server.hits == {'AAA': 1, 'BBB': 1}
+    assert sorted(store.tickers(DAILY)) == ['AAA', 'BBB']
+
+    second, server, _, _ = fetch(['AAA', 'BBB'], cache=cache)
+    assert server.hits == {}
+    assert cache.stats()['Hits'] == 2
+    assert second['AAA'][['Open', 'Close', 'Volume']].equals(first['AAA'][['Open', 'Close', 'Volume']])
+
+
+def testAlphaVantageCache(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+
+    first, server, _, _ = fetch(['AAA'], cache=cache, provider=ALPHA_VANTAGE)
+    assert server.slices == [stock_utils.intradaySliceAV(START)]
+    assert first['AAA']['Volume'].tolist() == [100, 200]
+
+    _, server, _, _ = fetch(['AAA'], cache=cache, provider=ALPHA_VANTAGE)
+    assert server.hits == {}
+    assert cache.stats()['Entries'] == 1
+
+
+def testFetchManyInsideRunningLoop():
+    async def run():
+        return async_fetcher.fetchMany(['AAA'], START, END)
+
+    with pytest.raises(RuntimeError, match='fetchManyAsync'):
+        asyncio.run(run())
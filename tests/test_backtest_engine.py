@@ -0,0 +1,160 @@
+import datetime
+
+import numpy as np
+import pandas
+import pytest
+
+from utils import backtest_engine, synthetic_data
+
+
+def dipAndRipLoop(premarket, regularMarket, exitTime, moneySpent=0, shareCount=0):
+    """
+    Row by row DipAndRip.backTest loop dipAndRipTrades replaced, returning the trade as a dict
+    """
+    enterPrice = 0
+    enterTime = datetime.time(7, 0)
+    sharesBought = 0
+    lowStopPrice = regularMarket.iloc[0]['Low']
+    highOfPattern = premarket['High'].max()
+    highTime = premarket['Time'].iloc[int(premarket['High'].to_numpy().argmax())]
+    tradeEntered = False
+
+    def trade(endTime):
+        return {'Start Time': enterTime, 'End Time': endTime, 'Entry Price': enterPrice,
+                'Shares Bought': sharesBought, 'High Price': highOfPattern, 'High Price Time': highTime,
+                'Premarket Volume': premarket['Volume'].sum(), 'Stop Loss': lowStopPrice,
+                'Max Profit': (highOfPattern - enterPrice) * sharesBought,
+                'Max Loss': (lowStopPrice - enterPrice) * sharesBought}
+
+    for index, row in regularMarket.iterrows():
+        if row['High'] > highOfPattern:
+            if not tradeEntered:
+                tradeEntered = True
+                enterTime = row['Time']
+                enterPrice = row['High']
+                sharesBought = shareCount if shareCount else moneySpent // enterPrice
+            highOfPattern = row['High']
+            highTime = row['Time']
+
+        if row['Low'] < lowStopPrice:
+            if tradeEntered:
+                return trade(row['Time'])
+            lowStopPrice = row['Low']
+        elif row['Time'] > exitTime:
+            return trade(exitTime)
+
+    return None
+
+
+def crossoverLoop(df, fast, slow, moneySpent=0, shareCount=0):
+    """
+    Row by row EMACrossoverTrading.backTest loop crossoverLedger replaced, appending a dict per exit
+    """
+    rows = []
+    enterPrice = 0
+    enterDate = datetime.date.today()
+    sharesBought = 0
+
+    prevIsNegative = df[fast].iloc[0] < df[slow].iloc[0]
+
+    for index, row in df.iloc[1:].iterrows():
+        isCrossedOverPositive = prevIsNegative and (row[fast] > row[slow])
+        isCrossedOverNegative = not prevIsNegative and (row[fast] < row[slow])
+
+        if isCrossedOverPositive:
+            enterPrice = row['Open']
+            enterDate = index.to_pydatetime()
+            sharesBought = shareCount if shareCount else moneySpent // enterPrice
+            prevIsNegative = False
+
+        if isCrossedOverNegative:
+            exitPrice = row['Close']
+            rows.append({'Start Date': enterDate, 'End Date': index.to_pydatetime(), 'Entry Price': enterPrice,
+                         'Shares Bought': sharesBought, 'Exit Price': exitPrice,
+                         'PnL': (exitPrice - enterPrice) * sharesBought,
+                         'Win or Loss': 'Win' if exitPrice - enterPrice > 0 else 'Loss'})
+            prevIsNegative = True
+
+    return pandas.DataFrame(rows, columns=backtest_engine.LEDGER_COLUMNS).set_index('Start Date').iloc[1:]
+
+
+@pytest.mark.parametrize('seed', range(40))
+def testCrossoverLedgerMatchesLoop(seed):
+    df = synthetic_data.dailyBars(300 + seed * 10, seed=seed)
+    if seed % 2:
+        df['Fast'] = df['Close'].ewm(span=5).mean()
+        df['Slow'] = df['Close'].ewm(span=20).mean()
+    else:
+        # Rolling means start with NaN warm-up rows, which never cross
+        df['Fast'] = df['Close'].rolling(window=5).mean()
+        df['Slow'] = df['Close'].rolling(window=20).mean()
+    sizing = {'shareCount': 100} if seed % 4 < 2 else {'moneySpent': 10000}
+
+    expected = crossoverLoop(df, 'Fast', 'Slow', **sizing)
+    ledger = backtest_engine.crossoverLedger(df.index, df['Open'].to_numpy(), df['Close'].to_numpy(),
+                                             df['Fast'].to_numpy(), df['Slow'].to_numpy(), **sizing)
+
+    assert len(expected) > 0
+    assert ledger.index.tolist() == expected.index.tolist()
+    assert ledger['End Date'].tolist() == expected['End Date'].tolist()
+    assert ledger['Win or Loss'].tolist() == expected['Win or Loss'].tolist()
+    for column in ['Entry Price', 'Shares Bought', 'Exit Price', 'PnL']:
+        assert np.array_equal(ledger[column].to_numpy(dtype=np.float64), expected[column].to_numpy(dtype=np.float64))
+
+
+def minuteDay(date, seed):
+    rng = np.random.default_rng(seed)
+    stamps = pandas.date_range(pandas.Timestamp(date) + pandas.Timedelta(hours=4),
+                               pandas.Timestamp(date) + pandas.Timedelta(hours=19, minutes=59), freq='min')
+    size = len(stamps)
+    closes = 10 + np.cumsum(rng.normal(rng.choice([0, 0.002, -0.001]), 0.03, size))
+    opens = np.r_[closes[0], closes[:-1]]
+    df = pandas.DataFrame({'Datetime': stamps, 'Open': np.round(opens, 2),
+                           'High': np.round(np.maximum(opens, closes) + rng.uniform(0, 0.03, size), 2),
+                           'Low': np.round(np.minimum(opens, closes) - rng.uniform(0, 0.03, size), 2),
+                           'Close': np.round(closes, 2), 'Volume': rng.integers(100, 10000, size)})
+    df['Time'] = df['Datetime'].dt.time
+    return df
+
+
+@pytest.mark.parametrize('seed', range(60))
+def testTradesMatchLoop(seed):
+    date = datetime.date(2021, 1, 4) + datetime.timedelta(days=seed % 20)
+    df = minuteDay(date, seed)
+    exitTime = [datetime.time(10, 0), datetime.time(11, 0), datetime.time(15, 0)][seed % 3]
+    sizing = {'shareCount': 100} if seed % 2 else {'moneySpent': 5000}
+
+    seconds = backtest_engine.secondsOfDay(df)
+    premarket = df[seconds < backtest_engine.MARKET_OPEN]
+    regular = df[(seconds >= backtest_engine.MARKET_OPEN) & (seconds < backtest_engine.MARKET_CLOSE)]
+    expected = dipAndRipLoop(premarket, regular, exitTime, **sizing)
+
+    trades = backtest_engine.dipAndRipTrades(np.zeros(len(df), dtype=np.int64), seconds, df['High'], df['Low'],
+                                             df['Volume'], exitTime, **sizing)
+    if expected is None:
+        assert not len(trades['Group'])
+        return
+
+    result = backtest_engine.dipAndRipFrame(trades, [date]).iloc[0]
+    for column, value in expected.items():
+        assert result[column] == pytest.approx(value) if isinstance(value, float) else result[column] == value
+
+
+def testBatchMatchesSingleDays():
+    days = []
+    for seed in range(20):
+        df = minuteDay(datetime.date(2021, 1, 4) + datetime.timedelta(days=seed % 5), seed)
+        df['Ticker'] = 'T{0}'.format(seed % 4)
+        days.append(df)
+
+    batch = backtest_engine.dipAndRipBatch(pandas.concat(days).sample(frac=1, random_state=0), shareCount=100)
+
+    for df in days:
+        trades = backtest_engine.dipAndRipTrades(np.zeros(len(df), dtype=np.int64), backtest_engine.secondsOfDay(df),
+                                                 df['High'], df['Low'], df['Volume'], shareCount=100)
+        row = batch[(batch['Ticker'] == df['Ticker'].iloc[0]) &
+                    (batch['Trade Date'] == df['Datetime'].iloc[0].date())]
+        assert len(row) == len(trades['Group'])
+        if len(row):
+            single = backtest_engine.dipAndRipFrame(trades, [df['Datetime'].iloc[0].date()])
+            assert row.drop(columns='Ticker').reset_index(drop=True).equals(single)
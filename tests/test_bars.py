@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from benchmark_suite import barsMemory
+from utils import synthetic_data
+from utils.bars import Bars, PRICE_FIELDS
+
+
+def prices(*dtypes):
+    return [np.arange(1, 6).astype(dtype) for dtype in dtypes]
+
+
+@pytest.mark.parametrize('dtypes, expected', [
+    ((np.float32, np.int64, np.float32, np.float32), np.float64),
+    ((np.float32, np.float32, np.float32, np.float32), np.float32),
+    ((np.float32, np.float64, np.float32, np.float32), np.float64),
+    ((np.int64, np.int64, np.int64, np.int64), np.float64),
+])
+def testPriceTypeResolvedOnce(dtypes, expected):
+    bars = Bars(np.arange(5), *prices(*dtypes), np.arange(5))
+
+    assert [bars[field].dtype for field in PRICE_FIELDS] == [np.dtype(expected)] * 4
+    assert bars.toRecords().dtype['Open'] == expected
+
+
+def testFloatPricesKeptAsGiven():
+    opens, highs, lows, closes = prices(np.float32, np.float32, np.float32, np.float32)
+    bars = Bars(np.arange(5), opens, highs, lows, closes, np.arange(5))
+    assert bars.Open is opens and bars.Close is closes
+
+
+def testPriceTypeGiven():
+    bars = Bars(np.arange(5), *prices(np.float64, np.int64, np.float32, np.float64), np.arange(5),
+                priceType=np.float32)
+    assert [bars[field].dtype for field in PRICE_FIELDS] == [np.dtype(np.float32)] * 4
+
+
+def testFrameRoundTrip():
+    chart = synthetic_data.minuteBars(2, seed=4)
+    bars = Bars.fromFrame(chart.sample(frac=1, random_state=4), 'AAA')
+
+    frame = bars.toFrame()
+    assert frame.equals(chart[frame.columns])
+    assert len(list(bars.iterDays())) == 2
+    assert Bars.fromRecords(bars.toRecords()).toFrame().equals(frame)
+
+
+def testMemory():
+    memory = barsMemory(2)
+    assert memory['float64 Bytes Per Bar'] == 48 and memory['float32 Bytes Per Bar'] == 32
+    assert memory['Chart Bytes Per Bar'] > memory['float64 Bytes Per Bar']
+    assert memory['Sessions Share Memory']
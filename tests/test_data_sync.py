@@ -0,0 +1,166 @@
+import datetime
+
+import numpy as np
+import pandas
+import pytest
+
+from utils.bar_store import BarStore, DAILY
+from utils.data_sync import DataSync, mergeRanges, missingRanges, hasTradingDays
+
+D = datetime.date
+
+
+class StubLoader:
+    """
+    Daily bars for every weekday asked for, recording each call
+    :param empty: Tickers answered with no bars, like a throttled response
+    :param failures: Dict of ticker to the exception raised for it
+    """
+    def __init__(self, empty=(), failures=None):
+        self.empty = set(empty)
+        self.failures = failures or {}
+        self.calls = []
+
+    def __call__(self, symbol, start, end, frequency):
+        self.calls.append((symbol, start.date(), end.date()))
+        if symbol in self.failures:
+            raise self.failures[symbol]
+        dates = pandas.bdate_range(start.date(), end.date()) if symbol not in self.empty else pandas.DatetimeIndex([])
+        prices = np.arange(len(dates), dtype=np.float64) + 10
+        return pandas.DataFrame({'Datetime': dates, 'Open': prices, 'High': prices + 1, 'Low': prices - 1,
+                                 'Close': prices, 'Volume': np.full(len(dates), 1000)})
+
+
+def makeSync(tmp_path, loader):
+    return DataSync(BarStore(str(tmp_path)), loader=loader)
+
+
+def testMergeRanges():
+    assert mergeRanges([]) == []
+    assert mergeRanges([(D(2021, 1, 10), D(2021, 1, 12)), (D(2021, 1, 1), D(2021, 1, 5)),
+                        (D(2021, 1, 6), D(2021, 1, 7)), (D(2021, 1, 11), D(2021, 1, 20))]) == \
+        [(D(2021, 1, 1), D(2021, 1, 7)), (D(2021, 1, 10), D(2021, 1, 20))]
+
+
+def testMissingRanges():
+    held = [(D(2021, 1, 5), D(2021, 1, 10)), (D(2021, 1, 20), D(2021, 1, 25))]
+
+    assert missingRanges([], D(2021, 1, 1), D(2021, 1, 31)) == [(D(2021, 1, 1), D(2021, 1, 31))]
+    assert missingRanges(held, D(2021, 1, 1), D(2021, 1, 31)) == \
+        [(D(2021, 1, 1), D(2021, 1, 4)), (D(2021, 1, 11), D(2021, 1, 19)), (D(2021, 1, 26), D(2021, 1, 31))]
+    assert missingRanges(held, D(2021, 1, 6), D(2021, 1, 9)) == []
+    assert missingRanges(held, D(2021, 1, 8), D(2021, 1, 22)) == [(D(2021, 1, 11), D(2021, 1, 19))]
+
+
+def testHasTradingDays():
+    assert not hasTradingDays(D(2021, 1, 2), D(2021, 1, 3))
+    assert hasTradingDays(D(2021, 1, 2), D(2021, 1, 4))
+
+
+def testTodayIsNeverHeld(tmp_path):
+    loader = StubLoader()
+    sync = makeSync(tmp_path, loader)
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=10)
+
+    sync.sync('AAA', start, today)
+    assert sync.gaps('AAA', start, today) == [(today, today)]
+
+
+def testOnlyFetchesGaps(tmp_path):
+    loader = StubLoader()
+    sync = makeSync(tmp_path, loader)
+
+    assert sync.sync('AAA', D(2021, 1, 4), D(2021, 1, 15)) == 10
+    assert sync.sync('AAA', D(2021, 1, 11), D(2021, 1, 22)) == 5
+    assert loader.calls == [('AAA', D(2021, 1, 4), D(2021, 1, 15)), ('AAA', D(2021, 1, 16), D(2021, 1, 22))]
+    assert len(sync.store.readBars('AAA', DAILY)) == 15
+
+    # The ledger survives a restart
+    assert DataSync(sync.store).heldRanges('AAA') == [(D(2021, 1, 4), D(2021, 1, 22))]
+
+
+def testEmptyWeekdaysAreRetried(tmp_path):
+    loader = StubLoader(empty={'AAA'})
+    sync = makeSync(tmp_path, loader)
+
+    assert sync.sync('AAA', D(2021, 1, 4), D(2021, 1, 8)) == 0
+    assert sync.gaps('AAA', D(2021, 1, 4), D(2021, 1, 8)) == [(D(2021, 1, 4), D(2021, 1, 8))]
+
+    assert sync.syncMany(['AAA'], D(2021, 1, 4), D(2021, 1, 8)) == {}
+    assert sync.heldRanges('AAA') == []
+    assert len(loader.calls) == 2
+
+
+def testWeekendsAreHeldWithoutFetching(tmp_path):
+    loader = StubLoader()
+    sync = makeSync(tmp_path, loader)
+
+    sync.sync('AAA', D(2021, 1, 9), D(2021, 1, 10))
+    sync.syncMany(['BBB'], D(2021, 1, 9), D(2021, 1, 10))
+    assert loader.calls == []
+    assert sync.heldRanges('AAA') == sync.heldRanges('BBB') == [(D(2021, 1, 9), D(2021, 1, 10))]
+
+
+def testSyncManyGroupsSharedGaps(tmp_path):
+    loader = StubLoader()
+    sync = makeSync(tmp_path, loader)
+    sync.sync('AAA', D(2021, 1, 4), D(2021, 1, 8))
+    sync.sync('BBB', D(2021, 1, 4), D(2021, 1, 8))
+    loader.calls.clear()
+
+    assert sync.syncMany(['AAA', 'BBB', 'CCC'], D(2021, 1, 4), D(2021, 1, 15)) == {}
+    # AAA and BBB share the second week, CCC misses both
+    assert loader.calls == [('CCC', D(2021, 1, 4), D(2021, 1, 15)),
+                            ('AAA', D(2021, 1, 9), D(2021, 1, 15)), ('BBB', D(2021, 1, 9), D(2021, 1, 15))]
+    for ticker in ['AAA', 'BBB', 'CCC']:
+        assert sync.gaps(ticker, D(2021, 1, 4), D(2021, 1, 15)) == []
+
+
+def testSyncManyReturnsErrors(tmp_path):
+    loader = StubLoader(failures={'BAD': RuntimeError('throttled')})
+    sync = makeSync(tmp_path, loader)
+
+    errors = sync.syncMany(['AAA', 'BAD'], D(2021, 1, 4), D(2021, 1, 8))
+    assert list(errors) == ['BAD'] and isinstance(errors['BAD'], RuntimeError)
+    assert sync.heldRanges('BAD') == []
+    assert sync.heldRanges('AAA') == [(D(2021, 1, 4), D(2021, 1, 8))]
+
+
+def testLedgerSavedWhenSyncRaises(tmp_path):
+    loader = StubLoader()
+    sync = makeSync(tmp_path, loader)
+    sync.sync('AAA', D(2021, 1, 11), D(2021, 1, 15))
+    calls = []
+
+    # The gap before the held week is written, the one after it raises
+
+    def flaky(symbol, start, end, frequency):
+        calls.append(start.date())
+        if len(calls) > 1:
+            raise RuntimeError('down')
+        return StubLoader()(symbol, start, end, frequency)
+
+    sync.loader = flaky
+    with pytest.raises(RuntimeError):
+        sync.sync('AAA', D(2021, 1, 4), D(2021, 1, 22))
+
+    assert DataSync(sync.store).heldRanges('AAA') == [(D(2021, 1, 4), D(2021, 1, 15))]
+
+
+def testLedgerSavedWhenWriteRaises(tmp_path, monkeypatch):
+    sync = makeSync(tmp_path, StubLoader())
+    write = sync.store.writeBars
+
+    def failingWrite(symbol, df, frequency=DAILY):
+        if symbol == 'BBB':
+            raise OSError('disk full')
+        return write(symbol, df, frequency)
+
+    monkeypatch.setattr(sync.store, 'writeBars', failingWrite)
+    with pytest.raises(OSError):
+        sync.syncMany(['AAA', 'BBB'], D(2021, 1, 4), D(2021, 1, 8))
+
+    saved = DataSync(sync.store)
+    assert saved.heldRanges('AAA') == [(D(2021, 1, 4), D(2021, 1, 8))]
+    assert saved.heldRanges('BBB') == []
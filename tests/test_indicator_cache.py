@@ -0,0 +1,70 @@
+import pandas
+import pytest
+
+from utils import synthetic_data
+from utils.bar_store import BarStore, DAILY
+from utils.indicator_cache import IndicatorCache, dataVersion, sizeOf
+
+
+@pytest.fixture
+def closes():
+    return synthetic_data.dailyBars(500, seed=3)['Close']
+
+
+def testLeastRecentlyUsedEvicted(closes):
+    size = sizeOf(closes.ewm(span=5).mean())
+    cache = IndicatorCache(maxBytes=2 * size)
+
+    cache.ewmMean('AAA', closes, 5)
+    cache.ewmMean('AAA', closes, 10)
+    cache.ewmMean('AAA', closes, 5)
+    cache.ewmMean('AAA', closes, 20)
+
+    # 10 was used least recently when 20 pushed the cache over budget
+    assert [key[3] for key in cache.entries] == [(5,), (20,)]
+    assert cache.stats()['Evictions'] == 1
+    assert cache.stats()['Bytes'] == 2 * size
+
+
+def testDiskRoundTrip(closes, tmp_path):
+    computed = IndicatorCache(diskPath=str(tmp_path)).ewmMean('AAA', closes, 5)
+
+    cache = IndicatorCache(diskPath=str(tmp_path))
+    version = dataVersion(closes)
+    value = cache.get('AAA', version, 'ema', (5,), lambda: pytest.fail('computed instead of read from disk'))
+
+    # Parquet keeps the dates but not the synthetic index's business day freq
+    pandas.testing.assert_series_equal(value, computed, check_freq=False)
+    assert value.name == 'Close'
+    assert cache.stats()['Disk Hits'] == 1
+
+    unnamed = IndicatorCache(diskPath=str(tmp_path)).get('AAA', version, 'raw', (), lambda: closes.rename(None))
+    assert IndicatorCache(diskPath=str(tmp_path)).get('AAA', version, 'raw', (), None).name is None
+    assert unnamed.name is None
+
+
+def testStoreWriteInvalidates(closes, tmp_path):
+    store = BarStore(str(tmp_path / 'bars'))
+    cache = IndicatorCache(diskPath=str(tmp_path / 'cache'), store=store)
+    cache.ewmMean('AAA', closes, 5)
+    cache.ewmMean('BBB', closes, 5)
+
+    store.writeBars('AAA', synthetic_data.dailyBars(5), DAILY)
+
+    assert [key[0] for key in cache.entries] == ['BBB']
+    assert not (tmp_path / 'cache' / 'AAA').exists()
+    assert (tmp_path / 'cache' / 'BBB').exists()
+
+
+def testStatsHitRate(closes, tmp_path):
+    cache = IndicatorCache(diskPath=str(tmp_path))
+    cache.rollingMean('AAA', closes, 50)
+    cache.rollingMean('AAA', closes, 50)
+    cache.rollingMean('AAA', closes, 50)
+    cache.entries.clear()
+    cache.rollingMean('AAA', closes, 50)
+
+    stats = cache.stats()
+    assert (stats['Hits'], stats['Disk Hits'], stats['Misses']) == (2, 1, 1)
+    assert stats['Hit Rate'] == 0.75
+    assert stats['Entries'] == 1
@@ -0,0 +1,37 @@
+import pandas
+
+from benchmark_suite import parseIntradayCsvLoop
+from utils import intraday_parser, synthetic_data
+
+
+def testMatchesCsvReader():
+    content = synthetic_data.intradayCsv(5)
+    expected = parseIntradayCsvLoop(content)
+    parsed = intraday_parser.parseIntradayCsv(content)
+
+    assert expected.equals(parsed[expected.columns])
+
+
+def testReadsStreams():
+    content = synthetic_data.intradayCsv(1)
+
+    class Stream:
+        def __init__(self, data):
+            self.data = data
+            self.position = 0
+
+        def read(self, size=-1):
+            size = len(self.data) if size < 0 else size
+            chunk = self.data[self.position:self.position + size]
+            self.position += len(chunk)
+            return chunk
+
+    assert intraday_parser.parseIntradayCsv(Stream(content)).equals(intraday_parser.parseIntradayCsv(content))
+
+
+def testDateAndTimeColumns():
+    stamps = pandas.to_datetime(['2021-06-01 04:00', '2021-06-01 09:30', '2021-06-02 04:00'])
+    dates, times = intraday_parser.dateAndTimeColumns(stamps)
+
+    assert list(dates) == list(stamps.date)
+    assert list(times) == list(stamps.time)
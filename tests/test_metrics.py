@@ -0,0 +1,151 @@
+import datetime
+import math
+
+import pytest
+
+import strategies
+from utils import metrics, parameter_sweep, premarket_stats, synthetic_data
+from utils.bar_store import BarStore, DAILY, MINUTE
+
+TICKERS = ['AAA', 'BBB', 'CCC']
+
+
+def observed(values):
+    histogram = metrics.Histogram()
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+def testQuantile():
+    assert metrics.Histogram().quantile(0.5) == 0.0
+
+    histogram = observed([0.003] * 90 + [0.2] * 10)
+    # Upper bound of the bucket holding the value, capped at the largest value seen
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.9) == 0.005
+    assert histogram.quantile(0.95) == 0.2
+    assert histogram.quantile(1.0) == 0.2
+    assert observed([120.0]).quantile(0.5) == 120.0
+
+
+def testHistogramToDict():
+    assert metrics.Histogram().toDict()['Min'] == 0.0
+
+    total = observed([0.001, 0.02, 0.3]).toDict()
+    assert total['Count'] == 3
+    assert total['Seconds'] == pytest.approx(0.321)
+    assert total['Mean'] == pytest.approx(0.107)
+    assert (total['Min'], total['Max']) == (0.001, 0.3)
+    assert total['Buckets'][metrics.BUCKETS.index(0.001)] == 1
+    assert total['Buckets'][metrics.BUCKETS.index(0.025)] == 1
+    assert total['Buckets'][metrics.BUCKETS.index(0.5)] == 1
+    assert sum(total['Buckets']) == 3
+
+
+def testRegistryToDict():
+    registry = metrics.MetricsRegistry(enabled=True)
+    registry.observe(metrics.FETCH, 0.2, 'aaa')
+    registry.observe(metrics.FETCH, 0.4, 'BBB')
+    registry.observe(metrics.WRITE, 0.01)
+    registry.increment('requests', 2, 'AAA')
+
+    result = registry.toDict()
+    assert result['Stages'][metrics.FETCH]['Total']['Count'] == 2
+    assert set(result['Stages'][metrics.FETCH]['Tickers']) == {'AAA', 'BBB'}
+    assert 'Tickers' not in result['Stages'][metrics.WRITE]
+    assert result['Counters']['requests'] == {'Total': 2, 'Tickers': {'AAA': 2}}
+    assert result['Buckets'][-1] == 'inf'
+
+    totals = registry.toDict(perTicker=False)
+    assert 'Tickers' not in totals['Stages'][metrics.FETCH] and 'Tickers' not in totals['Counters']['requests']
+
+
+def testToPrometheus():
+    registry = metrics.MetricsRegistry(enabled=True)
+    registry.observe(metrics.FETCH, 0.003, 'AAA')
+    registry.observe(metrics.FETCH, 0.2, 'BBB')
+    registry.increment('cache hits', 3, 'AAA')
+
+    lines = registry.toPrometheus().splitlines()
+    assert '# TYPE stock_analysis_stage_seconds histogram' in lines
+    # Buckets are cumulative and end with +Inf holding the count
+    assert 'stock_analysis_stage_seconds_bucket{stage="fetch",le="0.0025"} 0' in lines
+    assert 'stock_analysis_stage_seconds_bucket{stage="fetch",le="0.005"} 1' in lines
+    assert 'stock_analysis_stage_seconds_bucket{stage="fetch",le="0.25"} 2' in lines
+    assert 'stock_analysis_stage_seconds_bucket{stage="fetch",le="+Inf"} 2' in lines
+    assert 'stock_analysis_stage_seconds_count{stage="fetch"} 2' in lines
+    assert 'stock_analysis_stage_seconds_sum{stage="fetch"} 0.203' in lines
+    assert 'stock_analysis_cache_hits_total 3' in lines
+    assert not any('ticker=' in line for line in lines)
+
+    perTicker = registry.toPrometheus(perTicker=True).splitlines()
+    assert 'stock_analysis_stage_seconds_count{stage="fetch",ticker="AAA"} 1' in perTicker
+    assert 'stock_analysis_cache_hits_total{ticker="AAA"} 3' in perTicker
+
+
+def testMergeMatchesOneRegistry():
+    values = [(metrics.FETCH, 0.002 * i, 'T{0}'.format(i % 3)) for i in range(1, 40)]
+    whole = metrics.MetricsRegistry(enabled=True)
+    parts = [metrics.MetricsRegistry(enabled=True) for _ in range(3)]
+    for i, (stage, seconds, ticker) in enumerate(values):
+        whole.observe(stage, seconds, ticker)
+        whole.increment('tasks', ticker=ticker)
+        parts[i % 3].observe(stage, seconds, ticker)
+        parts[i % 3].increment('tasks', ticker=ticker)
+
+    merged = metrics.MetricsRegistry(enabled=True)
+    for part in parts:
+        merged.merge(part)
+
+    assert merged.counters == whole.counters
+    assert merged.histograms.keys() == whole.histograms.keys()
+    for key, histogram in whole.histograms.items():
+        assert merged.histograms[key].toDict() == pytest.approx(histogram.toDict())
+    assert merged.histograms[(metrics.FETCH, None)].min == 0.002
+    assert not math.isinf(merged.histograms[(metrics.FETCH, 'T0')].min)
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    store = BarStore(str(tmp_path_factory.mktemp('bars')))
+    for seed, ticker in enumerate(TICKERS):
+        store.writeBars(ticker, synthetic_data.minuteBars(2, seed=seed), MINUTE)
+        store.writeBars(ticker, synthetic_data.dailyBars(60, seed=seed, start='2021-3-1'), DAILY)
+    return store
+
+
+def backTestDipAndRip(store, workers):
+    strategies.backTestDipAndRip(store=store, workers=workers)
+
+
+def buildPremarketTable(store, workers):
+    premarket_stats.buildPremarketTable(store, workers=workers, path=None)
+
+
+def sweepCrossover(store, workers):
+    parameter_sweep.sweepCrossover(TICKERS, [3], [8], datetime.datetime(2021, 4, 1), datetime.datetime(2021, 5, 20),
+                                   workers=workers, loader=parameter_sweep.storeLoader(store))
+
+
+@pytest.mark.parametrize('run', [backTestDipAndRip, buildPremarketTable, sweepCrossover])
+def testWorkerMetricsMerged(store, monkeypatch, run):
+    counts = []
+    for workers in [1, 2]:
+        registry = metrics.MetricsRegistry(enabled=True)
+        monkeypatch.setattr(metrics, 'REGISTRY', registry)
+        run(store, workers)
+        counts.append({key: histogram.count for key, histogram in registry.histograms.items()})
+
+    single, pooled = counts
+    assert (metrics.PARSE, None) in single
+    assert all(ticker in {key[1] for key in single} for ticker in TICKERS)
+    assert pooled == single
+
+
+def testWorkerMetricsOffWhenDisabled(store, monkeypatch):
+    registry = metrics.MetricsRegistry(enabled=False)
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    premarket_stats.buildPremarketTable(store, workers=2, path=None)
+
+    assert registry.histograms == {} and registry.counters == {}
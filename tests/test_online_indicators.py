@@ -0,0 +1,71 @@
+import numpy as np
+import pandas
+import pytest
+
+from utils import pivot_engine
+from utils.online_indicators import OnlineSMA, OnlineEMA, OnlinePivots, PremarketTracker, OnlineTicker, \
+    REGULAR_OPEN
+
+
+def makeChart(day, seed=7):
+    # Cent prices so ties and repeated highs show up
+    rng = np.random.default_rng(seed + day)
+    index = pandas.date_range('2021-6-{0} 4:00'.format(day + 1), periods=960, freq='min')
+    closes = np.round(10 + rng.normal(0, 0.02, len(index)).cumsum(), 2)
+    opens = np.round(closes + rng.choice([-0.01, 0.0, 0.01], len(index)), 2)
+    return pandas.DataFrame({'Open': opens, 'High': np.maximum(opens, closes) + 0.01,
+                             'Low': np.minimum(opens, closes) - 0.01, 'Close': closes,
+                             'Volume': rng.integers(0, 10000, len(index))}, index=index)
+
+
+def premarketLoop(df):
+    """
+    Inline copy of getPremarketData's loop
+    """
+    expected = PremarketTracker()
+    premarketBars = df[df.index.time < REGULAR_OPEN]
+    for stamp, row in zip(premarketBars.index, premarketBars.itertuples(index=False)):
+        if row.High > expected.high:
+            expected.high, expected.highTime, expected.lowAfterHigh = row.High, stamp.time(), row.High
+        elif row.Low < expected.lowAfterHigh:
+            expected.lowAfterHigh, expected.lowTime = row.Low, stamp.time()
+        expected.volume += row.Volume
+    return expected
+
+
+@pytest.mark.parametrize('day', range(20))
+def testMatchesBatch(day, smaWindow=50, emaSpan=20):
+    df = makeChart(day)
+    sma = OnlineSMA(smaWindow)
+    ema = OnlineEMA(emaSpan)
+    pivots = OnlinePivots()
+    premarket = PremarketTracker()
+
+    smaValues = []
+    emaValues = []
+    for stamp, row in zip(df.index, df.itertuples(index=False)):
+        smaValues.append(sma.update(row.Close))
+        emaValues.append(ema.update(row.Close))
+        pivots.update(stamp.to_pydatetime(), row.Open, row.Close)
+        if stamp.time() < REGULAR_OPEN:
+            premarket.update(stamp.time(), row.High, row.Low, row.Volume)
+
+    support, resistance = pivot_engine.getPivotArrays(df)
+
+    assert np.array_equal(smaValues, df['Close'].rolling(window=smaWindow).mean().to_numpy(), equal_nan=True)
+    assert np.array_equal(emaValues, df['Close'].ewm(span=emaSpan).mean().to_numpy())
+    assert [p[:2] for p in pivots.supportPivots] == [p[:2] for p in pivot_engine.toPivotTuples(support)]
+    assert [p[:2] for p in pivots.resistancePivots] == [p[:2] for p in pivot_engine.toPivotTuples(resistance)]
+    assert premarket.toDict() == premarketLoop(df).toDict()
+
+
+def testTickerResetsPremarketEachDay():
+    ticker = OnlineTicker('TEST')
+    for day in range(2):
+        df = makeChart(day)
+        for stamp, row in zip(df.index, df.itertuples(index=False)):
+            ticker.update(stamp.to_pydatetime(), *row)
+
+    snapshot = ticker.snapshot()
+    assert snapshot['Bars'] == 2 * 960
+    assert ticker.premarket.toDict() == premarketLoop(df).toDict()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas
+import pytest
+
+from utils.panel import PricePanel
+
+
+def makeCharts(count, seed=7, periods=750):
+    rng = np.random.default_rng(seed)
+    dates = pandas.bdate_range('2019-1-1', periods=periods)
+    charts = {}
+    for i in range(count):
+        closes = 20 + rng.normal(0, 0.5, len(dates)).cumsum()
+        chart = pandas.DataFrame({'Open': closes + rng.normal(0, 0.2, len(dates)), 'Close': closes}, index=dates)
+        # Late listings and halted days
+        chart = chart.iloc[rng.integers(0, 200):]
+        chart = chart.drop(chart.index[rng.integers(0, len(chart), 5)])
+        charts['T{0}'.format(i)] = chart
+    return charts
+
+
+@pytest.fixture(scope='module')
+def charts():
+    return makeCharts(50)
+
+
+def testMatchesPerTickerPandas(charts, window=50, fast=5, slow=20):
+    panel = PricePanel.fromCharts(charts)
+    sma = panel.sma(window)
+    fastLine = panel.ema(fast)
+    slowLine = panel.ema(slow)
+    isPositive, _ = panel.crossover(fast, slow)
+    near = panel.datesCloseToMa(window)
+
+    for ticker, chart in charts.items():
+        expectedMa = chart['Close'].rolling(window=window).mean()
+        expectedFast = chart['Close'].ewm(span=fast).mean()
+        expectedSlow = chart['Close'].ewm(span=slow).mean()
+        distance = (chart['Close'] - expectedMa) / 100
+        expectedNear = chart[(distance >= 0.0) & (distance <= 0.03) & (chart['Close'] - chart['Open'] > 0.0)]
+
+        assert np.allclose(sma[ticker].reindex(chart.index), expectedMa, equal_nan=True)
+        assert np.allclose(fastLine[ticker].reindex(chart.index), expectedFast)
+        assert np.allclose(slowLine[ticker].reindex(chart.index), expectedSlow)
+        assert (isPositive[ticker].reindex(chart.index) == expectedFast.ge(expectedSlow)).all()
+        assert near[ticker] == expectedNear.index.date.tolist()
+
+
+def testMissingDaysStayMissing(charts):
+    panel = PricePanel.fromCharts(charts)
+    sma = panel.sma(50).to_numpy()
+    ema = panel.ema(5).to_numpy()
+    assert np.isnan(sma[~panel.mask]).all()
+    assert np.isnan(ema[~panel.mask]).all()
+
+
+def testSmaDoesNotDrift():
+    # Large prices with tiny moves, where a cumsum difference loses the small digits
+    dates = pandas.bdate_range('2000-1-3', periods=5000)
+    rng = np.random.default_rng(3)
+    closes = pandas.Series(1e9 + rng.normal(0, 1e-3, len(dates)), index=dates)
+    panel = PricePanel(pandas.DataFrame({'BIG': closes}))
+    expected = closes.rolling(window=20).mean()
+    assert np.allclose(panel.sma(20)['BIG'].to_numpy(), expected.to_numpy(), rtol=0, atol=1e-6, equal_nan=True)
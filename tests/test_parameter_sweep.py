@@ -0,0 +1,67 @@
+import datetime
+
+import numpy as np
+import pytest
+from pandas.tseries.offsets import BDay
+
+import strategies
+from utils import parameter_sweep, synthetic_data
+from utils.bar_store import BarStore, DAILY
+
+TICKERS = ['AAA', 'BBB', 'CCC']
+START = datetime.datetime(2012, 1, 3)
+END = datetime.datetime(2013, 6, 28)
+FAST = [3, 5, 8]
+SLOW = [8, 20]
+
+
+@pytest.fixture(scope='module')
+def loader(tmp_path_factory):
+    store = BarStore(str(tmp_path_factory.mktemp('bars')))
+    for seed, ticker in enumerate(TICKERS):
+        store.writeBars(ticker, synthetic_data.dailyBars(1000, seed=seed, start='2011-1-3'), DAILY)
+    return parameter_sweep.storeLoader(store)
+
+
+def sweep(loader, workers, tickers=TICKERS):
+    return parameter_sweep.sweepCrossover(tickers, FAST, SLOW, START, END, moneySpent=10000, workers=workers,
+                                          loader=loader)
+
+
+def testWorkersGiveSameCube(loader):
+    single, errors = sweep(loader, 1)
+    parallel, parallelErrors = sweep(loader, 2)
+
+    assert errors == parallelErrors == {}
+    assert len(single) == len(TICKERS) * 5
+    assert single.equals(parallel)
+
+
+def testWindowsMatchBackTest(loader):
+    result, _ = sweep(loader, 1)
+    start = START - BDay(max(SLOW))
+
+    for (ticker, fast, slow), row in result.iterrows():
+        ema = strategies.EMACrossoverTrading(ticker, START, END, fast, slow)
+        chart = loader(ticker, start, END)
+        ema.generateEMAData(chart)
+        ledger = ema.backTest(chart, moneySpent=10000)
+
+        assert row['Trades'] == len(ledger)
+        assert row['Wins'] == (ledger['Win or Loss'] == 'Win').sum()
+        assert row['PnL'] == pytest.approx(ledger['PnL'].sum())
+        assert row['Win Rate'] == pytest.approx(row['Wins'] / len(ledger)) if len(ledger) else np.isnan(row['Win Rate'])
+
+
+def testFailedTickersAreReturned(loader):
+    def failing(ticker, start, end):
+        if ticker == 'BAD':
+            raise RuntimeError('throttled')
+        return loader(ticker, start, end)
+
+    result, errors = sweep(failing, 1, ['AAA', 'BAD', 'NONE'])
+
+    assert set(errors) == {'BAD', 'NONE'}
+    assert isinstance(errors['BAD'], RuntimeError)
+    assert isinstance(errors['NONE'], ValueError)
+    assert result.index.get_level_values('Ticker').unique().tolist() == ['AAA']
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas
+import pytest
+
+from utils import pivot_engine
+
+
+def getPivotPointsLoop(df):
+    """
+    Row by row reference implementation findPivots replaced
+    """
+    resistancePivots = []
+    supportPivots = []
+    prevBarIsGreen = df['Close'].iloc[0] > df['Open'].iloc[0]
+    prevClose = df['Close'].iloc[0]
+
+    for index, row in df.iloc[1:].iterrows():
+        if row['Close'] > row['Open'] and prevBarIsGreen == False:
+            num = prevClose if prevClose < row['Open'] else row['Open']
+            supportPivots.append((index.to_pydatetime(), num, row['Counter']))
+            prevBarIsGreen = True
+        elif row['Close'] < row['Open'] and prevBarIsGreen:
+            num = prevClose if prevClose > row['Open'] else row['Open']
+            resistancePivots.append((index.to_pydatetime(), num, row['Counter']))
+            prevBarIsGreen = False
+        prevClose = row['Close']
+
+    return supportPivots, resistancePivots
+
+
+def randomChart(size, seed=7):
+    rng = np.random.default_rng(seed)
+    opens = np.round(100 + rng.normal(0, 1, size).cumsum(), 2)
+    closes = np.round(opens + rng.choice([-0.5, 0.0, 0.5], size), 2)
+    return pandas.DataFrame({'Counter': np.arange(size), 'Open': opens, 'Close': closes},
+                            index=pandas.date_range('2020-1-1', periods=size, freq='min'))
+
+
+@pytest.mark.parametrize('size', [1, 2, 10, 500, 5000])
+def testPivotsMatchLoop(size):
+    chart = randomChart(size, seed=size)
+    expectedSupport, expectedResistance = getPivotPointsLoop(chart)
+    support, resistance = pivot_engine.getPivotArrays(chart)
+
+    assert pivot_engine.toPivotTuples(support) == expectedSupport
+    assert pivot_engine.toPivotTuples(resistance) == expectedResistance
+
+
+def testBatchMatchesSingleCharts():
+    charts = {'T{0}'.format(i): randomChart(300 + i, seed=i) for i in range(5)}
+    batch = pivot_engine.getPivotArraysBatch(charts)
+
+    for ticker, chart in charts.items():
+        for single, stacked in zip(pivot_engine.getPivotArrays(chart), batch[ticker]):
+            assert all(np.array_equal(a, b) for a, b in zip(single, stacked))
@@ -0,0 +1,208 @@
+import datetime
+
+import numpy as np
+import pandas
+import pytest
+
+from utils import premarket_stats, stock_utils, synthetic_data
+from utils.bar_store import BarStore, DAILY, MINUTE
+from utils.bars import Bars
+
+PREMARKET_KEYS = ['Premarket High', 'Premarket High Time', 'Premarket Low (After Top Reached)',
+                  'Premarket Low Time (After Top Reached)', 'Premarket Volume']
+
+
+def candles(chart):
+    premarket = chart[chart['Time'] < datetime.time(9, 30)]
+    return [{'high': row.High, 'low': row.Low, 'time': row.Time, 'volume': row.Volume}
+            for row in premarket.itertuples(index=False)]
+
+
+def assertDefaults(stats):
+    now = datetime.datetime.now()
+    assert stats['Premarket High'] == 0.0 and stats['Premarket Low (After Top Reached)'] == 0.0
+    assert stats['Premarket Volume'] == 0
+    for key in ['Premarket High Time', 'Premarket Low Time (After Top Reached)']:
+        assert isinstance(stats[key], datetime.datetime) and now - stats[key] < datetime.timedelta(minutes=1)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def testBarsMatchCandles(seed):
+    chart = synthetic_data.minuteBars(1, seed=seed)
+    expected = stock_utils.getPremarketData(candles(chart))
+    found = stock_utils.getPremarketData(Bars.fromFrame(chart))
+
+    assert [found[key] for key in PREMARKET_KEYS] == [expected[key] for key in PREMARKET_KEYS]
+    assert type(found['Premarket High']) is float and type(found['Premarket Volume']) is int
+
+
+def testNoPremarketUsesCandleDefaults():
+    chart = synthetic_data.minuteBars(1)
+    regular = chart[chart['Time'] >= datetime.time(9, 30)]
+
+    assertDefaults(stock_utils.getPremarketData(candles(regular)))
+    assertDefaults(stock_utils.getPremarketData(Bars.fromFrame(regular)))
+    assertDefaults(stock_utils.getPremarketData(Bars.fromFrame(chart.iloc[:0])))
+
+
+def testLowTimeDefaultsWhenLowNeverMoves():
+    chart = synthetic_data.minuteBars(1)
+    premarket = chart[chart['Time'] < datetime.time(9, 30)].iloc[:1]
+
+    expected = stock_utils.getPremarketData(candles(premarket))
+    found = stock_utils.getPremarketData(Bars.fromFrame(premarket))
+    assert found['Premarket High Time'] == expected['Premarket High Time']
+    assert isinstance(found['Premarket Low Time (After Top Reached)'], datetime.datetime)
+
+
+TICKERS = ['AAA', 'BBB', 'CCC']
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    store = BarStore(str(tmp_path_factory.mktemp('bars')))
+    for seed, ticker in enumerate(TICKERS):
+        store.writeBars(ticker, synthetic_data.minuteBars(4, seed=seed, price=3.0 + seed), MINUTE)
+    # CCC has no daily bars and falls back to the minute closes, BBB misses a day so its next gap is from the day before
+    store.writeBars('AAA', synthetic_data.dailyBars(30, seed=5, start='2021-5-3', price=3.0), DAILY)
+    daily = synthetic_data.dailyBars(30, seed=6, start='2021-5-3', price=4.0)
+    store.writeBars('BBB', daily[daily.index != '2021-6-2'], DAILY)
+    return store
+
+
+def premarketLoop(ticker, chart, daily=None):
+    """
+    One day at a time with getPremarketData's candle loop, the per day loop buildPremarketTable replaced
+    """
+    rows = []
+    previousClose, previousDate = np.nan, pandas.NaT
+
+    for date, day in chart.groupby('Date'):
+        premarket, regularMarket, _ = stock_utils.splitCandles(day)
+        stats = stock_utils.getPremarketData(candles(premarket))
+        lowTime = stats['Premarket Low Time (After Top Reached)']
+        if daily is not None:
+            before = daily[daily['Datetime'] < pandas.Timestamp(date)]
+            previousClose, previousDate = before['Close'].iloc[-1], before['Datetime'].iloc[-1]
+
+        rows.append({
+            'Ticker': ticker,
+            'Date': pandas.Timestamp(date),
+            'Premarket High': stats['Premarket High'],
+            'Premarket High Time': stats['Premarket High Time'],
+            'Premarket Low (After Top Reached)': stats['Premarket Low (After Top Reached)'],
+            # The loop leaves its now() default when the low never moved, the table has None
+            'Premarket Low Time (After Top Reached)': None if isinstance(lowTime, datetime.datetime) else lowTime,
+            'Premarket Volume': stats['Premarket Volume'],
+            'Open': regularMarket['Open'].iloc[0],
+            'Regular Volume': regularMarket['Volume'].sum(),
+            'Close': regularMarket['Close'].iloc[-1],
+            'Previous Close': previousClose,
+            'Previous Close Date': previousDate,
+            'Gap %': (stats['Premarket High'] / previousClose - 1) * 100,
+            'Open Gap %': (regularMarket['Open'].iloc[0] / previousClose - 1) * 100,
+        })
+        if daily is None:
+            previousClose, previousDate = regularMarket['Close'].iloc[-1], pandas.Timestamp(date)
+
+    return rows
+
+
+def expectedTable(store):
+    rows = []
+    for ticker in TICKERS:
+        chart = store.readBars(ticker, MINUTE)
+        daily = store.readBars(ticker, DAILY) if store.partitions(ticker, DAILY) else None
+        rows.extend(premarketLoop(ticker, chart, daily))
+    table = pandas.DataFrame(rows, columns=premarket_stats.STATS_COLUMNS)
+    return table.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def testTableMatchesLoop(store, workers):
+    table = premarket_stats.buildPremarketTable(store, workers=workers, path=None)
+
+    assert len(table) == len(TICKERS) * 4
+    pandas.testing.assert_frame_equal(table, expectedTable(store))
+
+
+def testPreviousCloseFromDailyBars(store):
+    table = premarket_stats.buildPremarketTable(store, workers=1, path=None).set_index(['Ticker', 'Date'])
+    aaaDaily = store.readBars('AAA', DAILY)
+    minuteCloses = table.loc['CCC', 'Close']
+
+    # Daily bars give a previous close on the first day too, minute bars only from the second
+    first = pandas.Timestamp('2021-6-1')
+    assert table.loc[('AAA', first), 'Previous Close'] == aaaDaily.loc[aaaDaily['Datetime'] == '2021-5-31',
+                                                                       'Close'].iloc[0]
+    assert np.isnan(table.loc[('CCC', first), 'Previous Close']) and np.isnan(table.loc[('CCC', first), 'Gap %'])
+    assert table.loc['CCC', 'Previous Close'].iloc[1:].tolist() == minuteCloses.iloc[:-1].tolist()
+    assert table.loc[('BBB', pandas.Timestamp('2021-6-3')), 'Previous Close Date'] == pandas.Timestamp('2021-6-1')
+
+    daily = table.loc['AAA']
+    assert not np.allclose(daily['Previous Close'].iloc[1:].to_numpy(), daily['Close'].iloc[:-1].to_numpy())
+
+
+def testGapPercent(store):
+    table = premarket_stats.buildPremarketTable(store, workers=1, path=None)
+
+    known = table['Previous Close'].notna()
+    assert known.sum() == len(table) - 1
+    gaps = (table['Premarket High'] / table['Previous Close'] - 1) * 100
+    assert np.allclose(table.loc[known, 'Gap %'], gaps[known])
+    assert np.allclose(table.loc[known, 'Open Gap %'], ((table['Open'] / table['Previous Close'] - 1) * 100)[known])
+    # minuteBars gaps up 20% in premarket over the previous close
+    assert (table.loc[table['Ticker'] == 'CCC', 'Gap %'].dropna() > 10).all()
+
+
+def testSaveLoadMerges(store, tmp_path):
+    path = str(tmp_path / 'premarket.parquet')
+    assert premarket_stats.loadPremarketTable(path).empty
+
+    premarket_stats.buildPremarketTable(store, tickers=['AAA', 'BBB'], workers=1, path=path)
+    full = premarket_stats.buildPremarketTable(store, workers=1, path=None)
+
+    # Rebuilding a ticker replaces its saved rows, other tickers are kept
+    changed = full[full['Ticker'].isin(['AAA', 'CCC'])].assign(**{'Gap %': 99.0})
+    merged = premarket_stats.savePremarketTable(changed, path)
+    loaded = premarket_stats.loadPremarketTable(path)
+
+    expected = full.copy()
+    expected.loc[expected['Ticker'].isin(['AAA', 'CCC']), 'Gap %'] = 99.0
+    pandas.testing.assert_frame_equal(merged, expected)
+    pandas.testing.assert_frame_equal(loaded, expected)
+    assert loaded['Ticker'].dtype == object
+
+
+def testGapUpCandidates(store):
+    table = premarket_stats.buildPremarketTable(store, workers=1, path=None)
+    minGap = table['Gap %'].median()
+    minVolume = int(table['Premarket Volume'].median())
+
+    candidates = premarket_stats.gapUpCandidates(table, minGap, minVolume)
+    expected = table[(table['Gap %'] >= minGap) & (table['Premarket Volume'] >= minVolume)]
+    assert len(candidates) == len(expected) > 0
+    assert candidates['Gap %'].is_monotonic_decreasing
+    assert set(zip(candidates['Ticker'], candidates['Date'])) == set(zip(expected['Ticker'], expected['Date']))
+
+    some = premarket_stats.gapUpCandidates(table, 0, 0, start='2021-6-2', end='2021-6-3', tickers=['aaa'])
+    assert some['Ticker'].unique().tolist() == ['AAA']
+    assert sorted(some['Date'].dt.day.tolist()) == [2, 3]
+
+
+def testJoinPremarketStats(store):
+    table = premarket_stats.buildPremarketTable(store, workers=1, path=None)
+    results = pandas.DataFrame({'Ticker': ['aaa', 'CCC', 'ZZZ'],
+                                'Trade Date': [datetime.date(2021, 6, 2), datetime.date(2021, 6, 4),
+                                               datetime.date(2021, 6, 2)],
+                                'PnL': [1.0, 2.0, 3.0]}, index=[5, 6, 7])
+
+    joined = premarket_stats.joinPremarketStats(results, table)
+
+    assert joined.columns.tolist() == ['Ticker', 'Trade Date', 'PnL'] + premarket_stats.STATS_COLUMNS[2:]
+    assert joined['PnL'].tolist() == [1.0, 2.0, 3.0]
+    row = table[(table['Ticker'] == 'AAA') & (table['Date'] == '2021-6-2')].iloc[0]
+    assert joined.loc[0, 'Gap %'] == row['Gap %']
+    assert joined.loc[1, 'Premarket High'] == table.loc[(table['Ticker'] == 'CCC') &
+                                                        (table['Date'] == '2021-6-4'), 'Premarket High'].iloc[0]
+    assert joined.loc[2, ['Premarket High', 'Premarket Volume', 'Gap %']].isna().all()
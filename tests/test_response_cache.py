@@ -0,0 +1,65 @@
+import datetime
+
+import pandas
+
+from utils import stock_utils
+from utils.bar_store import DAILY, MINUTE
+from utils.response_cache import ResponseCache, ALPHA_VANTAGE, TD, cacheKey
+
+
+def candles():
+    return pandas.DataFrame({'Open': [1.0, 2.0], 'Close': [2.0, 3.0], 'Volume': [10, 20]})
+
+
+def expiry(cache, provider, symbol, frequency, start, end, part=None):
+    return cache.connection.execute('SELECT expires FROM entries WHERE key = ?',
+                                    (cacheKey(provider, symbol, frequency, start, end, part),)).fetchone()[0]
+
+
+def testClosedRangesNeverExpire(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    today = datetime.date.today()
+    cache.put(TD, 'aaa', DAILY, datetime.date(2021, 1, 1), datetime.date(2021, 2, 1), candles())
+    cache.put(TD, 'aaa', DAILY, datetime.date(2021, 1, 1), today, candles())
+
+    assert expiry(cache, TD, 'AAA', DAILY, datetime.date(2021, 1, 1), datetime.date(2021, 2, 1)) is None
+    assert expiry(cache, TD, 'AAA', DAILY, datetime.date(2021, 1, 1), today) is not None
+    assert cache.get(TD, 'AAA', DAILY, datetime.date(2021, 1, 1), datetime.date(2021, 2, 1)).equals(candles())
+
+
+def testFetchCallsLoaderOnce(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return candles()
+
+    for _ in range(3):
+        cache.fetch(TD, 'AAA', DAILY, datetime.date(2021, 1, 1), datetime.date(2021, 2, 1), loader)
+
+    assert len(calls) == 1
+    assert cache.stats()['Hits'] == 2
+
+
+def testAlphaVantageSlices():
+    today = datetime.date(2021, 9, 20)
+    current = stock_utils.intradayCacheArgsAV(datetime.date(2021, 9, 1), today)
+    older = stock_utils.intradayCacheArgsAV(datetime.date(2021, 8, 1), today)
+
+    assert current['part'] == stock_utils.CURRENT_SLICE_AV and not current['closed']
+    assert older['part'] == 'year1month2' and older['closed']
+    # The same day falls in the next slice once the month rolls over, so it gets another key
+    assert stock_utils.intradayCacheArgsAV(datetime.date(2021, 9, 1), datetime.date(2021, 10, 5))['part'] == 'year1month2'
+    assert current['start'] == current['end'] == today
+
+
+def testAlphaVantageCurrentSliceExpires(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    today = datetime.date.today()
+    for asof in [today, today - datetime.timedelta(days=70)]:
+        cache.put(ALPHA_VANTAGE, 'AAA', MINUTE, df=candles(), **stock_utils.intradayCacheArgsAV(asof, today))
+
+    assert expiry(cache, ALPHA_VANTAGE, 'AAA', MINUTE, today, today, stock_utils.CURRENT_SLICE_AV) is not None
+    assert expiry(cache, ALPHA_VANTAGE, 'AAA', MINUTE, today, today,
+                  stock_utils.intradaySliceAV(today - datetime.timedelta(days=70), today)) is None
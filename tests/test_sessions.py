@@ -0,0 +1,121 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import strategies
+from utils import sessions, stock_utils, synthetic_data
+from utils.bars import Bars
+
+
+def sortedStats(premarket, regularMarket, kind='quicksort'):
+    """
+    The sort based DailyChartBase getters SessionIndex.stats replaced, extended to the regular session
+    """
+    stats = {'Premarket Volume': premarket['Volume'].sum(), 'Regular Volume': regularMarket['Volume'].sum()}
+    for name, candles in [('Premarket', premarket), ('Regular', regularMarket)]:
+        high = candles.sort_values(by=['High'], ascending=False, kind=kind).iloc[0]
+        low = candles.sort_values(by=['Low'], ascending=True, kind=kind).iloc[0]
+        stats.update({
+            '{0} High'.format(name): high['High'],
+            '{0} High Time'.format(name): high['Time'],
+            '{0} Low'.format(name): low['Low'],
+            '{0} Low Time'.format(name): low['Time'],
+        })
+    return stats
+
+
+def testOpenAndCloseMinutes():
+    chart = synthetic_data.minuteBars(1)
+    times = [datetime.time(9, 29), datetime.time(9, 30), datetime.time(15, 59), datetime.time(16, 0)]
+    codes = sessions.sessionCodes(sessions.minutesOfDay(chart[chart['Time'].isin(times)]))
+    assert codes.tolist() == [sessions.PREMARKET, sessions.REGULAR, sessions.REGULAR, sessions.AFTER_HOURS]
+
+    premarket, regularMarket, afterHours = stock_utils.splitCandles(chart)
+    assert premarket['Time'].iloc[-1] == datetime.time(9, 29)
+    assert regularMarket['Time'].iloc[0] == datetime.time(9, 30)
+    assert regularMarket['Time'].iloc[-1] == datetime.time(15, 59)
+    assert afterHours['Time'].iloc[0] == datetime.time(16, 0)
+    assert len(premarket) + len(regularMarket) + len(afterHours) == len(chart)
+
+
+def testTimeColumnOnly():
+    chart = synthetic_data.minuteBars(1)
+    index = sessions.SessionIndex(chart.drop(columns=['Datetime']))
+    assert index.bounds == sessions.SessionIndex(chart).bounds == (0, 330, 720, 960)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def testUnsortedMultiDayRegrouped(seed):
+    chart = synthetic_data.minuteBars(3, seed=seed)
+    shuffled = chart.sample(frac=1, random_state=seed)
+
+    for data in [chart, shuffled]:
+        codes = sessions.sessionCodes(sessions.minutesOfDay(data))
+        premarket, regularMarket, afterHours = sessions.SessionIndex(data).split()
+        # Grouped by session, each session keeping the order it came in
+        assert premarket.equals(data[codes == sessions.PREMARKET])
+        assert regularMarket.equals(data[codes == sessions.REGULAR])
+        assert afterHours.equals(data[codes == sessions.AFTER_HOURS])
+        assert premarket['Date'].nunique() == 3
+
+    bars = Bars.fromFrame(chart)
+    index = sessions.SessionIndex(bars.take(np.random.default_rng(seed).permutation(len(bars))))
+    assert np.array_equal(np.sort(index.premarket.datetimes), chart[chart['Time'] < datetime.time(9, 30)]
+                          ['Datetime'].to_numpy())
+
+
+def testEmptySessionsRaise():
+    chart = synthetic_data.minuteBars(1)
+    chartBase = strategies.DailyChartBase(chart[chart['Time'] >= datetime.time(9, 30)], chart['Date'].iloc[0], 0)
+
+    for getter in [chartBase.getPremarketHigh, chartBase.getPremarketHighTime, chartBase.getPremarketLow,
+                   chartBase.getPremarketLowTime]:
+        with pytest.raises(IndexError):
+            getter()
+    # The sort based getters raised the same way
+    with pytest.raises(IndexError):
+        chartBase.premarket.sort_values(by=['High'], ascending=False).iloc[0]
+
+    assert chartBase.getPremarketVolume() == 0
+    assert chartBase.getRegularVolume() == chartBase.regularMarket['Volume'].sum() > 0
+
+    stats = sessions.SessionIndex(chart[chart['Time'] < datetime.time(9, 30)]).stats()
+    assert stats['Regular High'] is None and stats['Regular Volume'] == 0 and stats['After Hours Volume'] == 0
+
+
+@pytest.mark.parametrize('seed', range(20))
+def testStatsMatchSorts(seed):
+    chart = synthetic_data.minuteBars(1, seed=seed, price=1.0 + seed)
+    premarket, regularMarket, _ = stock_utils.splitCandles(chart)
+    # Prices are in cents so highs and lows tie, the old quicksort then picked any of the tied candles
+    # where stats takes the earliest like a stable sort does
+    expected = sortedStats(premarket, regularMarket, kind='mergesort')
+    old = sortedStats(premarket, regularMarket)
+
+    chartBase = strategies.DailyChartBase(chart, chart['Date'].iloc[0], 0)
+    found = chartBase.getStats()
+    assert {key: found[key] for key in expected} == expected
+    assert {key: found[key] for key in old if 'Time' not in key} == {key: old[key] for key in old if 'Time' not in key}
+    for name, column in [('Premarket High', 'High'), ('Premarket Low', 'Low'), ('Regular High', 'High'),
+                         ('Regular Low', 'Low')]:
+        assert chart.loc[chart['Time'] == old['{0} Time'.format(name)], column].iloc[0] == found[name]
+    assert found['After Hours Volume'] == chart.loc[chart['Time'] >= datetime.time(16, 0), 'Volume'].sum()
+
+    assert chartBase.getPremarketHigh() == expected['Premarket High']
+    assert chartBase.getPremarketHighTime() == expected['Premarket High Time']
+    assert chartBase.getPremarketLow() == expected['Premarket Low']
+    assert chartBase.getPremarketLowTime() == expected['Premarket Low Time']
+
+    # Without a Time column the times come from the minutes of Datetime
+    fromBars = sessions.SessionIndex(Bars.fromFrame(chart)).stats()
+    assert {key: fromBars[key] for key in expected} == pytest.approx(expected)
+
+
+def testStatsTiesGoToEarliest():
+    chart = synthetic_data.minuteBars(1)
+    chart = chart.assign(High=10.0, Low=1.0)
+    stats = sessions.SessionIndex(chart).stats()
+
+    assert stats['Premarket High Time'] == stats['Premarket Low Time'] == datetime.time(4, 0)
+    assert stats['Regular High Time'] == stats['Regular Low Time'] == datetime.time(9, 30)
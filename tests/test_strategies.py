@@ -0,0 +1,152 @@
+import datetime
+
+import pandas
+import pytest
+
+import strategies
+from utils import synthetic_data
+from utils.bar_store import BarStore, MINUTE
+from utils.replay import ReplayEngine, frameSources
+from utils.result_sink import CsvResultSink
+
+TICKERS = ['AAA', 'BBB', 'CCC', 'DDD']
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    store = BarStore(str(tmp_path_factory.mktemp('bars')))
+    for seed, ticker in enumerate(TICKERS):
+        store.writeBars(ticker, synthetic_data.minuteBars(3, seed=seed, price=2.0 + seed), MINUTE)
+    # A partition that can not be read gives an error record instead of stopping the batch
+    store.writeBars('BAD', synthetic_data.minuteBars(1, seed=9), MINUTE)
+    with open(store.partitionPath('BAD', store.partitions('BAD', MINUTE)[0], MINUTE), 'wb') as f:
+        f.write(b'not parquet')
+    return store
+
+
+def ordered(df):
+    return df.sort_values(['Ticker', 'Trade Date'], kind='mergesort').reset_index(drop=True)
+
+
+def testPoolMatchesSingleProcess(store):
+    single = strategies.backTestDipAndRip(store=store, workers=1)
+    pooled = strategies.backTestDipAndRip(store=store, workers=2)
+
+    assert len(single) > 0
+    assert ordered(pooled).equals(ordered(single))
+
+
+def testSinkMatchesSingleProcess(store, tmp_path):
+    single = CsvResultSink(str(tmp_path / 'single.csv'))
+    pooled = CsvResultSink(str(tmp_path / 'pooled.csv'))
+    strategies.backTestDipAndRip(store=store, workers=1, sink=single)
+    log = strategies.backTestDipAndRip(store=store, workers=2, sink=pooled)
+
+    assert ordered(pandas.read_csv(pooled.resultPath)).equals(ordered(pandas.read_csv(single.resultPath)))
+    assert pooled.results == single.results > 0
+
+    # Every chart is logged once, the unreadable one with its error
+    assert len(log) == len(TICKERS) * 3 + 1
+    assert 'Result' not in log.columns
+    errors = log[log['Error'].notna()]
+    assert errors['Ticker'].tolist() == ['BAD']
+    assert pooled.errors == 1
+    saved = pandas.read_csv(pooled.logPath)
+    assert saved.loc[saved['Ticker'] == 'BAD', 'Error'].str.len().gt(0).all()
+
+
+def scannerFrames(count=40, days=3):
+    return {'T{0:02d}'.format(seed): synthetic_data.minuteBars(days, seed=seed, price=2.0 + seed % 7)
+            for seed in range(count)}
+
+
+def backTestDays(frames, exitTime, moneySpent=0, shareCount=0):
+    """
+    DipAndRip.backTest of every ticker-day, one row per trade with a Ticker column
+    """
+    rows = []
+    for ticker, frame in frames.items():
+        for date, day in frame.groupby('Date'):
+            result = strategies.DipAndRip(day, date, 10000000, exitTime).backTest(moneySpent, shareCount)
+            if result is not None:
+                result.insert(loc=0, column='Ticker', value=ticker)
+                rows.append(result)
+    return ordered(pandas.concat(rows))
+
+
+@pytest.mark.parametrize('exitTime, moneySpent, shareCount', [
+    (datetime.time(11, 0), 0, 100),
+    (datetime.time(9, 47), 1000, 0),
+])
+def testScannerMatchesBackTest(exitTime, moneySpent, shareCount):
+    frames = scannerFrames()
+    scanner = strategies.DipAndRipScanner(exitTime=exitTime, moneySpent=moneySpent, shareCount=shareCount)
+    scanner.run(ReplayEngine(frameSources(frames)))
+
+    expected = backTestDays(frames, exitTime, moneySpent, shareCount)
+    assert len(expected) == 40 * 3
+    assert expected['Shares Bought'].gt(0).any()
+    pandas.testing.assert_frame_equal(ordered(scanner.tradeFrame()), expected)
+
+
+def testScannerSkipsDayWithoutPremarket():
+    frame = synthetic_data.minuteBars(2, seed=3)
+    firstDate = frame['Date'].iloc[0]
+    # The first day starts at the open, the second still has its premarket
+    frame = frame[(frame['Date'] != firstDate) | (frame['Time'] >= datetime.time(9, 30))]
+
+    with pytest.raises(IndexError):
+        strategies.DipAndRip(frame[frame['Date'] == firstDate], firstDate, 10000000).backTest(shareCount=100)
+
+    scanner = strategies.DipAndRipScanner()
+    scanner.run(ReplayEngine(frameSources({'AAA': frame})))
+
+    trades = scanner.tradeFrame()
+    assert trades['Trade Date'].tolist() == [frame['Date'].iloc[-1]]
+    assert firstDate not in {alert['Datetime'].date() for alert in scanner.alerts}
+
+
+def testScannerStartsNewStateEachDay():
+    frame = synthetic_data.minuteBars(3, seed=5)
+    scanner = strategies.DipAndRipScanner()
+    dates = []
+
+    def track(bar):
+        dates.append(scanner.states['AAA'].date)
+
+    engine = ReplayEngine(frameSources({'AAA': frame}))
+    engine.subscribe(scanner)
+    engine.subscribe(track)
+    engine.run()
+
+    # The state follows the bar date and every day closes its own trade
+    assert dates == frame['Date'].tolist()
+    assert scanner.tradeFrame()['Trade Date'].tolist() == sorted(frame['Date'].unique())
+
+
+def testScannerAlerts():
+    frames = scannerFrames(10)
+    received = []
+    scanner = strategies.DipAndRipScanner(onAlert=received.append)
+    scanner.run(ReplayEngine(frameSources(frames)))
+
+    trades = scanner.tradeFrame()
+    kinds = [alert['Alert'] for alert in received]
+    assert received == scanner.alerts
+    # A reclaim for every entered trade, then one stop or exit alert per closed trade
+    assert kinds.count('Reclaim') == trades['Shares Bought'].gt(0).sum()
+    assert kinds.count('Stop') + kinds.count('Exit') == len(trades)
+    assert all(alert['Dip Low'] is not None for alert in received if alert['Alert'] == 'Reclaim')
+    assert [alert['Datetime'] for alert in received] == sorted(alert['Datetime'] for alert in received)
+
+
+def testScannerLatencyStats():
+    frames = scannerFrames(5, days=1)
+    scanner = strategies.DipAndRipScanner()
+    assert scanner.latencyStats() == {}
+
+    stats = scanner.run(ReplayEngine(frameSources(frames)))
+
+    assert stats['Bars'] == stats['Events'] == 5 * 960
+    assert len(scanner.latencies) == stats['Bars']
+    assert 0 < stats['Latency p50 us'] <= stats['Latency p90 us'] <= stats['Latency p99 us'] <= stats['Latency max us']
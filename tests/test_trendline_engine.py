@@ -0,0 +1,90 @@
+import numpy as np
+import pandas
+import pytest
+
+from utils import math_calcs, pivot_engine, trendline_engine
+
+
+def generateTrendLineLoop(pivots, reverse=False, marginOfError=trendline_engine.MARGIN_OF_ERROR):
+    """
+    Original Trendline object search anchoredTrendLine replaced
+    """
+    sortedPivots = sorted(pivots, key=lambda x: x[1], reverse=reverse)
+    p1 = sortedPivots[0]
+    prevDate = p1[0]
+    highScore = 0
+    pair = {}
+
+    for piv in sortedPivots[1:]:
+        if not (prevDate > piv[0]):
+            slope, yIntercept = math_calcs.getLineGraph(p1[2], p1[1], piv[2], piv[1])
+            trendPoint = 0
+            for p in sortedPivots:
+                if abs(yIntercept + slope * p[2] - p[1]) < ((yIntercept + slope * p[2]) * marginOfError):
+                    trendPoint += 1
+            if highScore < trendPoint:
+                highScore = trendPoint
+                pair = {'Date1': p1[0], 'Pivot1': p1[1], 'Date2': piv[0], 'Pivot2': piv[1]}
+                prevDate = pair['Date2']
+
+    return pair
+
+
+def pivotArrays(size, seed):
+    rng = np.random.default_rng(seed)
+    opens = 50 + np.linspace(0, 250, size) + rng.normal(0, 1, size).cumsum()
+    closes = opens + rng.normal(0, 1, size)
+    chart = pandas.DataFrame({'Counter': np.arange(size), 'Open': opens, 'Close': closes},
+                             index=pandas.date_range('2000-1-1', periods=size, freq='B'))
+    return pivot_engine.getPivotArrays(chart)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('reverse', [False, True])
+def testAnchoredMatchesLoop(seed, reverse):
+    support, resistance = pivotArrays(252 * (seed + 1), seed)
+    pivots = pivot_engine.toPivotTuples(resistance if reverse else support)
+
+    assert trendline_engine.anchoredTrendLine(pivots, reverse) == generateTrendLineLoop(pivots, reverse)
+
+
+@pytest.mark.parametrize('marginOfError', [0.01, 0.1, 0.5])
+def testAnchoredScoresMatchScoreLines(marginOfError):
+    _, prices, counters = pivotArrays(1000, 3)[0]
+    lines = len(prices) - 1
+    anchored = trendline_engine.scoreAnchoredLines(counters[0], prices[0], counters[1:], prices[1:], counters,
+                                                   prices, marginOfError)
+    expected = trendline_engine.scoreLines(np.full(lines, counters[0]), np.full(lines, prices[0]), counters[1:],
+                                           prices[1:], counters, prices, marginOfError)
+
+    assert np.array_equal(anchored, expected)
+
+
+def testTopLinesAllPairs():
+    support = pivotArrays(300, 5)[0]
+    _, prices, counters = support
+    first, second = np.triu_indices(len(prices), 1)
+    scores = trendline_engine.scoreLines(counters[first], prices[first], counters[second], prices[second],
+                                         counters, prices)
+
+    top = trendline_engine.findTopTrendLines(support, k=5, allPairs=True)
+
+    assert top['Score'].tolist() == sorted(scores.tolist(), reverse=True)[:5]
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def testHullEdgesBoundEveryPivot(reverse):
+    _, prices, counters = pivotArrays(1000, 7)[1 if reverse else 0]
+    hull = trendline_engine.convexHull(counters, prices, upper=reverse)
+
+    for a, b in zip(hull[:-1], hull[1:]):
+        slope = (prices[b] - prices[a]) / (counters[b] - counters[a])
+        side = prices - (prices[a] + slope * (counters - counters[a]))
+        assert np.all(side <= 1e-9) if reverse else np.all(side >= -1e-9)
+
+
+def testUnknownMode():
+    pivots = pivot_engine.toPivotTuples(pivotArrays(300, 1)[0])
+    assert trendline_engine.trendLine(pivots, mode='hull') == trendline_engine.hullTrendLine(pivots)
+    with pytest.raises(ValueError):
+        trendline_engine.trendLine(pivots, mode='fastest')
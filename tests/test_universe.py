@@ -0,0 +1,43 @@
+import numpy as np
+import pandas
+
+from utils import universe
+
+
+def screener():
+    return pandas.DataFrame({
+        'Ticker': ['AAA', 'BBB', 'CCC', 'DDD', 'EEE'],
+        'Sector': ['Technology', 'Energy', 'Technology', 'Healthcare', 'Energy'],
+        'Industry': ['Software', 'Oil', 'Semis', 'Biotech', 'Oil'],
+        'Market Cap': ['49.13B', '120.5M', '-', '2.1B', '85M'],
+        'Price': ['12.5', '3.10', '7', '-', '1,200.00'],
+        'Volume': ['2,844,685', '150,000', '1,000,000', '-', '5,000,000'],
+        'Change': ['1.31%', '-2.00%', '0.00%', '-', '10.5%'],
+    })
+
+
+def testParsesFinvizColumns():
+    data = universe.Universe(screener()).data
+
+    assert data['Market Cap'].tolist()[:2] == [49.13e9, 120.5e6]
+    assert np.isnan(data['Market Cap'].iloc[2])
+    assert data['Volume'].iloc[0] == 2844685
+    assert data['Price'].iloc[4] == 1200.0
+    assert data['Change'].iloc[1] == -2.0
+
+
+def testPositionsMatchBooleanMasks():
+    stocks = universe.Universe(screener())
+    data = stocks.data
+    mask = (data['Market Cap'] < 3e9) & (data['Volume'] >= 100000) & data['Sector'].isin(['Energy', 'Healthcare'])
+
+    assert stocks.tickers({'Market Cap': (None, 3e9), 'Volume': (100000, None)},
+                          {'Sector': ['Energy', 'Healthcare']}) == data['Ticker'][mask].tolist()
+
+
+def testRepeatedCategoryValues():
+    stocks = universe.Universe(screener())
+
+    assert stocks.tickers({'Volume': (0, None)}, {'Sector': ['Energy', 'Energy', 'Technology']}) == \
+        ['AAA', 'BBB', 'CCC', 'EEE']
+    assert stocks.tickers(categories={'Sector': ['Energy', 'Energy'], 'Industry': ['Oil', 'Oil']}) == ['BBB', 'EEE']
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas
+import pytest
+
+from utils.volume_index import VolumeIndex
+
+
+def dailyBars(volumes, start='2021-1-4'):
+    return pandas.DataFrame({'Datetime': pandas.bdate_range(start, periods=len(volumes)),
+                             'Volume': np.asarray(volumes, dtype='int64')})
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = VolumeIndex(str(tmp_path), window=5)
+    index.addBars('abc', dailyBars([100000] * 10 + [2000000] + [100000] * 5 + [600000]))
+    index.addBars('XYZ', dailyBars([1500000] * 17))
+    index.buildLookups()
+    return index
+
+
+def testTickersOnUppercasesFilter(index):
+    date = pandas.bdate_range('2021-1-4', periods=17)[10]
+    assert index.tickersOn(date) == ['ABC', 'XYZ']
+    assert index.tickersOn(date, tickers=['abc']) == ['ABC']
+    assert index.tickerDates(tickers=['abc']) == [('ABC', date.date())]
+
+
+def testRelativeVolumeDaysKept(index):
+    date = pandas.bdate_range('2021-1-4', periods=17)[16].date()
+    assert index.datesFor('abc', minVolume=None, minRelativeVolume=3.0)[-1] == date
+
+
+def testLooserCutThanIndexRaises(index):
+    with pytest.raises(ValueError):
+        index.tickersOn('2021-1-18', minVolume=500000)
+    with pytest.raises(ValueError):
+        index.datesFor('abc', minVolume=None, minRelativeVolume=2.0)
+    with pytest.raises(ValueError):
+        index.tickerDates(minVolume=None)
+    # One strict enough cut covers every day the query can match
+    index.tickerDates(minVolume=500000, minRelativeVolume=3.0)
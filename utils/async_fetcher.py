@@ -0,0 +1,220 @@
+from utils import stock_utils, metrics
+from utils.bar_store import DAILY, MINUTE
+from utils.response_cache import TD, ALPHA_VANTAGE
+from email.utils import parsedate_to_datetime
+import aiohttp
+import asyncio
+import datetime
+import json
+import random
+
+# Requests per second, burst size and open connections allowed by each provider
+PROVIDERS = {
+    TD: {
+        'baseUrl': 'https://api.tdameritrade.com/v1/marketdata',
+        'rate': 2.0,
+        'burst': 10,
+        'concurrency': 8,
+    },
+    ALPHA_VANTAGE: {
+        'baseUrl': 'https://www.alphavantage.co',
+        'rate': 5 / 60,
+        'burst': 5,
+        'concurrency': 2,
+    },
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retryAfter=None):
+        super().__init__(message)
+        self.retryAfter = retryAfter
+
+
+def retryAfterSeconds(value):
+    """
+    Seconds to wait from a Retry-After header, given as seconds or as an HTTP date
+    :return: Seconds, None when the header is missing or unreadable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Allow rate requests per second on average with bursts of up to capacity requests
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            # Created on first use so the lock belongs to the running event loop
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncMarketDataFetcher:
+    """
+    Fetch price history for many tickers at once over one pooled connection per provider,
+    throttled by a token bucket and a cap on requests in flight, retrying failures with backoff
+    """
+    def __init__(self, provider=TD, baseUrl=None, rate=None, burst=None, concurrency=None, retries=3, backoff=1.0,
+                 timeout=30):
+        settings = PROVIDERS[provider]
+        self.provider = provider
+        self.baseUrl = (baseUrl if baseUrl else settings['baseUrl']).rstrip('/')
+        self.bucket = TokenBucket(rate if rate else settings['rate'], burst if burst else settings['burst'])
+        self.concurrency = concurrency if concurrency else settings['concurrency']
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        self.retried = 0
+
+    async def request(self, session, semaphore, url, params=None, ticker=None):
+        """
+        GET a url, retrying throttling, server and connection errors with exponential backoff
+        A Retry-After header on a 429 or 503 sets the wait instead of the backoff
+        Time spent waiting for the token bucket and a free slot is recorded as QUEUE, the request itself as FETCH
+        :param ticker: Ticker the timings are recorded for
+        :return: Response body as bytes
+        """
+        for attempt in range(self.retries + 1):
+            with metrics.timer(metrics.QUEUE, ticker):
+                await self.bucket.acquire()
+                await semaphore.acquire()
+            try:
+                try:
+                    self.requests += 1
+                    metrics.increment('requests')
+                    with metrics.timer(metrics.FETCH, ticker):
+                        async with session.get(url, params=params) as response:
+                            if response.status in RETRY_STATUS:
+                                raise RetryableError('HTTP {0} for {1}'.format(response.status, url),
+                                                     retryAfterSeconds(response.headers.get('Retry-After')))
+                            response.raise_for_status()
+                            return await response.read()
+                finally:
+                    # Free the slot before backing off
+                    semaphore.release()
+            except (RetryableError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                metrics.increment('retries')
+                retryAfter = getattr(e, 'retryAfter', None)
+                await asyncio.sleep(retryAfter if retryAfter is not None
+                                    else self.backoff * 2 ** attempt * (1 + random.random()))
+
+    async def fetchOne(self, session, semaphore, symbol, startDate, endDate, frequency=DAILY, today=None):
+        """
+        Price history of one ticker as candle data
+        TD returns startDate to endDate, Alpha Vantage returns the month slice holding startDate counted from today
+        """
+        if self.provider == ALPHA_VANTAGE:
+            url = stock_utils.intradayUrlAV(symbol, startDate, self.baseUrl, today)
+            content = await self.request(session, semaphore, url, ticker=symbol)
+            with metrics.timer(metrics.PARSE, symbol):
+                return stock_utils.parseIntradayDataAV(content)
+
+        url = '{0}/{1}/pricehistory'.format(self.baseUrl, symbol)
+        content = await self.request(session, semaphore, url,
+                                     stock_utils.priceHistoryParamsTD(startDate, endDate, frequency), symbol)
+        with metrics.timer(metrics.PARSE, symbol):
+            return stock_utils.parsePriceHistoryTD(json.loads(content))
+
+    async def fetchManyAsync(self, tickers, startDate, endDate, frequency=DAILY, store=None, cache=None):
+        """
+        Fetch every ticker concurrently
+        :param tickers: List of tickers
+        :param startDate: Start datetime
+        :param endDate: End datetime
+        :param frequency: daily or minute
+        :param store: BarStore to write each result into
+        :param cache: ResponseCache checked before making any request
+        :return: Dict of ticker to candle dataframe, or to the exception that stopped it
+        """
+        frequency = MINUTE if self.provider == ALPHA_VANTAGE else frequency
+        today = datetime.date.today()
+        # Alpha Vantage slices are keyed by the slice and the day they were asked on, like getIntradayDataAV
+        if self.provider == ALPHA_VANTAGE:
+            cacheArgs = stock_utils.intradayCacheArgsAV(startDate, today)
+        else:
+            cacheArgs = {'start': startDate, 'end': endDate}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def fetch(ticker):
+                df = None
+                if cache is not None:
+                    df = cache.get(self.provider, ticker, frequency, cacheArgs['start'], cacheArgs['end'],
+                                   cacheArgs.get('part'))
+                if df is not None:
+                    metrics.increment('cache_hits')
+                else:
+                    df = await self.fetchOne(session, semaphore, ticker, startDate, endDate, frequency, today)
+                    if cache is not None:
+                        cache.put(self.provider, ticker, frequency, df=df, **cacheArgs)
+                if store is not None:
+                    # Parquet writes block, keep them off the event loop so other requests go on
+                    await asyncio.get_running_loop().run_in_executor(None, store.writeBars, ticker, df, frequency)
+                return df
+
+            results = await asyncio.gather(*[fetch(t) for t in tickers], return_exceptions=True)
+
+        return dict(zip(tickers, results))
+
+
+def fetchMany(tickers, startDate, endDate, provider=TD, frequency=DAILY, store=None, cache=None, **settings):
+    """
+    Fetch price history for a batch of tickers from a plain (non async) caller
+    :param tickers: List of tickers
+    :param startDate: Start datetime
+    :param endDate: End datetime
+    :param provider: td or alphavantage
+    :param frequency: daily or minute
+    :param store: BarStore to write each result into
+    :param cache: ResponseCache checked before making any request
+    :param settings: AsyncMarketDataFetcher settings such as baseUrl, rate, concurrency or retries
+    :return: Dict of ticker to candle dataframe, or to the exception that stopped it
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        fetcher = AsyncMarketDataFetcher(provider, **settings)
+        return asyncio.run(fetcher.fetchManyAsync(tickers, startDate, endDate, frequency, store, cache))
+
+    raise RuntimeError('fetchMany can not run inside a running event loop (e.g. Jupyter), '
+                       'await AsyncMarketDataFetcher(provider).fetchManyAsync(...) instead')
@@ -0,0 +1,289 @@
+import datetime
+
+import numpy as np
+import pandas
+
+from utils.bars import Bars
+
+LEDGER_COLUMNS = ['Start Date', 'End Date', 'Entry Price', 'Shares Bought', 'Exit Price', 'PnL', 'Win or Loss']
+
+
+def crossoverStates(fastLine, slowLine):
+    """
+    Whether the fast line is treated as above the slow line on every bar
+    The state only flips when the fast line closes strictly above (or below) the slow line,
+    equal or missing values keep the previous state
+    :param fastLine: Array of the fast moving average
+    :param slowLine: Array of the slow moving average
+    :return: Array of 1 (above) and -1 (below)
+    """
+    diff = np.asarray(fastLine, dtype=np.float64) - np.asarray(slowLine, dtype=np.float64)
+    state = np.where(diff > 0, 1, np.where(diff < 0, -1, 0)).astype(np.int8)
+    if len(state):
+        state[0] = -1 if diff[0] < 0 else 1
+
+    lastSet = np.where(state != 0, np.arange(len(state)), 0)
+    np.maximum.accumulate(lastSet, out=lastSet)
+    return state[lastSet]
+
+
+def crossoverLedger(index, opens, closes, fastLine, slowLine, moneySpent=0, shareCount=0):
+    """
+    Trade ledger of a moving average crossover strategy: buy at the open when the fast line crosses above
+    the slow line, sell at the close when it crosses back below
+    :param index: Dates of the bars
+    :param opens: Array of open prices
+    :param closes: Array of close prices
+    :param fastLine: Array of the fast moving average
+    :param slowLine: Array of the slow moving average
+    :param moneySpent: Money put in each trade when shareCount is not given
+    :param shareCount: Shares bought each trade
+    :return: Dataframe indexed by Start Date, the first trade is dropped like EMACrossoverTrading.backTest did
+    """
+    opens = np.asarray(opens, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    state = crossoverStates(fastLine, slowLine)
+
+    flips = np.flatnonzero(state[1:] != state[:-1]) + 1
+    entries = flips[state[flips] == 1]
+    exits = flips[state[flips] == -1]
+
+    # Every exit closes the latest entry before it, an exit before any entry uses the empty position
+    lastEntry = np.searchsorted(entries, exits) - 1
+    hasEntry = lastEntry >= 0
+    entryBars = entries[np.maximum(lastEntry, 0)] if len(entries) else np.zeros(len(exits), dtype=np.int64)
+
+    entryPrices = np.where(hasEntry, opens[entryBars] if len(entries) else 0.0, 0.0)
+    exitPrices = closes[exits]
+    if shareCount:
+        sharesBought = np.where(hasEntry, float(shareCount), 0.0)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharesBought = np.where(hasEntry, moneySpent // np.where(hasEntry, entryPrices, 1.0), 0.0)
+
+    dates = pandas.DatetimeIndex(index)
+    startDates = np.empty(len(exits), dtype=object)
+    startDates[:] = datetime.date.today()
+    if hasEntry.any():
+        startDates[hasEntry] = dates[entryBars[hasEntry]].to_pydatetime()
+
+    pnl = (exitPrices - entryPrices) * sharesBought
+    ledger = pandas.DataFrame({
+        'Start Date': startDates,
+        'End Date': dates[exits].to_pydatetime() if len(exits) else [],
+        'Entry Price': entryPrices,
+        'Shares Bought': sharesBought,
+        'Exit Price': exitPrices,
+        'PnL': pnl,
+        'Win or Loss': np.where(exitPrices - entryPrices > 0, 'Win', 'Loss'),
+    }, columns=LEDGER_COLUMNS)
+
+    return ledger.set_index('Start Date').iloc[1:]
+
+
+# ====== Dip and Rip ======== #
+
+MARKET_OPEN = 9 * 3600 + 30 * 60
+MARKET_CLOSE = 16 * 3600
+DEFAULT_ENTRY_TIME = datetime.time(7, 0)
+
+DIP_AND_RIP_COLUMNS = ['Trade Date', 'Start Time', 'End Time', 'Entry Price', 'Shares Bought', 'High Price',
+                       'High Price Time', 'Premarket Volume', 'Stop Loss', 'Time To Reach High Price', 'Max Profit',
+                       'Max Loss', 'Time Elapsed Till Exit']
+
+
+def secondsOfDay(data):
+    """
+    Seconds since midnight of every candle, from the Datetime column when it holds datetimes else from Time
+    :param data: Candle data or Bars
+    :return: int64 array
+    """
+    if isinstance(data, Bars):
+        return data.secondsOfDay()
+
+    if 'Datetime' in data.columns and pandas.api.types.is_datetime64_any_dtype(data['Datetime']):
+        stamps = data['Datetime'].dt
+        return (stamps.hour * 3600 + stamps.minute * 60 + stamps.second).to_numpy(dtype=np.int64)
+
+    return np.array([t.hour * 3600 + t.minute * 60 + t.second for t in data['Time']], dtype=np.int64)
+
+
+def toTime(seconds):
+    seconds = int(seconds)
+    return datetime.time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def _groupStarts(groups):
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = groups[1:] != groups[:-1]
+    return starts
+
+
+def _firstPerGroup(mask, groups):
+    """
+    Position of the first True row of every group, -1 where a group has none
+    """
+    positions = np.flatnonzero(mask)
+    first = np.full(groups.max() + 1 if len(groups) else 0, -1, dtype=np.int64)
+    found, index = np.unique(groups[positions], return_index=True)
+    first[found] = positions[index]
+    return first
+
+
+def dipAndRipTrades(groups, seconds, highs, lows, volumes, exitTime=datetime.time(11, 0), moneySpent=0, shareCount=0):
+    """
+    Dip and Rip entry, stop and exit over any number of stacked ticker-days with running max/min arrays
+    Per day: the trade is entered on the first regular bar that trades above the premarket high, the stop
+    trails the lowest low seen so far, the trade ends on the first bar that breaks the stop after entry or
+    on the first bar past exitTime that does not break it. Same rules as the old row by row loop.
+    :param groups: Group number of every candle, rows sorted by group then time
+    :param seconds: Seconds since midnight of every candle
+    :param highs: High prices
+    :param lows: Low prices
+    :param volumes: Volumes
+    :param exitTime: Time the trade is closed if the stop was not hit
+    :param moneySpent: Money put in the trade when shareCount is not given
+    :param shareCount: Shares bought
+    :return: Dict of arrays, one entry per group that reached an exit, 'Group' holds the group number
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    highs = np.asarray(highs, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.int64)
+    groupCount = groups.max() + 1 if len(groups) else 0
+    exitSeconds = exitTime.hour * 3600 + exitTime.minute * 60 + exitTime.second
+
+    premarket = seconds < MARKET_OPEN
+    regular = (seconds >= MARKET_OPEN) & (seconds < MARKET_CLOSE)
+
+    # Premarket high (first bar reaching it) and volume of every group
+    pmGroups = groups[premarket]
+    pmHighs = highs[premarket]
+    pmHigh = np.full(groupCount, -np.inf)
+    np.maximum.at(pmHigh, pmGroups, pmHighs)
+    pmHighSeconds = np.zeros(groupCount, dtype=np.int64)
+    atHigh = _firstPerGroup(pmHighs == pmHigh[pmGroups], pmGroups) if len(pmGroups) else np.empty(0, dtype=np.int64)
+    hasPremarket = np.zeros(groupCount, dtype=bool)
+    hasPremarket[:len(atHigh)] = atHigh >= 0
+    pmHighSeconds[:len(atHigh)][atHigh >= 0] = seconds[premarket][atHigh[atHigh >= 0]]
+    pmVolume = np.bincount(pmGroups, weights=volumes[premarket], minlength=groupCount).astype(np.int64)
+
+    g = groups[regular]
+    sec = seconds[regular]
+    high = highs[regular]
+    low = lows[regular]
+    if not len(g):
+        return {'Group': np.empty(0, dtype=np.int64)}
+    starts = _groupStarts(g)
+    dayHigh = pmHigh[g]
+
+    crossed = high > dayHigh
+    entered = pandas.Series(crossed).groupby(g).cummax().to_numpy()
+
+    # Stop level before each bar is the lowest low of the earlier regular bars
+    runningLow = pandas.Series(low).groupby(g).cummin().to_numpy()
+    stopLevel = np.empty(len(low))
+    stopLevel[1:] = runningLow[:-1]
+    stopLevel[starts] = low[starts]
+    stopHit = low < stopLevel
+
+    timeHit = ~stopHit & (sec > exitSeconds)
+    exits = _firstPerGroup((stopHit & entered) | timeHit, g)
+    entries = _firstPerGroup(crossed, g)
+
+    traded = np.flatnonzero((exits >= 0) & hasPremarket[:len(exits)])
+    x = exits[traded]
+    e = entries[traded]
+    isEntered = (e >= 0) & (e <= x)
+    isStop = stopHit[x]
+
+    # Last bar that made a new high, counting the premarket high as the starting high
+    runningHigh = np.maximum(pandas.Series(high).groupby(g).cummax().to_numpy(), dayHigh)
+    previousHigh = np.empty(len(high))
+    previousHigh[1:] = runningHigh[:-1]
+    previousHigh[starts] = dayHigh[starts]
+    newHigh = np.where(high > previousHigh, np.arange(len(high)), -1)
+    lastNewHigh = pandas.Series(newHigh).groupby(g).cummax().to_numpy()[x]
+
+    entryPrices = np.where(isEntered, high[np.maximum(e, 0)], 0.0)
+    if shareCount:
+        sharesBought = np.where(isEntered, float(shareCount), 0.0)
+    else:
+        sharesBought = np.where(isEntered, moneySpent // np.where(isEntered, entryPrices, 1.0), 0.0)
+    defaultEntry = DEFAULT_ENTRY_TIME.hour * 3600 + DEFAULT_ENTRY_TIME.minute * 60
+    entrySeconds = np.where(isEntered, sec[np.maximum(e, 0)], defaultEntry)
+    highPrices = runningHigh[x]
+    highSeconds = np.where(lastNewHigh >= 0, sec[np.maximum(lastNewHigh, 0)], pmHighSeconds[traded])
+    stopLoss = stopLevel[x]
+
+    return {
+        'Group': traded,
+        'Start Seconds': entrySeconds,
+        'End Seconds': np.where(isStop, sec[x], exitSeconds),
+        'Entry Price': entryPrices,
+        'Shares Bought': sharesBought,
+        'High Price': highPrices,
+        'High Seconds': highSeconds,
+        'Premarket Volume': pmVolume[traded],
+        'Stop Loss': stopLoss,
+        'Max Profit': (highPrices - entryPrices) * sharesBought,
+        'Max Loss': (stopLoss - entryPrices) * sharesBought,
+    }
+
+
+def dipAndRipFrame(trades, tradeDates):
+    """
+    Shape dipAndRipTrades output like DipAndRip.backTest results
+    :param trades: Output of dipAndRipTrades
+    :param tradeDates: Trade date of every trade
+    :return: Dataframe with the DipAndRip backtest columns
+    """
+    startSeconds = trades['Start Seconds']
+    return pandas.DataFrame({
+        'Trade Date': list(tradeDates),
+        'Start Time': [toTime(s) for s in startSeconds],
+        'End Time': [toTime(s) for s in trades['End Seconds']],
+        'Entry Price': trades['Entry Price'],
+        'Shares Bought': trades['Shares Bought'],
+        'High Price': trades['High Price'],
+        'High Price Time': [toTime(s) for s in trades['High Seconds']],
+        'Premarket Volume': trades['Premarket Volume'],
+        'Stop Loss': trades['Stop Loss'],
+        'Time To Reach High Price': pandas.to_timedelta(trades['High Seconds'] - startSeconds, unit='s'),
+        'Max Profit': trades['Max Profit'],
+        'Max Loss': trades['Max Loss'],
+        'Time Elapsed Till Exit': pandas.to_timedelta(trades['End Seconds'] - startSeconds, unit='s'),
+    }, columns=DIP_AND_RIP_COLUMNS)
+
+
+def dipAndRipBatch(data, exitTime=datetime.time(11, 0), moneySpent=0, shareCount=0):
+    """
+    Backtest Dip and Rip on a stacked frame of many tickers and days in one call
+    :param data: Minute candles with Datetime, High, Low, Volume and optionally Ticker
+    :param exitTime: Time the trade is closed if the stop was not hit
+    :param moneySpent: Money put in each trade when shareCount is not given
+    :param shareCount: Shares bought each trade
+    :return: One row per ticker-day that reached an exit, with Ticker (when given) and the backTest columns
+    """
+    keys = pandas.DataFrame({'Trade Date': pandas.to_datetime(data['Datetime']).dt.normalize().to_numpy()})
+    if 'Ticker' in data.columns:
+        keys.insert(loc=0, column='Ticker', value=data['Ticker'].to_numpy())
+    keys['Seconds'] = secondsOfDay(data)
+
+    order = np.lexsort([keys[c].to_numpy() for c in reversed(keys.columns)])
+    keys = keys.iloc[order].reset_index(drop=True)
+    groupKeys = [c for c in keys.columns if c != 'Seconds']
+    groups = keys.groupby(groupKeys, sort=False).ngroup().to_numpy()
+
+    trades = dipAndRipTrades(groups, keys['Seconds'].to_numpy(), data['High'].to_numpy()[order],
+                             data['Low'].to_numpy()[order], data['Volume'].to_numpy()[order],
+                             exitTime, moneySpent, shareCount)
+
+    firstRows = keys.drop_duplicates(groupKeys).set_index(groups[_groupStarts(groups)])
+    tradeKeys = firstRows.loc[trades['Group']]
+    result = dipAndRipFrame(trades, tradeKeys['Trade Date'].dt.date)
+    if 'Ticker' in tradeKeys.columns:
+        result.insert(loc=0, column='Ticker', value=tradeKeys['Ticker'].to_numpy())
+
+    return result
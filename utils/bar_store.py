@@ -0,0 +1,223 @@
+import datetime
+import os
+
+import numpy as np
+import pandas
+
+from utils import metrics
+
+DEFAULT_STORE_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/bar_store'
+
+EASTERN = 'America/New_York'
+
+DAILY = 'daily'
+MINUTE = 'minute'
+
+BAR_COLUMNS = ['Datetime', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+BAR_TYPES = {
+    'Open': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Close': 'float64',
+    'Volume': 'int64',
+}
+
+
+def toEasternNaive(values):
+    """
+    Convert epoch milliseconds, tz-aware or naive datetimes to naive Eastern wall clock datetimes
+    :param values: Series of timestamps
+    :return: Series of datetime64[ns] in Eastern time without tz info
+    """
+    if pandas.api.types.is_integer_dtype(values) or pandas.api.types.is_float_dtype(values):
+        values = pandas.to_datetime(values, unit='ms', utc=True)
+    else:
+        values = pandas.to_datetime(values)
+
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert(EASTERN).dt.tz_localize(None)
+
+    return values
+
+
+def normalizeBars(df):
+    """
+    Reduce a TD, Alpha Vantage or excel frame to the typed store columns
+    :param df: Candle data with a Datetime column, a Date column or a DatetimeIndex, or Bars
+    :return: Dataframe with Datetime, Open, High, Low, Close, Volume sorted by Datetime
+    """
+    if hasattr(df, 'toFrame'):
+        df = df.toFrame(deriveDateTime=False)
+
+    if 'Datetime' in df.columns:
+        stamps = df['Datetime']
+    elif 'Date' in df.columns:
+        stamps = df['Date']
+    elif isinstance(df.index, pandas.DatetimeIndex):
+        stamps = df.index.to_series()
+    else:
+        raise ValueError('Candle data needs a Datetime column, Date column or DatetimeIndex')
+
+    bars = pandas.DataFrame({'Datetime': toEasternNaive(pandas.Series(stamps).reset_index(drop=True))})
+    for column, dtype in BAR_TYPES.items():
+        bars[column] = df[column].to_numpy().astype(dtype)
+
+    bars = bars.sort_values('Datetime', kind='mergesort')
+    bars = bars.drop_duplicates('Datetime', keep='last')
+
+    return bars.reset_index(drop=True)
+
+
+def toDailyChart(df):
+    """
+    Shape daily bars the way getTDData returns them: Counter column and a Date index
+    :param df: Bars read from the store
+    :return: Dataframe indexed by Date
+    """
+    df = df.copy()
+    df.insert(loc=0, column='Counter', value=np.arange(len(df)))
+    df['Date'] = df['Datetime'].dt.normalize()
+    df = df.set_index('Date')
+    return df
+
+
+class BarStore:
+    """
+    Local parquet store of OHLCV bars partitioned by ticker and date
+    Layout: {root}/{frequency}/{ticker}/{partition}.parquet
+    Daily bars are partitioned per year, minute bars per trading day
+    """
+    def __init__(self, root=DEFAULT_STORE_PATH):
+        self.root = root
+        self.listeners = []
+
+    def __getstate__(self):
+        # Listeners belong to this process, workers get a plain store
+        state = self.__dict__.copy()
+        state['listeners'] = []
+        return state
+
+    def addListener(self, listener):
+        """
+        Call listener(symbol, frequency, partitions) after every write
+        """
+        self.listeners.append(listener)
+
+    def tickerPath(self, symbol, frequency=DAILY):
+        return os.path.join(self.root, frequency, symbol.upper())
+
+    def partitionPath(self, symbol, partition, frequency=DAILY):
+        return os.path.join(self.tickerPath(symbol, frequency), '{0}.parquet'.format(partition))
+
+    @staticmethod
+    def partitionKeys(datetimes, frequency=DAILY):
+        """
+        Partition key of each bar
+        :param datetimes: Series of datetimes
+        :param frequency: daily or minute
+        :return: Series of partition keys
+        """
+        if frequency == DAILY:
+            return datetimes.dt.strftime('%Y')
+        return datetimes.dt.strftime('%Y-%m-%d')
+
+    def tickers(self, frequency=DAILY):
+        path = os.path.join(self.root, frequency)
+        if not os.path.isdir(path):
+            return []
+        return sorted(os.listdir(path))
+
+    def partitions(self, symbol, frequency=DAILY):
+        path = self.tickerPath(symbol, frequency)
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-len('.parquet')] for f in os.listdir(path) if f.endswith('.parquet'))
+
+    def readPartition(self, symbol, partition, frequency=DAILY):
+        return pandas.read_parquet(self.partitionPath(symbol, partition, frequency))
+
+    def writeBars(self, symbol, df, frequency=DAILY):
+        """
+        Merge bars into the store. Existing bars with the same Datetime are replaced
+        Each partition is written to a temp file and swapped in so readers never see half a file
+        :param symbol: Ticker
+        :param df: Candle data in any of the fetcher formats
+        :param frequency: daily or minute
+        :return: List of partitions written
+        """
+        bars = normalizeBars(df)
+        if bars.empty:
+            return []
+
+        os.makedirs(self.tickerPath(symbol, frequency), exist_ok=True)
+        written = []
+
+        with metrics.timer(metrics.WRITE, symbol):
+            for partition, partitionBars in bars.groupby(self.partitionKeys(bars['Datetime'], frequency), sort=True):
+                path = self.partitionPath(symbol, partition, frequency)
+                if os.path.exists(path):
+                    partitionBars = pandas.concat([pandas.read_parquet(path), partitionBars])
+                    partitionBars = partitionBars.sort_values('Datetime', kind='mergesort')
+                    partitionBars = partitionBars.drop_duplicates('Datetime', keep='last')
+
+                tmpPath = '{0}.tmp'.format(path)
+                partitionBars.reset_index(drop=True).to_parquet(tmpPath, index=False)
+                os.replace(tmpPath, path)
+                written.append(partition)
+        metrics.increment('bars_written', len(bars))
+
+        for listener in self.listeners:
+            listener(symbol.upper(), frequency, written)
+
+        return written
+
+    def readBars(self, symbol, frequency=DAILY, start=None, end=None, deriveDateTime=True):
+        """
+        Read bars for a ticker between start and end (inclusive)
+        :param symbol: Ticker
+        :param frequency: daily or minute
+        :param start: Date or datetime to start from
+        :param end: Date or datetime to end at. A plain date includes the whole day
+        :param deriveDateTime: Add the Date and Time columns the strategies expect
+        :return: Dataframe of bars
+        """
+        partitions = self.partitions(symbol, frequency)
+        if start is not None:
+            startKey = self.partitionKeys(pandas.Series([pandas.Timestamp(start)]), frequency)[0]
+            partitions = [p for p in partitions if p >= startKey]
+        if end is not None:
+            endKey = self.partitionKeys(pandas.Series([pandas.Timestamp(end)]), frequency)[0]
+            partitions = [p for p in partitions if p <= endKey]
+
+        if not partitions:
+            df = pandas.DataFrame({column: pandas.Series(dtype=dtype) for column, dtype in BAR_TYPES.items()})
+            df.insert(loc=0, column='Datetime', value=pandas.Series(dtype='datetime64[ns]'))
+        else:
+            df = pandas.concat([self.readPartition(symbol, p, frequency) for p in partitions], ignore_index=True)
+
+        if start is not None:
+            df = df[df['Datetime'] >= pandas.Timestamp(start)]
+        if end is not None:
+            wholeDay = not isinstance(end, datetime.datetime)
+            end = pandas.Timestamp(end)
+            if wholeDay:
+                end = end + pandas.Timedelta(days=1) - pandas.Timedelta(1)
+            df = df[df['Datetime'] <= end]
+
+        df = df.reset_index(drop=True)
+
+        if deriveDateTime:
+            df['Date'] = df['Datetime'].dt.date
+            df['Time'] = df['Datetime'].dt.time
+
+        return df
+
+    def readDay(self, symbol, date):
+        """
+        Read one day of minute bars in the same shape as readIntradayDataAV
+        :param symbol: Ticker
+        :param date: Trade date
+        :return: Dataframe of minute bars
+        """
+        return self.readBars(symbol, MINUTE, date, date)
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas
+
+from utils import sessions
+from utils.bar_store import MINUTE, toEasternNaive
+
+PRICE_FIELDS = ['Open', 'High', 'Low', 'Close']
+FIELDS = ['Timestamp'] + PRICE_FIELDS + ['Volume']
+
+NS_PER_SECOND = 10 ** 9
+NS_PER_DAY = 24 * 3600 * NS_PER_SECOND
+
+
+def barDtype(priceType=np.float64):
+    """
+    Record layout of Bars.toRecords
+    """
+    return np.dtype([('Timestamp', np.int64)] + [(field, priceType) for field in PRICE_FIELDS] +
+                    [('Volume', np.int64)])
+
+
+class Bars:
+    """
+    Compact candles of one ticker: contiguous int64 Timestamp, float Open/High/Low/Close and int64 Volume columns,
+    oldest first. Timestamps are nanoseconds since epoch of the Eastern wall clock, the naive Datetime the BarStore
+    keeps, so Datetime is a zero copy view and session math needs no timezone conversion
+    Slicing by position, day or session returns views sharing the same memory
+    With float32 prices a minute bar takes 32 bytes against several hundred for a chart with Date and Time objects
+    """
+    __slots__ = ['Timestamp', 'Open', 'High', 'Low', 'Close', 'Volume', 'ticker']
+
+    columns = ('Datetime', 'Open', 'High', 'Low', 'Close', 'Volume')
+
+    def __init__(self, timestamps, opens, highs, lows, closes, volumes, ticker=None, priceType=None):
+        """
+        :param timestamps: int64 nanoseconds of the Eastern wall clock, or datetime64 values
+        :param priceType: Convert the prices to this dtype, e.g. np.float32. When None the four price columns get
+                          the common float dtype of the inputs, float64 if any of them is not float
+        """
+        timestamps = np.asarray(timestamps)
+        if timestamps.dtype.kind == 'M':
+            timestamps = timestamps.astype('datetime64[ns]', copy=False).view(np.int64)
+        self.Timestamp = timestamps.astype(np.int64, copy=False)
+
+        prices = [np.asarray(values) for values in [opens, highs, lows, closes]]
+        if priceType is None:
+            priceType = np.result_type(*prices) if all(values.dtype.kind == 'f' for values in prices) else np.float64
+        for field, values in zip(PRICE_FIELDS, prices):
+            setattr(self, field, values.astype(priceType, copy=False))
+        self.Volume = np.asarray(volumes, dtype=np.int64)
+        self.ticker = ticker
+
+    @classmethod
+    def fromFrame(cls, df, ticker=None, priceType=np.float64):
+        """
+        :param df: Candles with a Datetime column (naive Eastern, tz-aware or epoch ms) or a DatetimeIndex
+        :return: Bars sorted by time
+        """
+        stamps = df['Datetime'] if 'Datetime' in df.columns else df.index.to_series()
+        stamps = toEasternNaive(stamps).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        order = None if np.all(stamps[1:] >= stamps[:-1]) else np.argsort(stamps, kind='stable')
+
+        def column(field, dtype):
+            values = df[field].to_numpy(dtype=dtype)
+            return values if order is None else values[order]
+
+        return cls(stamps if order is None else stamps[order], *[column(field, priceType) for field in PRICE_FIELDS],
+                   column('Volume', np.int64), ticker=ticker)
+
+    @classmethod
+    def fromCandles(cls, candles, ticker=None, priceType=np.float64):
+        """
+        :param candles: TD price history candles, dicts with epoch ms datetime, open, high, low, close and volume
+        """
+        frame = pandas.DataFrame(candles)
+        frame = frame.rename(columns={'datetime': 'Datetime', 'open': 'Open', 'high': 'High', 'low': 'Low',
+                                      'close': 'Close', 'volume': 'Volume'})
+        if frame.empty:
+            return cls.fromRecords(np.empty(0, dtype=barDtype(priceType)), ticker)
+        frame['Datetime'] = frame['Datetime'].astype(np.int64)
+        return cls.fromFrame(frame, ticker, priceType)
+
+    @classmethod
+    def fromRecords(cls, records, ticker=None):
+        return cls(*[np.ascontiguousarray(records[field]) for field in FIELDS], ticker=ticker)
+
+    def toRecords(self):
+        """
+        :return: Structured array with one record per bar, e.g. to np.save a whole chart in one buffer
+        """
+        records = np.empty(len(self), dtype=barDtype(self.Open.dtype))
+        for field in FIELDS:
+            records[field] = getattr(self, field)
+        return records
+
+    def toFrame(self, deriveDateTime=True):
+        """
+        :param deriveDateTime: Add the Date and Time columns the strategies expect
+        :return: Dataframe shaped like BarStore.readBars
+        """
+        df = pandas.DataFrame({'Datetime': self.datetimes, 'Open': self.Open, 'High': self.High, 'Low': self.Low,
+                               'Close': self.Close, 'Volume': self.Volume})
+        if deriveDateTime:
+            df['Date'] = df['Datetime'].dt.date
+            df['Time'] = df['Datetime'].dt.time
+        return df
+
+    def __len__(self):
+        return len(self.Timestamp)
+
+    def __getitem__(self, key):
+        """
+        Column by name (Datetime gives datetime64 values), or the bars at a slice, mask or positions
+        """
+        if isinstance(key, str):
+            return self.datetimes if key == 'Datetime' else getattr(self, key)
+        return Bars(*[getattr(self, field)[key] for field in FIELDS], ticker=self.ticker)
+
+    def take(self, positions):
+        return self[np.asarray(positions)]
+
+    def __repr__(self):
+        first = self.datetimes[0] if len(self) else None
+        last = self.datetimes[-1] if len(self) else None
+        return 'Bars({0}, {1} bars, {2} to {3})'.format(self.ticker, len(self), first, last)
+
+    @property
+    def datetimes(self):
+        return self.Timestamp.view('datetime64[ns]')
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in FIELDS)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def secondsOfDay(self):
+        return self.Timestamp % NS_PER_DAY // NS_PER_SECOND
+
+    def minutesOfDay(self):
+        return self.Timestamp % NS_PER_DAY // sessions.NS_PER_MINUTE
+
+    def dayStarts(self):
+        """
+        :return: Days held (datetime64[D]) and the position each starts at
+        """
+        days = self.Timestamp // NS_PER_DAY
+        if not len(days):
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        return days[starts].astype('datetime64[D]'), starts
+
+    def day(self, date):
+        """
+        View of the bars of one day
+        """
+        start = np.datetime64(pandas.Timestamp(date).date(), 'ns').astype(np.int64)
+        first, last = np.searchsorted(self.Timestamp, [start, start + NS_PER_DAY], side='left')
+        return self[first:last]
+
+    def iterDays(self):
+        """
+        :return: Generator of (date, view of the day's bars)
+        """
+        days, starts = self.dayStarts()
+        ends = np.r_[starts[1:], len(self)]
+        for day, start, end in zip(days.tolist(), starts.tolist(), ends.tolist()):
+            yield day, self[start:end]
+
+    def sessions(self):
+        """
+        Premarket, regular and after hours bars of a single day as views
+        """
+        return sessions.SessionIndex(self).split()
+
+
+def readBars(store, ticker, frequency=MINUTE, start=None, end=None, priceType=np.float64):
+    """
+    Read stored bars straight into Bars, without building the Date and Time columns
+    """
+    return Bars.fromFrame(store.readBars(ticker, frequency, start, end, deriveDateTime=False), ticker.upper(),
+                          priceType)
+
+
+def loadUniverse(store, tickers=None, start=None, end=None, frequency=MINUTE, priceType=np.float32):
+    """
+    Bars of many tickers, float32 prices by default so a year of minute bars for thousands of tickers fits in memory
+    :return: Dict of ticker to Bars
+    """
+    tickers = tickers if tickers is not None else store.tickers(frequency)
+    return {ticker.upper(): readBars(store, ticker, frequency, start, end, priceType) for ticker in tickers}
+
@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas
+
+from utils import stock_utils, async_fetcher
+from utils.bar_store import DAILY, toDailyChart
+
+LEDGER_FILE = 'sync_ledger.json'
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def toDate(value):
+    return pandas.Timestamp(value).date()
+
+
+def mergeRanges(ranges):
+    """
+    Merge overlapping or touching date ranges
+    :param ranges: List of (start date, end date), both inclusive
+    :return: Sorted list of disjoint ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missingRanges(held, start, end):
+    """
+    Parts of start to end not covered by the held ranges
+    :param held: Sorted disjoint list of (start date, end date)
+    :param start: First date wanted
+    :param end: Last date wanted
+    :return: List of (start date, end date) gaps
+    """
+    gaps = []
+    cursor = start
+
+    for heldStart, heldEnd in held:
+        if heldEnd < cursor:
+            continue
+        if heldStart > end:
+            break
+        if heldStart > cursor:
+            gaps.append((cursor, min(heldStart - ONE_DAY, end)))
+        cursor = max(cursor, heldEnd + ONE_DAY)
+        if cursor > end:
+            break
+
+    if cursor <= end:
+        gaps.append((cursor, end))
+
+    return gaps
+
+
+def hasTradingDays(start, end):
+    """
+    Whether start to end holds a weekday, ranges of only weekend days never have bars
+    """
+    return np.busday_count(start, end + ONE_DAY) > 0
+
+
+def dayBounds(start, end):
+    """
+    Datetimes covering the whole of the first and last day, used for the API requests
+    """
+    return datetime.datetime.combine(start, datetime.time(0, 0)), datetime.datetime.combine(end, datetime.time(23, 59))
+
+
+class DataSync:
+    """
+    Keep a BarStore up to date by only fetching the days it does not hold yet
+    A json ledger next to the store records which (ticker, frequency) date ranges were already fetched,
+    so they are not asked for again. A range is only recorded when bars came back or it is all weekend,
+    an empty answer for weekdays may be a throttled or failed request and is retried on the next sync
+    Bars are written to the store before the ledger, a crash in between only means refetching the gap
+    """
+    def __init__(self, store, ledgerPath=None, cache=None, loader=None):
+        """
+        :param store: BarStore the bars are written to
+        :param ledgerPath: Json ledger, defaults to sync_ledger.json in the store root
+        :param cache: ResponseCache passed to the fetchers
+        :param loader: Function (symbol, start datetime, end datetime, frequency) returning candle data,
+                       defaults to the TD price history
+        """
+        self.store = store
+        self.ledgerPath = ledgerPath if ledgerPath else os.path.join(store.root, LEDGER_FILE)
+        self.cache = cache
+        self.loader = loader
+        self.ledger = self.loadLedger()
+
+    def loadLedger(self):
+        if not os.path.exists(self.ledgerPath):
+            return {}
+
+        with open(self.ledgerPath) as f:
+            raw = json.load(f)
+
+        return {frequency: {ticker: [(toDate(s), toDate(e)) for s, e in ranges] for ticker, ranges in tickers.items()}
+                for frequency, tickers in raw.items()}
+
+    def saveLedger(self):
+        raw = {frequency: {ticker: [[s.isoformat(), e.isoformat()] for s, e in ranges]
+                           for ticker, ranges in tickers.items()}
+               for frequency, tickers in self.ledger.items()}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.ledgerPath)), exist_ok=True)
+        tmpPath = '{0}.tmp'.format(self.ledgerPath)
+        with open(tmpPath, 'w') as f:
+            json.dump(raw, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, self.ledgerPath)
+
+    def heldRanges(self, symbol, frequency=DAILY):
+        return self.ledger.get(frequency, {}).get(symbol.upper(), [])
+
+    def markHeld(self, symbol, start, end, frequency=DAILY):
+        """
+        Record start to end as fetched. Today is never marked since its bars are not final yet
+        """
+        end = min(end, datetime.date.today() - ONE_DAY)
+        if end < start:
+            return
+
+        tickers = self.ledger.setdefault(frequency, {})
+        tickers[symbol.upper()] = mergeRanges(self.heldRanges(symbol, frequency) + [(start, end)])
+
+    def gaps(self, symbol, start, end, frequency=DAILY):
+        """
+        Date ranges between start and end that still need fetching
+        :return: List of (start date, end date)
+        """
+        return missingRanges(self.heldRanges(symbol, frequency), toDate(start), toDate(end))
+
+    def fetch(self, symbol, start, end, frequency=DAILY):
+        if self.loader is not None:
+            return self.loader(symbol, start, end, frequency)
+        return stock_utils.fetchPriceHistoryTD(symbol, start, end, frequency, self.cache)
+
+    def sync(self, symbol, start, end, frequency=DAILY):
+        """
+        Fetch the gaps of one ticker into the store
+        :param symbol: Ticker
+        :param start: First date wanted
+        :param end: Last date wanted
+        :param frequency: daily or minute
+        :return: Number of bars fetched
+        """
+        fetched = 0
+
+        try:
+            for gapStart, gapEnd in self.gaps(symbol, start, end, frequency):
+                if hasTradingDays(gapStart, gapEnd):
+                    df = self.fetch(symbol, *dayBounds(gapStart, gapEnd), frequency)
+                    if df is None or df.empty:
+                        continue
+                    self.store.writeBars(symbol, df, frequency)
+                    fetched += len(df)
+                self.markHeld(symbol, gapStart, gapEnd, frequency)
+        finally:
+            # Keep the ranges already written when a later gap fails
+            self.saveLedger()
+
+        return fetched
+
+    def syncMany(self, tickers, start, end, frequency=DAILY, **settings):
+        """
+        Fetch the gaps of many tickers. Tickers missing the same range are fetched together with fetchMany,
+        so a nightly refresh is one concurrent batch of one day per ticker
+        :param tickers: List of tickers
+        :param start: First date wanted
+        :param end: Last date wanted
+        :param frequency: daily or minute
+        :param settings: AsyncMarketDataFetcher settings
+        :return: Dict of ticker to the exception that stopped its sync, only tickers that failed are listed
+        """
+        groups = {}
+        for ticker in tickers:
+            for gap in self.gaps(ticker, start, end, frequency):
+                if hasTradingDays(*gap):
+                    groups.setdefault(gap, []).append(ticker)
+                else:
+                    self.markHeld(ticker, *gap, frequency)
+
+        errors = {}
+        try:
+            for (gapStart, gapEnd), groupTickers in sorted(groups.items()):
+                groupStart, groupEnd = dayBounds(gapStart, gapEnd)
+                if self.loader is not None:
+                    results = {}
+                    for ticker in groupTickers:
+                        try:
+                            results[ticker] = self.loader(ticker, groupStart, groupEnd, frequency)
+                        except Exception as e:
+                            results[ticker] = e
+                else:
+                    results = async_fetcher.fetchMany(groupTickers, groupStart, groupEnd, frequency=frequency,
+                                                      cache=self.cache, **settings)
+
+                for ticker, df in results.items():
+                    if isinstance(df, Exception):
+                        errors[ticker] = df
+                        continue
+                    if df is None or df.empty:
+                        continue
+                    self.store.writeBars(ticker, df, frequency)
+                    self.markHeld(ticker, gapStart, gapEnd, frequency)
+        finally:
+            self.saveLedger()
+
+        return errors
+
+    def readBars(self, symbol, start, end, frequency=DAILY, deriveDateTime=True):
+        """
+        Sync then read bars from the store
+        :return: Dataframe of bars
+        """
+        self.sync(symbol, start, end, frequency)
+        return self.store.readBars(symbol, frequency, toDate(start), toDate(end), deriveDateTime)
+
+    def dailyChart(self, symbol, start, end):
+        """
+        Sync then read daily bars shaped like getTDData
+        :return: Dataframe indexed by Date
+        """
+        return toDailyChart(self.readBars(symbol, start, end, DAILY, deriveDateTime=False))
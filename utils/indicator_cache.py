@@ -0,0 +1,157 @@
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+
+import pandas
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+SMA = 'sma'
+EMA = 'ema'
+
+# Disk tier column of series without a string name, parquet needs one
+UNNAMED = '__value__'
+
+
+def dataVersion(series):
+    """
+    Fingerprint of a price series: changes whenever its dates or values do
+    :param series: Series indexed by date
+    :return: Hex string
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pandas.Index(series.index).to_numpy().tobytes())
+    digest.update(series.to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()
+
+
+def sizeOf(value):
+    return int(value.memory_usage(index=True, deep=False)) if isinstance(value, pandas.Series) else value.nbytes
+
+
+class IndicatorCache:
+    """
+    Memoize indicator series keyed by (ticker, data version, indicator, params)
+    Recently used series stay in memory up to maxBytes, an optional disk tier keeps the rest across runs
+    Registering a BarStore drops a ticker's entries as soon as the store writes new bars for it
+    """
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES, diskPath=None, store=None):
+        """
+        :param maxBytes: Memory budget
+        :param diskPath: Folder for the disk tier, no disk tier when not given
+        :param store: BarStore to listen to for invalidation
+        """
+        self.maxBytes = maxBytes
+        self.diskPath = diskPath
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if store is not None:
+            store.addListener(self.onStoreWrite)
+
+    def diskFile(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.diskPath, key[0], '{0}.parquet'.format(name))
+
+    def get(self, ticker, version, indicator, params, compute):
+        """
+        Cached indicator, computed and cached on a miss
+        The returned series is shared with the cache, copy it before changing it in place
+        :param ticker: Ticker
+        :param version: Data version, e.g. dataVersion of the input series
+        :param indicator: Indicator name
+        :param params: Tuple of indicator parameters
+        :param compute: Function with no arguments computing the series
+        :return: Series
+        """
+        key = (ticker.upper(), version, indicator, tuple(params))
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.diskPath is not None and os.path.exists(self.diskFile(key)):
+            value = pandas.read_parquet(self.diskFile(key)).iloc[:, 0]
+            if value.name == UNNAMED:
+                value.name = None
+            self.diskHits += 1
+            self._remember(key, value)
+            return value
+
+        self.misses += 1
+        value = compute()
+        self._remember(key, value)
+
+        if self.diskPath is not None:
+            path = self.diskFile(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Stored under its own name so a disk hit returns the same series a memory hit does
+            value.to_frame(value.name if isinstance(value.name, str) else UNNAMED).to_parquet('{0}.tmp'.format(path))
+            os.replace('{0}.tmp'.format(path), path)
+
+        return value
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.bytes += sizeOf(value)
+
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            _, dropped = self.entries.popitem(last=False)
+            self.bytes -= sizeOf(dropped)
+            self.evictions += 1
+
+    def rollingMean(self, ticker, closes, window, version=None):
+        """
+        closes.rolling(window).mean(), memoized
+        """
+        version = version if version else dataVersion(closes)
+        return self.get(ticker, version, SMA, (window,), lambda: closes.rolling(window=window).mean())
+
+    def ewmMean(self, ticker, closes, span, version=None):
+        """
+        closes.ewm(span=span).mean(), memoized
+        """
+        version = version if version else dataVersion(closes)
+        return self.get(ticker, version, EMA, (span,), lambda: closes.ewm(span=span).mean())
+
+    def invalidate(self, ticker):
+        """
+        Drop every entry of a ticker from memory and disk
+        """
+        ticker = ticker.upper()
+        for key in [key for key in self.entries if key[0] == ticker]:
+            self.bytes -= sizeOf(self.entries.pop(key))
+
+        if self.diskPath is not None:
+            shutil.rmtree(os.path.join(self.diskPath, ticker), ignore_errors=True)
+
+    def onStoreWrite(self, symbol, frequency, partitions):
+        if partitions:
+            self.invalidate(symbol)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        if self.diskPath is not None:
+            shutil.rmtree(self.diskPath, ignore_errors=True)
+
+    def stats(self):
+        """
+        :return: Dict of hit, miss and eviction counts, hit rate and memory used
+        """
+        lookups = self.hits + self.diskHits + self.misses
+        return {
+            'Hits': self.hits,
+            'Disk Hits': self.diskHits,
+            'Misses': self.misses,
+            'Hit Rate': (self.hits + self.diskHits) / lookups if lookups else 0.0,
+            'Evictions': self.evictions,
+            'Entries': len(self.entries),
+            'Bytes': self.bytes,
+        }
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pandas
+
+AV_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+AV_DTYPES = {
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'volume': 'int64',
+}
+
+
+def dateAndTimeColumns(datetimes):
+    """
+    Date and time objects of every bar, built once per distinct day and minute instead of once per bar
+    :param datetimes: Array or Series of datetime64[ns]
+    :return: Object arrays of datetime.date and datetime.time
+    """
+    values = np.asarray(datetimes, dtype='datetime64[ns]')
+    days = values.astype('datetime64[D]')
+
+    dayCodes, uniqueDays = pandas.factorize(days)
+    timeCodes, uniqueTimes = pandas.factorize(values - days)
+
+    dates = np.asarray(pandas.DatetimeIndex(uniqueDays).date, dtype=object)[dayCodes]
+    times = np.asarray((pandas.Timestamp(0) + pandas.TimedeltaIndex(uniqueTimes)).time, dtype=object)[timeCodes]
+
+    return dates, times
+
+
+def parseIntradayCsv(source):
+    """
+    Parse an Alpha Vantage intraday csv straight into typed columns, oldest bar first
+    The response is read by the C parser without decoding or splitting it in python first
+    :param source: Raw bytes of the response or a binary file object
+    :return: Dataframe with Time, Open, High, Low, Close, Volume, Datetime and Date like parseIntradayDataAV
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    # round_trip parses prices exactly like float() did, the default parser can be off by one ulp
+    df = pandas.read_csv(source, dtype=AV_DTYPES, float_precision='round_trip')
+    df = df.iloc[::-1].reset_index(drop=True)
+    df.columns = [c.title() for c in df.columns]
+
+    df['Datetime'] = pandas.to_datetime(df['Time'], format=AV_TIME_FORMAT)
+    df['Date'], df['Time'] = dateAndTimeColumns(df['Datetime'])
+
+    return df
+
+
+def readIntradayFrame(df):
+    """
+    Convert intraday data read back from excel, parsing the Time column once
+    :param df: Dataframe with Time holding full datetimes
+    :return: Dataframe with Datetime, Date and Time columns and typed prices
+    """
+    df['Datetime'] = pandas.to_datetime(df['Time'])
+    df['Date'], df['Time'] = dateAndTimeColumns(df['Datetime'])
+
+    return df.astype({column.title(): dtype for column, dtype in AV_DTYPES.items()})
+
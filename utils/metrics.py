@@ -0,0 +1,348 @@
+import bisect
+import json
+import math
+import os
+import re
+import time
+
+# Waiting for the rate limiter and a free connection slot before a request
+QUEUE = 'queue'
+FETCH = 'fetch'
+PARSE = 'parse'
+INDICATOR = 'indicator'
+BACKTEST = 'backtest'
+WRITE = 'write'
+
+# Upper bounds in seconds of the timing histogram buckets, Prometheus style (a value lands in the first bound >= it)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+           math.inf)
+
+PROMETHEUS_PREFIX = 'stock_analysis'
+
+
+class Histogram:
+    """
+    Count, sum, min, max and bucket counts of observed values
+    """
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.counts = [count + otherCount for count, otherCount in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Estimate from the buckets: the upper bound of the bucket holding the q-th value, capped at the max seen
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def toDict(self):
+        return {
+            'Count': self.count,
+            'Seconds': self.sum,
+            'Mean': self.sum / self.count if self.count else 0.0,
+            'Min': self.min if self.count else 0.0,
+            'P50': self.quantile(0.5),
+            'P95': self.quantile(0.95),
+            'Max': self.max,
+            'Buckets': self.counts,
+        }
+
+
+class MetricsRegistry:
+    """
+    Stage timings and counters of a pipeline run, each kept in total and per ticker
+    Keys are (name, ticker), the total of a name is stored under ticker None
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.created = time.time()
+
+    def observe(self, stage, seconds, ticker=None):
+        """
+        Record one timing of a stage
+        :param stage: Stage name, e.g. FETCH
+        :param seconds: Duration
+        :param ticker: Ticker the work was for, if any
+        """
+        keys = [(stage, None)] if ticker is None else [(stage, None), (stage, ticker.upper())]
+        for key in keys:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1, ticker=None):
+        """
+        Add to a counter, e.g. bars written or errors
+        """
+        self.counters[(name, None)] = self.counters.get((name, None), 0) + value
+        if ticker is not None:
+            key = (name, ticker.upper())
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def merge(self, other):
+        """
+        Add the timings and counters of another registry, e.g. one returned by a worker process
+        """
+        for key, histogram in other.histograms.items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                mine = self.histograms[key] = Histogram()
+            mine.merge(histogram)
+
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+        self.created = time.time()
+
+    def stages(self):
+        return sorted(stage for stage, ticker in self.histograms if ticker is None)
+
+    def slowestTickers(self, stage, count=10):
+        """
+        Tickers that spent the most time in a stage
+        :return: List of (ticker, seconds), slowest first
+        """
+        totals = [(ticker, histogram.sum) for (name, ticker), histogram in self.histograms.items()
+                  if name == stage and ticker is not None]
+        return sorted(totals, key=lambda item: item[1], reverse=True)[:count]
+
+    def toDict(self, perTicker=True):
+        """
+        :param perTicker: Include the per ticker histograms and counters
+        :return: Dict of Stages and Counters, each with Total and optionally Tickers
+        """
+        stages = {}
+        for (stage, ticker), histogram in self.histograms.items():
+            if ticker is None:
+                stages.setdefault(stage, {})['Total'] = histogram.toDict()
+            elif perTicker:
+                stages.setdefault(stage, {}).setdefault('Tickers', {})[ticker] = histogram.toDict()
+
+        counters = {}
+        for (name, ticker), value in self.counters.items():
+            if ticker is None:
+                counters.setdefault(name, {})['Total'] = value
+            elif perTicker:
+                counters.setdefault(name, {}).setdefault('Tickers', {})[ticker] = value
+
+        return {
+            'Elapsed': time.time() - self.created,
+            'Buckets': [str(bound) for bound in BUCKETS],
+            'Stages': stages,
+            'Counters': counters,
+        }
+
+    def summaryTable(self, slowest=5):
+        """
+        Per stage totals, the slowest tickers of each stage and the counter totals as printable text
+        """
+        lines = ['{0:<12} {1:>9} {2:>11} {3:>10} {4:>10} {5:>10} {6:>10}'.format(
+            'Stage', 'Count', 'Seconds', 'Mean', 'P50', 'P95', 'Max')]
+
+        for stage in self.stages():
+            total = self.histograms[(stage, None)].toDict()
+            lines.append('{0:<12} {Count:>9} {Seconds:>11.3f} {Mean:>10.5f} {P50:>10.5f} {P95:>10.5f} {Max:>10.5f}'
+                         .format(stage, **total))
+
+        for stage in self.stages():
+            tickers = self.slowestTickers(stage, slowest)
+            if tickers:
+                lines.append('Slowest {0}: {1}'.format(
+                    stage, ', '.join('{0} {1:.3f}s'.format(ticker, seconds) for ticker, seconds in tickers)))
+
+        for (name, ticker), value in sorted(self.counters.items(), key=lambda item: item[0][0]):
+            if ticker is None:
+                lines.append('{0:<12} {1:>9}'.format(name, value))
+
+        return '\n'.join(lines)
+
+    def toPrometheus(self, perTicker=False):
+        """
+        Prometheus text exposition format, e.g. for the node exporter textfile collector
+        :param perTicker: Also export per ticker series. Off by default since 5,000 tickers make 5,000 series each
+        """
+        name = '{0}_stage_seconds'.format(PROMETHEUS_PREFIX)
+        lines = ['# HELP {0} Time spent in each pipeline stage'.format(name),
+                 '# TYPE {0} histogram'.format(name)]
+
+        keys = sorted(self.histograms, key=lambda key: (key[0], key[1] or ''))
+        for stage, ticker in keys:
+            histogram = self.histograms[(stage, ticker)]
+            if ticker is not None and not perTicker:
+                continue
+            labels = 'stage="{0}"'.format(stage) if ticker is None else 'stage="{0}",ticker="{1}"'.format(stage, ticker)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, le, cumulative))
+            lines.append('{0}_sum{{{1}}} {2!r}'.format(name, labels, histogram.sum))
+            lines.append('{0}_count{{{1}}} {2}'.format(name, labels, histogram.count))
+
+        for counter in sorted({counter for counter, ticker in self.counters}):
+            metric = '{0}_{1}_total'.format(PROMETHEUS_PREFIX, re.sub('[^a-zA-Z0-9_]', '_', counter))
+            lines.append('# TYPE {0} counter'.format(metric))
+            for (name, ticker), value in sorted(self.counters.items(), key=lambda item: item[0][1] or ''):
+                if name != counter or (ticker is not None and not perTicker):
+                    continue
+                labels = '' if ticker is None else '{{ticker="{0}"}}'.format(ticker)
+                lines.append('{0}{1} {2}'.format(metric, labels, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, perTicker=None):
+        """
+        Write the metrics to a .json file, or Prometheus text for any other extension such as .prom
+        :param perTicker: Include per ticker series, defaults to yes for json and no for Prometheus
+        """
+        if path.endswith('.json'):
+            content = json.dumps(self.toDict(perTicker is not False), indent=1)
+        else:
+            content = self.toPrometheus(bool(perTicker))
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = '{0}.tmp'.format(path)
+        with open(tmpPath, 'w') as f:
+            f.write(content)
+        os.replace(tmpPath, path)
+
+
+class NullTimer:
+    """
+    Timer handed out while metrics are disabled, does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """
+    Context manager timing a block into a stage. Always measures elapsed, only records when the registry is enabled
+    """
+    __slots__ = ('stage', 'ticker', 'registry', 'start', 'elapsed')
+
+    def __init__(self, stage, ticker=None, registry=None):
+        self.stage = stage
+        self.ticker = ticker
+        self.registry = registry if registry is not None else REGISTRY
+        self.start = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        if self.registry.enabled:
+            self.registry.observe(self.stage, self.elapsed, self.ticker)
+        return False
+
+
+REGISTRY = MetricsRegistry(enabled=os.environ.get('STOCK_METRICS', '') not in ('', '0'))
+
+
+def enable():
+    REGISTRY.enabled = True
+
+
+def disable():
+    REGISTRY.enabled = False
+
+
+def enabled():
+    return REGISTRY.enabled
+
+
+def timer(stage, ticker=None):
+    """
+    Time a block into a stage of the global registry, a shared no-op while metrics are disabled
+        with metrics.timer(metrics.FETCH, ticker):
+            ...
+    """
+    if not REGISTRY.enabled:
+        return NULL_TIMER
+    return Timer(stage, ticker)
+
+
+def observe(stage, seconds, ticker=None):
+    if REGISTRY.enabled:
+        REGISTRY.observe(stage, seconds, ticker)
+
+
+def increment(name, value=1, ticker=None):
+    if REGISTRY.enabled:
+        REGISTRY.increment(name, value, ticker)
+
+
+def workerTask(enabled, function, *args):
+    """
+    Run one task in a worker process, recording into an emptied registry so only the task's own metrics go back
+    Timings recorded in a worker are lost with its process, the parent adds the returned registry with merge()
+    :param enabled: metrics.enabled() of the parent, a spawned worker does not see enable()
+    :param function: Task function
+    :return: The task's result and its registry, None when metrics are disabled
+    """
+    REGISTRY.reset()
+    REGISTRY.enabled = enabled
+    return function(*args), REGISTRY if enabled else None
+
+
+def merge(registry):
+    """
+    Add a worker's registry returned by workerTask to the global registry
+    """
+    if registry is not None and REGISTRY.enabled:
+        REGISTRY.merge(registry)
+
+
+def report(path=None, perTicker=None):
+    """
+    Print the summary table of the global registry and optionally write it to a .json or Prometheus text file
+    """
+    print(REGISTRY.summaryTable())
+    if path is not None:
+        REGISTRY.write(path, perTicker)
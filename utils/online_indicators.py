@@ -0,0 +1,228 @@
+import datetime
+import math
+from collections import deque
+
+REGULAR_OPEN = datetime.time(9, 30)
+
+
+class OnlineSMA:
+    """
+    Simple moving average updated one bar at a time
+    Follows the Kahan compensated add/remove steps of pandas rolling(window).mean(), so values match it exactly
+    """
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.nobs = 0
+        self.sum = 0.0
+        self.negatives = 0
+        self.addCompensation = 0.0
+        self.removeCompensation = 0.0
+        self.sameCount = 0
+        self.prevValue = None
+        self.value = math.nan
+
+    def update(self, x):
+        """
+        :param x: New close
+        :return: Average of the last window closes, NaN until window closes were seen
+        """
+        x = float(x)
+        self.values.append(x)
+
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            if old == old:
+                self.nobs -= 1
+                y = -old - self.removeCompensation
+                t = self.sum + y
+                self.removeCompensation = t - self.sum - y
+                self.sum = t
+                if math.copysign(1.0, old) < 0:
+                    self.negatives -= 1
+
+        if self.prevValue is None:
+            self.prevValue = x
+        if x == x:
+            self.nobs += 1
+            y = x - self.addCompensation
+            t = self.sum + y
+            self.addCompensation = t - self.sum - y
+            self.sum = t
+            if math.copysign(1.0, x) < 0:
+                self.negatives += 1
+            self.sameCount = self.sameCount + 1 if x == self.prevValue else 1
+            self.prevValue = x
+
+        if self.nobs >= self.window and self.nobs > 0:
+            result = self.sum / self.nobs
+            if self.sameCount >= self.nobs:
+                result = self.prevValue
+            elif self.negatives == 0 and result < 0:
+                result = 0.0
+            elif self.negatives == self.nobs and result > 0:
+                result = 0.0
+        else:
+            result = math.nan
+
+        self.value = result
+        return result
+
+
+class OnlineEMA:
+    """
+    Exponential moving average updated one bar at a time, the adjust=True recursion of pandas ewm(span).mean()
+    """
+    def __init__(self, span):
+        self.span = span
+        alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+        self.decay = 1.0 - alpha
+        self.weight = 1.0
+        self.value = math.nan
+        self.count = 0
+
+    def update(self, x):
+        """
+        :param x: New close
+        :return: Updated average
+        """
+        x = float(x)
+        self.count += 1
+
+        if self.count == 1:
+            self.value = x
+        elif self.value == self.value:
+            self.weight *= self.decay
+            if x == x:
+                if self.value != x:
+                    self.value = (self.weight * self.value + x) / (self.weight + 1.0)
+                self.weight += 1.0
+        elif x == x:
+            self.value = x
+
+        return self.value
+
+
+class OnlinePivots:
+    """
+    Red to green (support) and green to red (resistance) pivots found one bar at a time,
+    same rules as pivot_engine.findPivots: a doji keeps the previous color, a first bar doji counts as red
+    """
+    def __init__(self):
+        self.state = None
+        self.prevClose = None
+        self.counter = 0
+        self.supportPivots = []
+        self.resistancePivots = []
+
+    def update(self, time, openPrice, closePrice, counter=None):
+        """
+        :param time: Bar time
+        :param openPrice: Bar open
+        :param closePrice: Bar close
+        :param counter: Bar counter, defaults to the number of bars seen before
+        :return: ('support' or 'resistance', (time, price, counter)) when the bar is a pivot, otherwise None
+        """
+        counter = self.counter if counter is None else counter
+        self.counter += 1
+        color = (closePrice > openPrice) - (closePrice < openPrice)
+        pivot = None
+
+        if self.state is None:
+            self.state = color if color != 0 else -1
+        else:
+            if color == 1 and self.state == -1:
+                pivot = ('support', (time, min(self.prevClose, openPrice), counter))
+                self.supportPivots.append(pivot[1])
+            elif color == -1 and self.state == 1:
+                pivot = ('resistance', (time, max(self.prevClose, openPrice), counter))
+                self.resistancePivots.append(pivot[1])
+            if color != 0:
+                self.state = color
+
+        self.prevClose = closePrice
+        return pivot
+
+
+class PremarketTracker:
+    """
+    Running premarket high, low after the high, their times and volume, with getPremarketData's rules
+    Times stay None until a bar sets them
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.high = 0.0
+        self.highTime = None
+        self.lowAfterHigh = 0.0
+        self.lowTime = None
+        self.volume = 0
+
+    def update(self, time, high, low, volume):
+        if high > self.high:
+            self.high = high
+            self.highTime = time
+            self.lowAfterHigh = high
+        elif low < self.lowAfterHigh:
+            self.lowAfterHigh = low
+            self.lowTime = time
+
+        self.volume += volume
+
+    def toDict(self):
+        return {
+            'Premarket High': self.high,
+            'Premarket High Time': self.highTime,
+            'Premarket Low (After Top Reached)': self.lowAfterHigh,
+            'Premarket Low Time (After Top Reached)': self.lowTime,
+            'Premarket Volume': self.volume,
+        }
+
+
+class OnlineTicker:
+    """
+    Live indicator state of one ticker, fed one minute bar at a time in constant time per bar
+    """
+    def __init__(self, ticker, smaWindows=(50,), emaSpans=(5, 20)):
+        self.ticker = ticker
+        self.sma = {window: OnlineSMA(window) for window in smaWindows}
+        self.ema = {span: OnlineEMA(span) for span in emaSpans}
+        self.pivots = OnlinePivots()
+        self.premarket = PremarketTracker()
+        self.date = None
+        self.bars = 0
+        self.last = None
+
+    def update(self, stamp, openPrice, high, low, closePrice, volume):
+        """
+        Ingest one bar
+        :param stamp: Bar datetime, Eastern wall clock
+        :return: New pivot as returned by OnlinePivots.update, or None
+        """
+        if stamp.date() != self.date:
+            self.date = stamp.date()
+            self.premarket.reset()
+
+        if stamp.time() < REGULAR_OPEN:
+            self.premarket.update(stamp.time(), high, low, volume)
+
+        for indicator in self.sma.values():
+            indicator.update(closePrice)
+        for indicator in self.ema.values():
+            indicator.update(closePrice)
+
+        self.bars += 1
+        self.last = (stamp, openPrice, high, low, closePrice, volume)
+        return self.pivots.update(stamp, openPrice, closePrice)
+
+    def snapshot(self):
+        """
+        :return: Dict of the latest indicator values
+        """
+        values = {'Ticker': self.ticker, 'Bars': self.bars, 'Close': self.last[4] if self.last else math.nan}
+        values.update({'SMA_{0}'.format(window): indicator.value for window, indicator in self.sma.items()})
+        values.update({'EMA_{0}'.format(span): indicator.value for span, indicator in self.ema.items()})
+        values.update(self.premarket.toDict())
+        return values
+
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas
+
+from utils.bar_store import DAILY
+
+
+def _pack(values, mask):
+    """
+    Move every column's valid values to the top, keeping their order, so each column is its own
+    gap free series like the per ticker frames the strategies use
+    :return: Packed values and the row order to unpack them with
+    """
+    order = np.argsort(~mask, axis=0, kind='stable')
+    return np.take_along_axis(values, order, axis=0), order
+
+
+def _unpack(packed, order, mask):
+    values = np.full(packed.shape, np.nan)
+    np.put_along_axis(values, order, packed, axis=0)
+    values[~mask] = np.nan
+    return values
+
+
+def rollingMean(values, mask, window):
+    """
+    Simple moving average of every column over its valid values, like rolling(window).mean() per ticker
+    One pandas rolling mean over every column's valid values laid end to end, whose compensated
+    running sum does not drift the way a cumsum difference does, then the windows that reach back
+    into the previous column are dropped
+    :param values: T x N array
+    :param mask: T x N array, True where the value exists
+    :param window: Window size
+    :return: T x N array, NaN until window values are known and where the value is missing
+    """
+    flat = values.T[mask.T]
+    means = pandas.Series(flat).rolling(window=window).mean().to_numpy()
+
+    counts = mask.sum(axis=0)
+    starts = np.cumsum(counts) - counts
+    means[np.arange(len(flat)) - np.repeat(starts, counts) < window - 1] = np.nan
+
+    result = np.full(values.shape, np.nan)
+    result.T[mask.T] = means
+    return result
+
+
+def ewmMean(values, mask, span):
+    """
+    Exponential moving average of every column over its valid values, like ewm(span=span).mean() per ticker
+    ignore_na weighs each value by its position among the valid ones, so missing days act as if the
+    ticker's series had no row there
+    :param values: T x N array
+    :param mask: T x N array, True where the value exists
+    :param span: EMA span
+    :return: T x N array, NaN where the value is missing
+    """
+    means = pandas.DataFrame(np.where(mask, values, np.nan)).ewm(span=span, ignore_na=True).mean().to_numpy()
+    means[~mask] = np.nan
+    return means
+
+
+class PricePanel:
+    """
+    Aligned daily prices of many tickers as dates x tickers arrays
+    Missing days (before an IPO, halts) are masked out and every indicator runs over each ticker's
+    own days, so results match computing them one ticker at a time
+    """
+    def __init__(self, closes, opens=None):
+        """
+        :param closes: Dataframe of close prices indexed by date with a column per ticker
+        :param opens: Dataframe of open prices with the same shape, needed by closeNearMa
+        """
+        closes = closes.sort_index()
+        self.dates = closes.index
+        self.tickers = list(closes.columns)
+        self.close = closes.to_numpy(dtype='float64')
+        self.open = opens.reindex(index=self.dates, columns=self.tickers).to_numpy(dtype='float64') \
+            if opens is not None else None
+        self.mask = ~np.isnan(self.close)
+
+    @classmethod
+    def fromCharts(cls, charts):
+        """
+        Build a panel from per ticker daily charts
+        :param charts: Dict of ticker to chart with Open and Close indexed by date
+        :return: PricePanel
+        """
+        closes = pandas.DataFrame({ticker: chart['Close'] for ticker, chart in charts.items()})
+        opens = pandas.DataFrame({ticker: chart['Open'] for ticker, chart in charts.items()})
+        return cls(closes, opens)
+
+    @classmethod
+    def fromStore(cls, store, tickers=None, start=None, end=None):
+        """
+        Build a panel from the daily bars of a BarStore
+        :param tickers: Tickers to load, defaults to every ticker in the store
+        :return: PricePanel
+        """
+        charts = {}
+        for ticker in tickers if tickers is not None else store.tickers(DAILY):
+            bars = store.readBars(ticker, DAILY, start, end, deriveDateTime=False)
+            if not bars.empty:
+                charts[ticker] = bars.set_index(bars['Datetime'].dt.normalize())
+        return cls.fromCharts(charts)
+
+    def frame(self, values):
+        return pandas.DataFrame(values, index=self.dates, columns=self.tickers)
+
+    def sma(self, window):
+        return self.frame(rollingMean(self.close, self.mask, window))
+
+    def ema(self, span):
+        return self.frame(ewmMean(self.close, self.mask, span))
+
+    def crossover(self, fast, slow, kind='ema'):
+        """
+        Crossover state of every ticker on every day, the Is Positive column of generateEMAData
+        :param fast: Fast window
+        :param slow: Slow window
+        :param kind: ema or ma
+        :return: Is Positive (fast >= slow) and Crosses (days the state flips) as boolean dataframes
+        """
+        average = ewmMean if kind == 'ema' else rollingMean
+        fastLine = average(self.close, self.mask, fast)
+        slowLine = average(self.close, self.mask, slow)
+        isPositive = fastLine >= slowLine
+
+        # Compare each valid day with the ticker's previous valid day
+        packed, order = _pack(isPositive, self.mask)
+        flips = np.zeros(packed.shape, dtype=bool)
+        flips[1:] = packed[1:] != packed[:-1]
+        crosses = _unpack(flips.astype('float64'), order, self.mask) == 1.0
+
+        return self.frame(isPositive), self.frame(crosses)
+
+    def closeNearMa(self, ma=50, percentDiff=0.03):
+        """
+        findCloseNearMa for every ticker at once: green days closing just above the MA
+        :param ma: MA window
+        :param percentDiff: percent difference
+        :return: Boolean dataframe of dates x tickers
+        """
+        if self.open is None:
+            raise ValueError('closeNearMa needs open prices')
+
+        distance = (self.close - rollingMean(self.close, self.mask, ma)) / 100
+        withinRange = (distance >= 0.0) & (distance <= percentDiff) & (self.close - self.open > 0.0)
+        return self.frame(withinRange)
+
+    def datesCloseToMa(self, ma=50, percentDiff=0.03):
+        """
+        :return: Dict of ticker to the dates findCloseNearMa returns for it
+        """
+        withinRange = self.closeNearMa(ma, percentDiff)
+        return {ticker: withinRange.index[withinRange[ticker].to_numpy()].date.tolist() for ticker in self.tickers}
+
@@ -0,0 +1,143 @@
+from pandas.tseries.offsets import BDay
+from utils import backtest_engine, metrics
+from dask import delayed, compute
+import pandas
+import numpy as np
+
+EMA = 'ema'
+MA = 'ma'
+
+SWEEP_COLUMNS = ['Ticker', 'Fast', 'Slow', 'Trades', 'Wins', 'Win Rate', 'PnL']
+
+
+def tdLoader(ticker, start, end):
+    """
+    Default loader, same data EMACrossoverTrading.generateStockData fetches
+    """
+    from utils import stock_utils
+
+    return stock_utils.getTDData(ticker, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+
+
+def storeLoader(store):
+    """
+    Loader reading daily bars from a BarStore instead of the API
+    :param store: BarStore
+    :return: Loader function taking ticker, start, end
+    """
+    from functools import partial
+
+    return partial(_readFromStore, store)
+
+
+def _readFromStore(store, ticker, start, end):
+    from utils.bar_store import DAILY, toDailyChart
+
+    with metrics.timer(metrics.PARSE, ticker):
+        return toDailyChart(store.readBars(ticker, DAILY, start, end, deriveDateTime=False))
+
+
+def movingAverages(closes, windows, kind=EMA):
+    """
+    Compute each window once
+    :param closes: Series of close prices
+    :param windows: Iterable of window sizes
+    :param kind: ema (ewm span like generateEMAData) or ma (rolling mean like generateMAData)
+    :return: Dict of window to array
+    """
+    if kind == EMA:
+        return {w: closes.ewm(span=w).mean().to_numpy() for w in windows}
+    if kind == MA:
+        return {w: closes.rolling(window=w).mean().to_numpy() for w in windows}
+
+    raise ValueError('Unknown moving average kind {0}'.format(kind))
+
+
+def sweepTicker(ticker, stockData, pairs, kind=EMA, moneySpent=0, shareCount=0):
+    """
+    Backtest every (fast, slow) pair on one ticker's data
+    :param ticker: Ticker
+    :param stockData: Daily chart with Open and Close, indexed by date
+    :param pairs: List of (fast, slow) windows
+    :param kind: ema or ma
+    :param moneySpent: Money put in each trade when shareCount is not given
+    :param shareCount: Shares bought each trade
+    :return: List of result rows
+    """
+    windows = sorted({w for pair in pairs for w in pair})
+    lines = movingAverages(stockData['Close'], windows, kind)
+    opens = stockData['Open'].to_numpy()
+    closes = stockData['Close'].to_numpy()
+    rows = []
+
+    for fast, slow in pairs:
+        ledger = backtest_engine.crossoverLedger(stockData.index, opens, closes, lines[fast], lines[slow],
+                                                 moneySpent, shareCount)
+        wins = int((ledger['Win or Loss'] == 'Win').sum())
+        rows.append((ticker, fast, slow, len(ledger), wins, wins / len(ledger) if len(ledger) else np.nan,
+                     float(ledger['PnL'].sum())))
+
+    return rows
+
+
+def _loadAndSweep(ticker, loader, start, end, pairs, kind, moneySpent, shareCount):
+    """
+    :return: Result rows and the exception that stopped the ticker, None when it ran
+    """
+    try:
+        stockData = loader(ticker, start, end)
+        if stockData is None or stockData.empty:
+            raise ValueError('No Data found for {0}'.format(ticker))
+        return sweepTicker(ticker, stockData, pairs, kind, moneySpent, shareCount), None
+    except Exception as e:
+        return [], e
+
+
+def sweepCrossover(tickers, fastWindows, slowWindows, startDate, endDate, kind=EMA, moneySpent=10000, shareCount=0,
+                   workers=None, loader=tdLoader):
+    """
+    Backtest a grid of crossover windows over a set of tickers
+    Each ticker is fetched once and each distinct window computed once, tickers run in parallel processes
+    :param tickers: List of tickers
+    :param fastWindows: Fast windows to try
+    :param slowWindows: Slow windows to try, only pairs with fast < slow are run
+    :param startDate: First trade date, data is fetched from the longest window before it
+    :param endDate: Last trade date
+    :param kind: ema or ma
+    :param moneySpent: Money put in each trade when shareCount is not given
+    :param shareCount: Shares bought each trade
+    :param workers: Number of processes, defaults to every core. 1 runs in this process
+    :param loader: Function (ticker, start, end) returning a daily chart
+    :return: Dataframe indexed by (Ticker, Fast, Slow) with Trades, Wins, Win Rate and PnL,
+             and a dict of ticker to the exception that stopped it, only tickers that failed are listed
+    """
+    pairs = [(fast, slow) for fast in sorted(set(fastWindows)) for slow in sorted(set(slowWindows)) if fast < slow]
+    lookback = max(max(pair) for pair in pairs) if pairs else 0
+    start = startDate - BDay(lookback)
+
+    if workers == 1:
+        tasks = [delayed(_loadAndSweep)(t, loader, start, endDate, pairs, kind, moneySpent, shareCount)
+                 for t in tickers]
+        results = compute(*tasks, scheduler='synchronous')
+    else:
+        enabled = metrics.enabled()
+        tasks = [delayed(metrics.workerTask)(enabled, _loadAndSweep, t, loader, start, endDate, pairs, kind,
+                                             moneySpent, shareCount) for t in tickers]
+        results = []
+        for result, registry in compute(*tasks, scheduler='processes', num_workers=workers):
+            metrics.merge(registry)
+            results.append(result)
+
+    sweep = pandas.DataFrame([row for rows, _ in results for row in rows], columns=SWEEP_COLUMNS)
+    errors = {ticker: error for ticker, (_, error) in zip(tickers, results) if error is not None}
+    return sweep.set_index(['Ticker', 'Fast', 'Slow']), errors
+
+
+def sweepCube(sweep, value='Win Rate'):
+    """
+    Reshape sweep results to one fast x slow grid per ticker
+    :param sweep: Result dataframe of sweepCrossover
+    :param value: Column to show
+    :return: Dataframe indexed by (Ticker, Fast) with a column per slow window
+    """
+    return sweep[value].unstack('Slow')
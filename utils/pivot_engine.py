@@ -0,0 +1,113 @@
+import numpy as np
+import pandas
+
+from utils.bars import Bars
+
+
+def _barColors(opens, closes):
+    """
+    Color of every bar: 1 green, -1 red, 0 doji
+    """
+    return np.sign(closes - opens).astype(np.int8)
+
+
+def findPivots(opens, closes, groupStarts=None):
+    """
+    Find swing lows (red to green) and swing highs (green to red) with array operations
+    A doji keeps the color of the last non doji bar, the first bar of a chart counts as red unless it is green
+    :param opens: Array of open prices
+    :param closes: Array of close prices
+    :param groupStarts: Positions where a new chart starts when several charts are stacked
+    :return: Support positions, support prices, resistance positions, resistance prices
+    """
+    opens = np.asarray(opens, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    n = len(closes)
+    starts = np.zeros(n, dtype=bool)
+    if n:
+        starts[0] = True
+    if groupStarts is not None:
+        starts[np.asarray(groupStarts, dtype=np.int64)] = True
+
+    colors = _barColors(opens, closes)
+    state = colors.copy()
+    state[starts & (state == 0)] = -1
+
+    # Forward fill the last non doji color so every bar knows the state it was entered with
+    lastColor = np.where(state != 0, np.arange(n), 0)
+    np.maximum.accumulate(lastColor, out=lastColor)
+    state = state[lastColor]
+
+    prevState = np.empty(n, dtype=np.int8)
+    prevState[1:] = state[:-1]
+    prevClose = np.empty(n, dtype=np.float64)
+    prevClose[1:] = closes[:-1]
+
+    valid = ~starts
+    support = np.flatnonzero(valid & (colors == 1) & (prevState == -1))
+    resistance = np.flatnonzero(valid & (colors == -1) & (prevState == 1))
+
+    supportPrices = np.minimum(prevClose[support], opens[support])
+    resistancePrices = np.maximum(prevClose[resistance], opens[resistance])
+
+    return support, supportPrices, resistance, resistancePrices
+
+
+def _barTimes(df):
+    return df.datetimes if isinstance(df, Bars) else df.index.to_numpy()
+
+
+def getPivotArrays(df):
+    """
+    Pivot points of a stock chart as arrays
+    :param df: Stock chart with Open, Close and Counter columns and a DatetimeIndex, or Bars
+    :return: (timestamps, prices, counters) for support and for resistance
+    """
+    counters = df['Counter'].to_numpy() if 'Counter' in df.columns else np.arange(len(df))
+    support, supportPrices, resistance, resistancePrices = findPivots(df['Open'], df['Close'])
+    index = _barTimes(df)
+
+    return (index[support], supportPrices, counters[support]), \
+           (index[resistance], resistancePrices, counters[resistance])
+
+
+def getPivotArraysBatch(charts):
+    """
+    Pivot points for many tickers in one pass over the stacked charts
+    :param charts: Dict of ticker to stock chart or Bars
+    :return: Dict of ticker to (support, resistance) arrays as returned by getPivotArrays
+    """
+    tickers = [t for t, df in charts.items() if len(df)]
+    if not tickers:
+        return {}
+
+    frames = [charts[t] for t in tickers]
+    lengths = np.array([len(df) for df in frames])
+    groupStarts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    opens = np.concatenate([np.asarray(df['Open'], dtype=np.float64) for df in frames])
+    closes = np.concatenate([np.asarray(df['Close'], dtype=np.float64) for df in frames])
+    counters = np.concatenate([df['Counter'].to_numpy() if 'Counter' in df.columns else np.arange(len(df)) for df in frames])
+    index = np.concatenate([_barTimes(df) for df in frames])
+
+    support, supportPrices, resistance, resistancePrices = findPivots(opens, closes, groupStarts=groupStarts)
+    supportGroups = np.searchsorted(groupStarts, support, side='right') - 1
+    resistanceGroups = np.searchsorted(groupStarts, resistance, side='right') - 1
+
+    pivots = {}
+    for i, ticker in enumerate(tickers):
+        s = supportGroups == i
+        r = resistanceGroups == i
+        pivots[ticker] = ((index[support[s]], supportPrices[s], counters[support[s]]),
+                          (index[resistance[r]], resistancePrices[r], counters[resistance[r]]))
+
+    return pivots
+
+
+def toPivotTuples(pivotArrays):
+    """
+    Convert pivot arrays back to the (datetime, price, counter) tuples the trendline code uses
+    """
+    times, prices, counters = pivotArrays
+    times = pandas.DatetimeIndex(times).to_pydatetime() if len(times) else []
+    return list(zip(times, prices.tolist(), counters.tolist()))
@@ -0,0 +1,263 @@
+import datetime
+import os
+
+import numpy as np
+import pandas
+from dask import delayed, compute
+
+from utils import metrics, sessions
+from utils.bars import Bars
+from utils.bar_store import DAILY, MINUTE, toEasternNaive
+
+DEFAULT_TABLE_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/premarket_stats.parquet'
+
+# Premarket columns are named like getPremarketData's keys
+STATS_COLUMNS = ['Ticker', 'Date', 'Premarket High', 'Premarket High Time', 'Premarket Low (After Top Reached)',
+                 'Premarket Low Time (After Top Reached)', 'Premarket Volume', 'Open', 'Regular Volume', 'Close',
+                 'Previous Close', 'Previous Close Date', 'Gap %', 'Open Gap %']
+
+DEFAULT_MIN_GAP = 20.0
+DEFAULT_MIN_PREMARKET_VOLUME = 100000
+
+def _groupStarts(groups):
+    return np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if len(groups) else np.empty(0, dtype=np.int64)
+
+
+def _eastern(bars):
+    if isinstance(bars, Bars):
+        return bars.datetimes
+    return toEasternNaive(bars['Datetime']).to_numpy(dtype='datetime64[ns]')
+
+
+def _toTimes(minutes):
+    return [datetime.time(m // 60, m % 60) if m >= 0 else None for m in minutes.tolist()]
+
+
+def premarketStats(ticker, bars, daily=None):
+    """
+    Premarket high and its time, low after the high and its time, premarket volume, open and gap of every day
+    of one ticker, with grouped reductions instead of a loop over candles
+    Same rules as getPremarketData: the high is the first candle reaching it, the low is the lowest low after it,
+    and the low time is the last candle that lowered the low, even one before the final high. None when none did
+    :param ticker: Ticker
+    :param bars: Minute bars with Datetime, Open, High, Low, Close and Volume, or Bars, any number of days
+    :param daily: Daily bars of the ticker, dataframe or Bars. The previous close comes from them,
+                  from the previous stored day of minute bars when not given
+    :return: Dataframe with STATS_COLUMNS, one row per day
+    """
+    stamps = _eastern(bars)
+    order = np.argsort(stamps, kind='stable')
+    stamps = stamps[order]
+    highs = np.asarray(bars['High'], dtype=np.float64)[order]
+    lows = np.asarray(bars['Low'], dtype=np.float64)[order]
+    opens = np.asarray(bars['Open'], dtype=np.float64)[order]
+    closes = np.asarray(bars['Close'], dtype=np.float64)[order]
+    volumes = np.asarray(bars['Volume'], dtype=np.int64)[order]
+
+    days, groups = np.unique(stamps.astype('datetime64[D]'), return_inverse=True)
+    minutes = stamps.view(np.int64) // sessions.NS_PER_MINUTE % sessions.MINUTES_PER_DAY
+    codes = sessions.sessionCodes(minutes)
+    count = len(days)
+
+    pmHigh = np.full(count, np.nan)
+    pmHighMinute = np.full(count, -1)
+    pmLow = np.full(count, np.nan)
+    pmLowMinute = np.full(count, -1)
+    pmVolume = np.zeros(count, dtype=np.int64)
+
+    pm = np.flatnonzero(codes == sessions.PREMARKET)
+    if len(pm):
+        g = groups[pm]
+        h = highs[pm]
+        low = lows[pm]
+        positions = np.arange(len(pm))
+        starts = _groupStarts(g)
+        ends = np.r_[starts[1:], len(pm)] - 1
+        found = g[starts]
+
+        # A candle is a new high when it beats the running high before it, which getPremarketData starts at 0
+        runningHigh = pandas.Series(h).groupby(g).cummax().to_numpy()
+        previousHigh = np.r_[0.0, runningHigh[:-1]]
+        previousHigh[starts] = 0.0
+        isHigh = h > previousHigh
+
+        # Every new high restarts the low after it at the high, later candles lower it
+        runningLow = pandas.Series(np.where(isHigh, h, low)).groupby(np.cumsum(isHigh)).cummin().to_numpy()
+        previousLow = np.r_[np.inf, runningLow[:-1]]
+        isLow = ~isHigh & (low < previousLow)
+
+        lastHigh = np.maximum.reduceat(np.where(isHigh, positions, -1), starts)
+        lastLow = np.maximum.reduceat(np.where(isLow, positions, -1), starts)
+        hasLow = lastLow >= 0
+
+        pmHigh[found] = runningHigh[ends]
+        pmHighMinute[found] = minutes[pm][lastHigh]
+        pmLow[found] = runningLow[ends]
+        pmLowMinute[found[hasLow]] = minutes[pm][lastLow[hasLow]]
+        pmVolume[found] = np.add.reduceat(volumes[pm], starts)
+
+    dayOpen = np.full(count, np.nan)
+    dayClose = np.full(count, np.nan)
+    regularVolume = np.zeros(count, dtype=np.int64)
+
+    regular = np.flatnonzero(codes == sessions.REGULAR)
+    if len(regular):
+        g = groups[regular]
+        starts = _groupStarts(g)
+        found = g[starts]
+        dayOpen[found] = opens[regular][starts]
+        dayClose[found] = closes[regular][np.r_[starts[1:], len(regular)] - 1]
+        regularVolume[found] = np.add.reduceat(volumes[regular], starts)
+
+    dates = days.astype('datetime64[ns]')
+    if daily is not None and len(daily):
+        dailyDates = _eastern(daily).astype('datetime64[D]')
+        dailyOrder = np.argsort(dailyDates, kind='stable')
+        dailyDates = dailyDates[dailyOrder].astype('datetime64[ns]')
+        dailyCloses = np.asarray(daily['Close'], dtype=np.float64)[dailyOrder]
+        previous = np.searchsorted(dailyDates, dates, side='left') - 1
+        known = previous >= 0
+        previousClose = np.where(known, dailyCloses[np.maximum(previous, 0)], np.nan)
+        previousDate = np.where(known, dailyDates[np.maximum(previous, 0)], np.datetime64('NaT'))
+    else:
+        previousClose = np.r_[np.nan, dayClose[:-1]][:count]
+        previousDate = np.r_[np.datetime64('NaT'), dates[:-1]][:count].astype('datetime64[ns]')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap = (pmHigh / previousClose - 1) * 100
+        openGap = (dayOpen / previousClose - 1) * 100
+
+    return pandas.DataFrame({
+        'Ticker': ticker.upper(),
+        'Date': dates,
+        'Premarket High': pmHigh,
+        'Premarket High Time': _toTimes(pmHighMinute),
+        'Premarket Low (After Top Reached)': pmLow,
+        'Premarket Low Time (After Top Reached)': _toTimes(pmLowMinute),
+        'Premarket Volume': pmVolume,
+        'Open': dayOpen,
+        'Regular Volume': regularVolume,
+        'Close': dayClose,
+        'Previous Close': previousClose,
+        'Previous Close Date': previousDate,
+        'Gap %': gap,
+        'Open Gap %': openGap,
+    }, columns=STATS_COLUMNS)
+
+
+def _tickerStats(store, ticker, start, end):
+    with metrics.timer(metrics.PARSE, ticker):
+        bars = store.readBars(ticker, MINUTE, start, end, deriveDateTime=False)
+        daily = store.readBars(ticker, DAILY, deriveDateTime=False) if store.partitions(ticker, DAILY) else None
+    with metrics.timer(metrics.INDICATOR, ticker):
+        return premarketStats(ticker, bars, daily)
+
+
+def buildPremarketTable(store, tickers=None, start=None, end=None, workers=None, path=DEFAULT_TABLE_PATH):
+    """
+    Premarket stats of every stored ticker-day, computed in parallel and saved as one table
+    Each task reads the minute partitions of one ticker, since a day's gap needs the days before it
+    :param store: BarStore with minute bars, and daily bars for the previous closes when it has them
+    :param tickers: Tickers to process, defaults to every ticker with minute bars
+    :param start: First date
+    :param end: Last date
+    :param workers: Number of processes, defaults to every core. 1 runs in this process
+    :param path: Parquet file the table is merged into, not saved when None
+    :return: Dataframe with STATS_COLUMNS sorted by Date then Ticker
+    """
+    tickers = tickers if tickers is not None else store.tickers(MINUTE)
+    if workers == 1:
+        results = compute(*[delayed(_tickerStats)(store, ticker, start, end) for ticker in tickers],
+                          scheduler='synchronous')
+    else:
+        enabled = metrics.enabled()
+        tasks = [delayed(metrics.workerTask)(enabled, _tickerStats, store, ticker, start, end) for ticker in tickers]
+        results = []
+        for result, registry in compute(*tasks, scheduler='processes', num_workers=workers):
+            metrics.merge(registry)
+            results.append(result)
+
+    table = pandas.concat(results, ignore_index=True) if results else premarketStats('', _emptyBars())
+    table = table.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+
+    if path is not None:
+        table = savePremarketTable(table, path)
+    return table
+
+
+def _emptyBars():
+    return pandas.DataFrame({'Datetime': pandas.Series(dtype='datetime64[ns]'),
+                             **{column: pandas.Series(dtype='float64') for column in ['Open', 'High', 'Low', 'Close']},
+                             'Volume': pandas.Series(dtype='int64')})
+
+
+def loadPremarketTable(path=DEFAULT_TABLE_PATH):
+    """
+    :return: Saved table, empty when there is none
+    """
+    if not os.path.exists(path):
+        return premarketStats('', _emptyBars())
+
+    table = pandas.read_parquet(path)
+    table['Ticker'] = table['Ticker'].astype(object)
+    return table
+
+
+def savePremarketTable(table, path=DEFAULT_TABLE_PATH):
+    """
+    Merge rows into the saved table, replacing saved rows of the same ticker and date
+    :return: Merged table
+    """
+    saved = loadPremarketTable(path)
+    if not saved.empty:
+        table = pandas.concat([saved, table], ignore_index=True).drop_duplicates(['Ticker', 'Date'], keep='last')
+        table = table.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    stored = table.copy()
+    stored['Ticker'] = stored['Ticker'].astype('category')
+    stored.to_parquet('{0}.tmp'.format(path), index=False)
+    os.replace('{0}.tmp'.format(path), path)
+    return table
+
+
+def gapUpCandidates(table, minGap=DEFAULT_MIN_GAP, minPremarketVolume=DEFAULT_MIN_PREMARKET_VOLUME, start=None,
+                    end=None, tickers=None):
+    """
+    Ticker-days that gapped up in premarket on volume, biggest gap first
+    Pass list(zip(candidates['Ticker'], candidates['Date'])) as backTestDipAndRip's tickerDates to test only them
+    :param table: Premarket stats table
+    :param minGap: Minimum Gap % of the premarket high over the previous close
+    :param minPremarketVolume: Minimum premarket volume
+    :param start: First date
+    :param end: Last date
+    :param tickers: Only these tickers
+    :return: Dataframe of matching rows
+    """
+    mask = (table['Gap %'] >= minGap) & (table['Premarket Volume'] >= minPremarketVolume)
+    if start is not None:
+        mask &= table['Date'] >= pandas.Timestamp(start)
+    if end is not None:
+        mask &= table['Date'] <= pandas.Timestamp(end)
+    if tickers is not None:
+        mask &= table['Ticker'].isin([ticker.upper() for ticker in tickers])
+
+    return table[mask].sort_values(['Gap %', 'Date'], ascending=[False, True], kind='mergesort') \
+        .reset_index(drop=True)
+
+
+def joinPremarketStats(df, table, dateColumn='Trade Date'):
+    """
+    Add the premarket stats of each row's ticker-day, e.g. to Dip and Rip backtest results
+    :param df: Dataframe with Ticker and a date column
+    :param table: Premarket stats table
+    :param dateColumn: Column holding the date
+    :return: df with the stats columns appended, NaN where the table has no row
+    """
+    keys = pandas.DataFrame({'Ticker': df['Ticker'].astype(str).str.upper().to_numpy(),
+                             'Date': pandas.to_datetime(df[dateColumn]).dt.normalize().to_numpy()})
+    stats = keys.merge(table, on=['Ticker', 'Date'], how='left')
+    stats = stats.drop(columns=['Ticker', 'Date'] + [column for column in df.columns if column in stats.columns])
+    return pandas.concat([df.reset_index(drop=True), stats], axis=1)
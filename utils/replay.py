@@ -0,0 +1,199 @@
+import datetime
+import heapq
+import time
+from collections import namedtuple
+from itertools import repeat
+
+import pyarrow.parquet as pq
+
+from utils.bar_store import MINUTE, toEasternNaive
+from utils.bars import Bars
+
+Bar = namedtuple('Bar', ['Datetime', 'Ticker', 'Open', 'High', 'Low', 'Close', 'Volume'])
+
+BAR_FIELDS = ['Datetime', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+# Rows converted to Bar objects at a time, the most a source holds besides its column arrays
+BATCH_SIZE = 1024
+
+
+def _columnEvents(ticker, datetimes, opens, highs, lows, closes, volumes, batchSize=BATCH_SIZE):
+    """
+    Bars of one ticker from numpy column arrays, converting batchSize rows at a time to python objects
+    :param datetimes: Naive Eastern datetime64 values
+    """
+    columns = [datetimes.astype('datetime64[us]'), opens, highs, lows, closes, volumes]
+    for start in range(0, len(datetimes), batchSize):
+        stamps, *prices = [column[start:start + batchSize].tolist() for column in columns]
+        yield from map(Bar._make, zip(stamps, repeat(ticker), *prices))
+
+
+def partitionEvents(path, ticker, batchSize=BATCH_SIZE):
+    """
+    Bars of one stored partition, read through a memory map one record batch at a time
+    Nothing is read until the first bar is asked for, then only the current batch is held
+    :param path: Parquet partition of a BarStore
+    :param ticker: Ticker
+    :param batchSize: Rows read and converted at a time
+    :return: Generator of Bar
+    """
+    parquetFile = pq.ParquetFile(path, memory_map=True)
+    for batch in parquetFile.iter_batches(batch_size=batchSize, columns=BAR_FIELDS):
+        datetimes = batch.column(0)
+        if datetimes.type.tz is not None:
+            datetimes = toEasternNaive(datetimes.to_pandas()).to_numpy(dtype='datetime64[ns]')
+        else:
+            datetimes = datetimes.to_numpy(zero_copy_only=False)
+        yield from _columnEvents(ticker, datetimes,
+                                 *[batch.column(i).to_numpy(zero_copy_only=False) for i in range(1, len(BAR_FIELDS))],
+                                 batchSize=batchSize)
+
+
+def frameEvents(ticker, df):
+    """
+    Bars of one chart with Datetime, Open, High, Low, Close and Volume columns, or of Bars, oldest first
+    tz-aware or epoch Datetime values are replayed on the Eastern wall clock like the BarStore keeps them
+    :return: Iterator of Bar
+    """
+    if isinstance(df, Bars):
+        return _columnEvents(ticker, *[df[field] for field in BAR_FIELDS])
+
+    df = df.sort_values('Datetime', kind='mergesort')
+    datetimes = toEasternNaive(df['Datetime']).to_numpy(dtype='datetime64[ns]')
+    return _columnEvents(ticker, datetimes, *[df[field].to_numpy() for field in BAR_FIELDS[1:]])
+
+
+def storeSources(store, tickers=None, start=None, end=None):
+    """
+    One time ordered bar source per ticker, chaining its daily minute partitions
+    :param store: BarStore with minute bars
+    :param tickers: Tickers to replay, defaults to every ticker in the store
+    :param start: First date, as YYYY-MM-DD or date
+    :param end: Last date
+    :return: List of iterators of Bar
+    """
+    start = str(start) if start is not None else None
+    end = str(end) if end is not None else None
+    sources = []
+
+    for ticker in tickers if tickers is not None else store.tickers(MINUTE):
+        partitions = [p for p in store.partitions(ticker, MINUTE)
+                      if (start is None or p >= start) and (end is None or p <= end)]
+        if partitions:
+            sources.append(_tickerEvents(store, ticker, partitions))
+
+    return sources
+
+
+def _tickerEvents(store, ticker, partitions):
+    for partition in partitions:
+        yield from partitionEvents(store.partitionPath(ticker, partition, MINUTE), ticker)
+
+
+def frameSources(frames):
+    """
+    :param frames: Dict of ticker to chart or Bars
+    :return: List of iterators of Bar
+    """
+    return [frameEvents(ticker, df) for ticker, df in frames.items()]
+
+
+class StubBarFeed:
+    """
+    Local stand in for a live feed: one random walk bar per ticker every minute, minute by minute
+    """
+    def __init__(self, tickers, date, start=datetime.time(4, 0), end=datetime.time(11, 30), seed=0):
+        self.tickers = list(tickers)
+        self.date = date
+        self.start = start
+        self.end = end
+        self.seed = seed
+
+    def __iter__(self):
+        import numpy as np
+
+        rng = np.random.default_rng(self.seed)
+        count = len(self.tickers)
+        stamp = datetime.datetime.combine(self.date, self.start)
+        last = datetime.datetime.combine(self.date, self.end)
+        closes = rng.uniform(1, 20, count)
+
+        while stamp <= last:
+            opens = closes
+            closes = np.maximum(np.round(opens * (1 + rng.normal(0, 0.01, count)), 2), 0.01)
+            highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.005, count))
+            lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.005, count))
+            volumes = rng.integers(0, 20000, count)
+
+            yield from map(Bar._make, zip(repeat(stamp), self.tickers, opens.tolist(), highs.tolist(), lows.tolist(),
+                                          closes.tolist(), volumes.tolist()))
+            stamp += datetime.timedelta(minutes=1)
+
+
+class ReplayEngine:
+    """
+    Replay bars of many tickers as one time ordered event stream, like a live feed would deliver them
+    Sources are merged with a heap holding the next bar of each source. Store sources read one record
+    batch of one partition at a time, so memory grows with the number of tickers, not the days replayed
+    Bars with the same time come out in ticker order
+    """
+    def __init__(self, sources):
+        """
+        :param sources: Iterables of Bar, each in time order, e.g. storeSources, frameSources or [StubBarFeed]
+        """
+        self.sources = list(sources)
+        self.callbacks = []
+        self.stats = {}
+
+    def subscribe(self, callback):
+        """
+        :param callback: Function called with every Bar, or an object with an onBar(bar) method
+        """
+        self.callbacks.append(callback.onBar if hasattr(callback, 'onBar') else callback)
+        return callback
+
+    def events(self):
+        return heapq.merge(*self.sources)
+
+    def run(self, speed=None, limit=None):
+        """
+        Dispatch every bar to the subscribers
+        :param speed: None replays as fast as possible, otherwise market time runs speed times faster than wall time
+                      (60 plays a minute bar every second)
+        :param limit: Stop after this many bars
+        :return: Dict with Events, Seconds, Events Per Second and the First and Last bar time
+        """
+        callbacks = self.callbacks
+        events = 0
+        first = last = None
+        start = time.perf_counter()
+
+        for bar in self.events():
+            if speed is not None:
+                if first is None:
+                    first = bar.Datetime
+                due = start + (bar.Datetime - first).total_seconds() / speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+
+            for callback in callbacks:
+                callback(bar)
+
+            events += 1
+            last = bar.Datetime
+            if first is None:
+                first = bar.Datetime
+            if limit is not None and events >= limit:
+                break
+
+        seconds = time.perf_counter() - start
+        self.stats = {
+            'Events': events,
+            'Seconds': seconds,
+            'Events Per Second': events / seconds if seconds > 0 else 0.0,
+            'First': first,
+            'Last': last,
+        }
+        return self.stats
+
@@ -0,0 +1,190 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import time
+
+import pandas
+
+TD = 'td'
+ALPHA_VANTAGE = 'alphavantage'
+
+DEFAULT_CACHE_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/response_cache'
+
+# Ranges reaching today can still change, closed ranges are kept until evicted
+DEFAULT_TTL = 15 * 60
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+INDEX_FILE = 'index.sqlite'
+
+
+def cacheKey(provider, symbol, frequency, start, end, part=None):
+    """
+    Key of one price history request
+    :param part: Part of the range asked for, e.g. an Alpha Vantage slice name
+    :return: String key
+    """
+    fields = [provider, symbol.upper(), frequency, pandas.Timestamp(start).isoformat(), pandas.Timestamp(end).isoformat()]
+    return '|'.join(fields + [part] if part else fields)
+
+
+def isClosedRange(end, today=None):
+    """
+    A range is closed when it ends before today, its candles will not change anymore
+    """
+    today = today if today else datetime.date.today()
+    return pandas.Timestamp(end).date() < today
+
+
+class ResponseCache:
+    """
+    On disk cache of parsed price history responses
+    Each response is a parquet file, a sqlite index holds the key, size, last access and expiry of every entry
+    Least recently used entries are evicted once the cache grows past maxBytes
+    """
+    def __init__(self, root=DEFAULT_CACHE_PATH, maxBytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.root = root
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+
+    def __getstate__(self):
+        # sqlite connections can't cross processes, every worker opens its own
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(self.root, INDEX_FILE), timeout=30)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, file TEXT, size INTEGER, created REAL, accessed REAL, expires REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            self._connection.commit()
+        return self._connection
+
+    def entryPath(self, key):
+        return os.path.join(self.root, '{0}.parquet'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+    def get(self, provider, symbol, frequency, start, end, part=None):
+        """
+        Cached response for a request
+        :return: Dataframe, or None on a miss
+        """
+        key = cacheKey(provider, symbol, frequency, start, end, part)
+        row = self.connection.execute('SELECT file, expires FROM entries WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+
+        if row is not None and (row[1] is None or row[1] > now):
+            try:
+                df = pandas.read_parquet(os.path.join(self.root, row[0]))
+            except (OSError, ValueError):
+                df = None
+
+            if df is not None:
+                with self.connection:
+                    self.connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                self.hits += 1
+                return df
+
+        if row is not None:
+            self._remove(key, row[0])
+        self.misses += 1
+        return None
+
+    def put(self, provider, symbol, frequency, start, end, df, part=None, closed=None):
+        """
+        Store a response. Ranges reaching today expire after ttl seconds
+        :param df: Parsed candle data
+        :param part: Part of the range asked for, e.g. an Alpha Vantage slice name
+        :param closed: Whether the response can no longer change, defaults to whether end is before today
+        """
+        key = cacheKey(provider, symbol, frequency, start, end, part)
+        path = self.entryPath(key)
+        os.makedirs(self.root, exist_ok=True)
+
+        tmpPath = '{0}.tmp'.format(path)
+        df.to_parquet(tmpPath, index=False)
+        os.replace(tmpPath, path)
+
+        now = time.time()
+        closed = isClosedRange(end) if closed is None else closed
+        expires = None if closed else now + self.ttl
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                                    (key, os.path.basename(path), os.path.getsize(path), now, now, expires))
+        self.evict()
+
+    def fetch(self, provider, symbol, frequency, start, end, loader, part=None, closed=None):
+        """
+        Cached response, calling loader and caching what it returns on a miss
+        :param loader: Function with no arguments making the request
+        :param part: Part of the range asked for, e.g. an Alpha Vantage slice name
+        :param closed: Whether the response can no longer change, defaults to whether end is before today
+        :return: Dataframe
+        """
+        df = self.get(provider, symbol, frequency, start, end, part)
+        if df is None:
+            df = loader()
+            self.put(provider, symbol, frequency, start, end, df, part, closed)
+        return df
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in maxBytes
+        :return: Number of entries dropped
+        """
+        total = self.size()
+        dropped = 0
+        if total <= self.maxBytes:
+            return dropped
+
+        for key, file, size in self.connection.execute(
+                'SELECT key, file, size FROM entries ORDER BY accessed').fetchall():
+            if total <= self.maxBytes:
+                break
+            self._remove(key, file)
+            total -= size
+            dropped += 1
+
+        return dropped
+
+    def _remove(self, key, file):
+        with self.connection:
+            self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+        try:
+            os.remove(os.path.join(self.root, file))
+        except FileNotFoundError:
+            pass
+
+    def size(self):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def clear(self):
+        for key, file in self.connection.execute('SELECT key, file FROM entries').fetchall():
+            self._remove(key, file)
+
+    def stats(self):
+        """
+        Hit and miss counts of this instance plus what the cache holds
+        :return: Dict of stats
+        """
+        lookups = self.hits + self.misses
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Hit Rate': self.hits / lookups if lookups else 0.0,
+            'Entries': self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+            'Bytes': self.size(),
+        }
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,35 @@
+import os
+
+import pandas
+
+
+class CsvResultSink:
+    """
+    Append backtest results to a csv file as they come in, with a second csv logging
+    how long every task took and any error it raised
+    """
+    def __init__(self, resultPath, logPath=None):
+        self.resultPath = resultPath
+        self.logPath = logPath if logPath else '{0}_log.csv'.format(os.path.splitext(resultPath)[0])
+        self.resultHeader = not os.path.exists(self.resultPath)
+        self.logHeader = not os.path.exists(self.logPath)
+        self.results = 0
+        self.errors = 0
+
+    def write(self, record):
+        """
+        Write one finished task
+        :param record: Dict with a 'Result' dataframe (or None) and the log fields
+        """
+        result = record.get('Result')
+        if result is not None and not result.empty:
+            result.to_csv(self.resultPath, mode='a', header=self.resultHeader, index=False)
+            self.resultHeader = False
+            self.results += len(result)
+
+        if record.get('Error'):
+            self.errors += 1
+
+        log = pandas.DataFrame([{k: v for k, v in record.items() if k != 'Result'}])
+        log.to_csv(self.logPath, mode='a', header=self.logHeader, index=False)
+        self.logHeader = False
@@ -0,0 +1,129 @@
+import datetime
+
+import numpy as np
+import pandas
+
+# Minutes since midnight, Eastern wall clock. Sessions are half open: 9:30 is the first regular bar, 16:00 the
+# first after hours bar
+MARKET_OPEN_MINUTE = 9 * 60 + 30
+MARKET_CLOSE_MINUTE = 16 * 60
+MINUTES_PER_DAY = 24 * 60
+
+NS_PER_MINUTE = 60 * 10 ** 9
+
+PREMARKET = 0
+REGULAR = 1
+AFTER_HOURS = 2
+
+
+def minutesOfDay(data):
+    """
+    Minute of the day of every candle, from the Datetime column when it holds datetimes else from Time
+    :param data: Candle data or Bars
+    :return: int64 array
+    """
+    if hasattr(data, 'minutesOfDay'):
+        return data.minutesOfDay()
+    if 'Datetime' in data.columns and pandas.api.types.is_datetime64_any_dtype(data['Datetime']):
+        stamps = data['Datetime']
+        if stamps.dt.tz is not None:
+            stamps = stamps.dt.tz_localize(None)
+        return stamps.to_numpy(dtype='datetime64[ns]').view(np.int64) // NS_PER_MINUTE % MINUTES_PER_DAY
+
+    return np.array([t.hour * 60 + t.minute for t in data['Time']], dtype=np.int64)
+
+
+def sessionCodes(minutes):
+    """
+    :param minutes: Minute of the day of every candle
+    :return: int8 array of PREMARKET, REGULAR or AFTER_HOURS
+    """
+    return (minutes >= MARKET_OPEN_MINUTE).astype(np.int8) + (minutes >= MARKET_CLOSE_MINUTE)
+
+
+class SessionIndex:
+    """
+    Premarket, regular and after hours boundaries of a chart, found once from integer minutes of the day
+    A chart in time order is one contiguous run per session, so each session is a positional slice of it
+    Multi day or unsorted charts are stably grouped by session once, keeping time order inside each session
+    """
+    def __init__(self, data):
+        """
+        :param data: Candle data with a Datetime or Time column, or Bars
+        """
+        minutes = minutesOfDay(data)
+        codes = sessionCodes(minutes)
+
+        if len(codes) and np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind='stable')
+            data = data.take(order)
+            minutes = minutes[order]
+            codes = codes[order]
+
+        counts = np.bincount(codes, minlength=3)
+        self.data = data
+        self.minutes = minutes
+        self.bounds = (0, int(counts[0]), int(counts[0] + counts[1]), len(codes))
+
+    def rows(self, start, end):
+        if isinstance(self.data, pandas.DataFrame):
+            return self.data.iloc[start:end]
+        return self.data[start:end]
+
+    def session(self, code):
+        return self.rows(self.bounds[code], self.bounds[code + 1])
+
+    @property
+    def premarket(self):
+        return self.session(PREMARKET)
+
+    @property
+    def regularMarket(self):
+        return self.session(REGULAR)
+
+    @property
+    def afterHours(self):
+        return self.session(AFTER_HOURS)
+
+    def split(self):
+        """
+        :return: Premarket, regular market and after hours candles
+        """
+        return self.premarket, self.regularMarket, self.afterHours
+
+    def timeAt(self, position):
+        if 'Time' in self.data.columns:
+            return self.data['Time'].iat[position]
+        minute = int(self.minutes[position])
+        return datetime.time(minute // 60, minute % 60)
+
+    def stats(self):
+        """
+        Premarket and regular session highs, lows, their times and volumes, without sorting
+        Ties go to the earliest candle. Values of an empty session are None
+        :return: Dict of stats
+        """
+        start, openAt, closeAt, end = self.bounds
+        highs = np.asarray(self.data['High'])
+        lows = np.asarray(self.data['Low'])
+        volumes = np.asarray(self.data['Volume'])
+        stats = {}
+
+        for name, first, last in [('Premarket', start, openAt), ('Regular', openAt, closeAt)]:
+            if first == last:
+                stats.update({'{0} High'.format(name): None, '{0} High Time'.format(name): None,
+                              '{0} Low'.format(name): None, '{0} Low Time'.format(name): None,
+                              '{0} Volume'.format(name): 0})
+                continue
+            high = first + int(highs[first:last].argmax())
+            low = first + int(lows[first:last].argmin())
+            stats.update({
+                '{0} High'.format(name): highs[high],
+                '{0} High Time'.format(name): self.timeAt(high),
+                '{0} Low'.format(name): lows[low],
+                '{0} Low Time'.format(name): self.timeAt(low),
+                '{0} Volume'.format(name): volumes[first:last].sum(),
+            })
+
+        stats['After Hours Volume'] = volumes[closeAt:end].sum()
+        return stats
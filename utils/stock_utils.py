@@ -2,46 +2,70 @@ from pandas_datareader import data
 from pandas_datareader._utils import RemoteDataError
 from pandas.tseries.offsets import BDay
 from finvizfinance.screener.custom import Custom
-from utils import math_calcs
+from utils import pivot_engine, trendline_engine, response_cache, intraday_parser, metrics, sessions, \
+    premarket_stats
+from utils.bars import Bars
+from utils.bar_store import DAILY, MINUTE, EASTERN, toDailyChart
 from dask import delayed
 from config.configuration import TD_API, ALPHA_VANTAGE
 import pandas
 import datetime
 import numpy as np
 import requests
-import csv
 
-EPOCH = datetime.datetime.utcfromtimestamp(0)
+TD_CANDLE_TYPES = {
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'volume': 'int64',
+    'datetime': 'int64',
+}
 
-HOUR_ADJUSTMENT = 5
+# Newest Alpha Vantage extended intraday slice, the only one still taking new bars
+CURRENT_SLICE_AV = 'year1month1'
 
 ### FOR TD API ###
 
 def unixTimeMs(dateAndTime):
     """
-    Convert datetime to milliseconds subtract epoch time. Feed back the integers for API
+    Convert datetime to milliseconds since epoch. Feed back the integers for API
+    Naive datetimes are Eastern wall clock time, daylight saving included
     :param dateAndTime: Datetime of specific date
     :return: Integer representation of milliseconds
     """
-    dateAndTime = dateAndTime + datetime.timedelta(hours=HOUR_ADJUSTMENT)
-    return int((dateAndTime - EPOCH).total_seconds() * 1000.0)
+    timestamp = pandas.Timestamp(dateAndTime)
+    timestamp = timestamp.tz_localize(EASTERN) if timestamp.tzinfo is None else timestamp.tz_convert(EASTERN)
+    return timestamp.value // 1000000
+
+def easternTimestamps(epochMs):
+    """
+    Convert epoch milliseconds to America/New_York timestamps in one pass
+    :param epochMs: Sequence of epoch milliseconds
+    :return: Timezone aware DatetimeIndex
+    """
+    return pandas.to_datetime(np.asarray(epochMs, dtype='int64'), unit='ms', utc=True).tz_convert(EASTERN)
 
 def convertToEST(timestamp):
     """
     Convert timestamps in json data's candles to EST
     :return: Time in EST format
     """
-    newDateTime = datetime.datetime.fromtimestamp(timestamp/1000)
+    newDateTime = pandas.Timestamp(timestamp, unit='ms', tz='UTC').tz_convert(EASTERN)
     return newDateTime.date(), newDateTime.time()
 
 def convertData(data):
     """
     Adjust raw json data to usable stock data
+    Bars.fromCandles(data['candles']) gives the compact form instead
     :param data: Json data of candles
     :return: Usable stock data
     """
-    for candle in data['candles']:
-        candle['date'],candle['time'] = convertToEST(candle['datetime'])
+    stamps = easternTimestamps([candle['datetime'] for candle in data['candles']])
+    dates, times = intraday_parser.dateAndTimeColumns(stamps.tz_localize(None))
+
+    for candle, date, time in zip(data['candles'], dates, times):
+        candle['date'], candle['time'] = date, time
 
     return data
 
@@ -58,43 +82,84 @@ def timeOffSet(time1, time2):
 
     return monthOffSet//12 + 1, monthOffSet%12 + 1, dayOffSet
 
-def getIntradayDataAV(symbol, asof=None):
-    asofOffsetYear, asofOffsetMonth, _ = timeOffSet(datetime.date.today(), asof)
+def intradaySliceAV(asof, today=None):
+    """
+    Alpha Vantage extended intraday slice holding asof. Slices count back in months from today,
+    so the same asof falls in a later slice once a month rolls over
+    :return: Slice name such as year1month2
+    """
+    asofOffsetYear, asofOffsetMonth, _ = timeOffSet(today if today else datetime.date.today(), asof)
+    return 'year{0}month{1}'.format(asofOffsetYear, asofOffsetMonth)
 
-    csvUrl = 'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY_EXTENDED&' \
-             'symbol={0}&interval=1min&slice=year{1}month{2}&apikey={3}'.format(symbol,asofOffsetYear, asofOffsetMonth, ALPHA_VANTAGE['API_KEY'])
+def intradayUrlAV(symbol, asof, baseUrl='https://www.alphavantage.co', today=None):
+    return '{0}/query?function=TIME_SERIES_INTRADAY_EXTENDED&' \
+           'symbol={1}&interval=1min&slice={2}&apikey={3}'.format(baseUrl, symbol, intradaySliceAV(asof, today), ALPHA_VANTAGE['API_KEY'])
 
-    with requests.Session() as s:
-        download = s.get(csvUrl)
-        decoded_content = download.content.decode('utf-8')
-        cr = csv.reader(decoded_content.splitlines(), delimiter=',')
-        ls = list(cr)
-
-    columns = [i.title() for i in ls[0]]
-    data = ls[1:]
-    df = pandas.DataFrame(data[::-1], columns=columns)
-
-    df['Datetime'] = pandas.to_datetime(df['Time'])
-
-    df['Date'] = pandas.to_datetime(df['Datetime']).dt.date
-    df['Time'] = pandas.to_datetime(df['Datetime']).dt.time
-
-    # using dictionary to convert specific columns
-    typeMap = {
-        'Open': float,
-        'High': float,
-        'Low': float,
-        'Close': float,
-        'Volume': int,
-    }
+def intradayCacheArgsAV(asof, today=None):
+    """
+    Response cache arguments of an Alpha Vantage slice: keyed by the slice and the day it was asked on,
+    kept for good unless it is the newest slice, which still takes today's bars
+    :return: Dict of start, end, part and closed
+    """
+    today = today if today else datetime.date.today()
+    sliceName = intradaySliceAV(asof, today)
+    return {'start': today, 'end': today, 'part': sliceName, 'closed': sliceName != CURRENT_SLICE_AV}
 
-    df = df.astype(typeMap)
+def parseIntradayDataAV(content):
+    """
+    Convert the Alpha Vantage intraday csv response to candle data
+    :param content: Raw bytes of the response or a binary stream of it
+    :return: Dataframe of candles, oldest first
+    """
+    return intraday_parser.parseIntradayCsv(content)
+
+def downloadIntradayDataAV(symbol, asof, today=None):
+    with requests.Session() as s:
+        with metrics.timer(metrics.FETCH, symbol):
+            download = s.get(intradayUrlAV(symbol, asof, today=today), stream=True)
+        with download:
+            download.raw.decode_content = True
+            # The body streams into the parser, so PARSE includes receiving it
+            with metrics.timer(metrics.PARSE, symbol):
+                return parseIntradayDataAV(download.raw)
+
+def getIntradayDataAV(symbol, asof=None, store=None, cache=None):
+    if cache is not None:
+        today = datetime.date.today()
+        df = cache.fetch(response_cache.ALPHA_VANTAGE, symbol, MINUTE, loader=lambda: downloadIntradayDataAV(symbol, asof, today),
+                         **intradayCacheArgsAV(asof, today))
+    else:
+        df = downloadIntradayDataAV(symbol, asof)
+
+    if store is not None:
+        store.writeBars(symbol, df, MINUTE)
 
     return df
 
-def getDailyDataTD(symbol, startDate, endDate):
-    priceHistory = "https://api.tdameritrade.com/v1/marketdata/{symbol}/pricehistory".format(symbol=symbol)
-    dailyChartPayLoad = {
+def priceHistoryUrlTD(symbol):
+    return "https://api.tdameritrade.com/v1/marketdata/{symbol}/pricehistory".format(symbol=symbol)
+
+def priceHistoryParamsTD(startDate, endDate, frequency=DAILY):
+    """
+    TD price history query for daily candles over a year or minute candles with extended hours
+    :param startDate: Start datetime
+    :param endDate: End datetime
+    :param frequency: daily or minute
+    :return: Dict of query parameters
+    """
+    if frequency == DAILY:
+        return {
+            'apikey': TD_API['API_KEY'],
+            'periodType': 'year',
+            'frequencyType': 'daily',
+            'frequency': '1',
+            'period': '1',
+            'endDate': str(unixTimeMs(endDate)),
+            'startDate': str(unixTimeMs(startDate)),
+            'needExtendedHoursData': 'False'
+        }
+
+    return {
         'apikey': TD_API['API_KEY'],
         'periodType': 'day',
         'frequencyType': 'minute',
@@ -104,50 +169,72 @@ def getDailyDataTD(symbol, startDate, endDate):
         'startDate': str(unixTimeMs(startDate)),
         'needExtendedHoursData': 'true'
     }
-    content = requests.get(url=priceHistory, params=dailyChartPayLoad)
-    data = content.json()
-    data = convertData(data)
-    data = pandas.DataFrame(data['candles'])
-    data.columns = data.columns.str.capitalize()
+
+def parsePriceHistoryTD(data):
+    """
+    Convert the TD price history json to candle data
+    Datetime is the candle time in America/New_York, Date and Time its Eastern wall clock date and time
+    :param data: Json data of candles
+    :return: Dataframe of candles
+    """
+    candles = data['candles']
+    data = pandas.DataFrame({
+        column.capitalize(): np.array([candle[column] for candle in candles], dtype=dtype)
+        for column, dtype in TD_CANDLE_TYPES.items()
+    })
+    data['Datetime'] = easternTimestamps(data['Datetime'])
+    data['Date'], data['Time'] = intraday_parser.dateAndTimeColumns(data['Datetime'].dt.tz_localize(None))
+    return data
+
+def downloadPriceHistoryTD(symbol, startDate, endDate, frequency=DAILY):
+    with metrics.timer(metrics.FETCH, symbol):
+        content = requests.get(url=priceHistoryUrlTD(symbol), params=priceHistoryParamsTD(startDate, endDate, frequency))
+    with metrics.timer(metrics.PARSE, symbol):
+        return parsePriceHistoryTD(content.json())
+
+def fetchPriceHistoryTD(symbol, startDate, endDate, frequency=DAILY, cache=None):
+    """
+    TD price history, served from the response cache when one is given
+    :param cache: ResponseCache
+    :return: Dataframe of candles
+    """
+    if cache is None:
+        return downloadPriceHistoryTD(symbol, startDate, endDate, frequency)
+
+    return cache.fetch(response_cache.TD, symbol, frequency, startDate, endDate,
+                       lambda: downloadPriceHistoryTD(symbol, startDate, endDate, frequency))
+
+def getDailyDataTD(symbol, startDate, endDate, store=None, cache=None):
+    data = fetchPriceHistoryTD(symbol, startDate, endDate, MINUTE, cache)
+
+    if store is not None:
+        store.writeBars(symbol, data, MINUTE)
+
     return data
 
 def splitCandles(data):
     """
     Split the daily set of candle for the given stock into premarket, regular market and after hours
+    The 9:30 candle opens the regular market and the 16:00 candle opens after hours
     :param data: Json data of candles
     :return: Premarket candles, Regular Market, After hours
     """
+    return sessions.SessionIndex(data).split()
 
-    premarket = data[(data['Time'] < datetime.time(9,30))]
-    regularMarket = data[(data['Time'] > datetime.time(9, 30)) & (data['Time'] < datetime.time(16,0))]
-    afterhour = data[(data['Time'] > datetime.time(16,0))]
+def getYearlyDataTD(symbol, startDate, endDate, store=None, cache=None):
+    data = fetchPriceHistoryTD(symbol, startDate, endDate, DAILY, cache)
 
-    return premarket, regularMarket, afterhour
+    if store is not None:
+        store.writeBars(symbol, data, DAILY)
 
-def getYearlyDataTD(symbol, startDate, endDate):
-    priceHistory = "https://api.tdameritrade.com/v1/marketdata/{symbol}/pricehistory".format(symbol=symbol)
-    dailyChartPayLoad = {
-        'apikey': TD_API['API_KEY'],
-        'periodType': 'year',
-        'frequencyType': 'daily',
-        'frequency': '1',
-        'period': '1',
-        'endDate': str(unixTimeMs(endDate)),
-        'startDate': str(unixTimeMs(startDate)),
-        'needExtendedHoursData': 'False'
-    }
-    content = requests.get(url=priceHistory, params=dailyChartPayLoad)
-    data = content.json()
-    data = convertData(data)
-    data = pandas.DataFrame(data['candles'])
-    data.columns = data.columns.str.capitalize()
     return data
 
-def getTDData(ticker,start,end):
+def getTDData(ticker,start,end, cache=None):
     try:
         stockData = getYearlyDataTD(ticker,
                                     datetime.datetime.strptime(start, '%Y-%m-%d'),
-                                    datetime.datetime.strptime(end, '%Y-%m-%d'))
+                                    datetime.datetime.strptime(end, '%Y-%m-%d'),
+                                    cache=cache)
 
         stockData.insert(loc=0, column='Counter', value=np.arange(len(stockData)))
         stockData = stockData.reset_index()
@@ -179,7 +266,7 @@ def getData(ticker, start, end):
 def getPremarketData(data):
     """
     Get Premarket Highest price, Lowest price after Highest price is met, the respective times and cumulative volume
-    :param data: Stock Candles Data
+    :param data: Stock Candles Data, or Bars of one day whose premarket bars are used
     :return: Premarket High, Premarket High Time, Premarket Low after High, Low time and cumulative volume
     """
     premarketData = {
@@ -190,6 +277,20 @@ def getPremarketData(data):
         'Premarket Volume':0
     }
 
+    if isinstance(data, Bars):
+        # Same defaults as the candle loop when the day has no premarket or the low never moved after the high
+        stats = premarket_stats.premarketStats('', data)
+        stats = stats[stats['Premarket High'].notna()]
+        if not stats.empty:
+            day = stats.iloc[0]
+            premarketData['Premarket High'] = float(day['Premarket High'])
+            premarketData['Premarket High Time'] = day['Premarket High Time']
+            premarketData['Premarket Low (After Top Reached)'] = float(day['Premarket Low (After Top Reached)'])
+            if day['Premarket Low Time (After Top Reached)'] is not None:
+                premarketData['Premarket Low Time (After Top Reached)'] = day['Premarket Low Time (After Top Reached)']
+            premarketData['Premarket Volume'] = int(day['Premarket Volume'])
+        return premarketData
+
     for candle in data:
         if candle['high'] > premarketData['Premarket High']:
             premarketData['Premarket High'] = candle['high']
@@ -209,47 +310,31 @@ def getPivotPoints(df):
     Swing lows are reversals when the bars go from red to green
     Swing highs are reversals when bars go from green to red
     :param df: Stock Chart
-    :return:
+    :return: Support pivots and resistance pivots as (datetime, price, counter) tuples
     """
-    resistancePivots = []
-    supportPivots = []
-    prevBarIsGreen = df['Close'].iloc[0] > df['Open'].iloc[0]
-    prevClose = df['Close'].iloc[0]
-    print(prevBarIsGreen)
-
-    for index, row in df.iloc[1:].iterrows():
-        if row['Close'] > row['Open'] and prevBarIsGreen == False:
-            num = prevClose if prevClose < row['Open'] else row['Open']
-            supportPivots.append((index.to_pydatetime(),num, row['Counter'])) # Note: You could have prev red candle as start of pivot (OR?)
-            prevBarIsGreen = True
-        elif row['Close'] < row['Open'] and prevBarIsGreen:
-            num = prevClose if prevClose > row['Open'] else row['Open']
-            resistancePivots.append((index.to_pydatetime(),num, row['Counter']))
-            prevBarIsGreen = False
-        prevClose = row['Close']
-
-    return supportPivots, resistancePivots
+    support, resistance = pivot_engine.getPivotArrays(df)
+    return pivot_engine.toPivotTuples(support), pivot_engine.toPivotTuples(resistance)
 
 class Trendline():
     def __init__(self, startPivot, endPivot, pivots):
         self.startPivot = startPivot
         self.endPivot = endPivot
         self.pivots = pivots
-        self.slope, self.yIntercept = math_calcs.getLineGraph(startPivot[2], startPivot[1], endPivot[2], endPivot[1])
         self.marginOfError = 0.1
         self.score = 0
 
     def calcTouchPoints(self):
-        touchPoint = 0
-        for p in self.pivots:
-            if abs(self.yIntercept + self.slope * p[2] - p[1]) < ((self.yIntercept + self.slope * p[2]) * self.marginOfError):
-                touchPoint += 1
+        touchPoint = int(trendline_engine.scoreLines([self.startPivot[2]], [self.startPivot[1]],
+                                                     [self.endPivot[2]], [self.endPivot[1]],
+                                                     [p[2] for p in self.pivots], [p[1] for p in self.pivots],
+                                                     self.marginOfError)[0])
 
         self.score = touchPoint
 
         return touchPoint
 
-def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False):
+def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False, mode='bruteforce',
+                      marginOfError=trendline_engine.MARGIN_OF_ERROR):
     """
     Sort the pivots by ascending or descending order
     Graph a line between the 2 points and check how many pivot points touch it
@@ -258,28 +343,12 @@ def generateTrendLine(pivots, startTime=0, endTime=0, reverse=False):
     :param pivots:
     :param startTime:
     :param endTime:
+    :param mode: 'bruteforce' scores lines from the extreme pivot to every other pivot,
+                 'hull' only scores the edges of the lower (upper when reverse) convex hull of the pivots
+    :param marginOfError: Allowed distance from the line as a fraction of the line value
     :return:
     """
-    sortedPivots = sorted(pivots,key=lambda x:x[1],reverse=reverse)
-    p1 = sortedPivots[0]
-    prevDate = p1[0]
-    highScore = 0
-    pair = {}
-
-    for piv in sortedPivots[1:]:
-        if not (prevDate > piv[0]):
-            trendPoint = Trendline(p1, piv, sortedPivots).calcTouchPoints()
-            if highScore < trendPoint:
-                highScore = trendPoint
-                pair = {
-                        'Date1': p1[0], # .strftime("%Y-%m-%d"),
-                        'Pivot1': p1[1],
-                        'Date2': piv[0], # .strftime("%Y-%m-%d"),
-                        'Pivot2': piv[1]
-                    }
-                prevDate = pair['Date2']
-
-    return pair
+    return trendline_engine.trendLine(pivots, reverse, mode, marginOfError)
 
 def getAllStocks():
     """
@@ -335,13 +404,10 @@ def getStockList(storeExcel=False, path=None):
     :param path: location to store excel file
     :return:
     """
-    import time
-
-    start = time.time()
-    stockList = Custom().ScreenerView(columns=[0,1,2,3,4,5,6,7,8,25,30,65,66,67])
-    end = time.time()
+    with metrics.Timer(metrics.FETCH, 'FINVIZ') as timer:
+        stockList = Custom().ScreenerView(columns=[0,1,2,3,4,5,6,7,8,25,30,65,66,67])
 
-    print('Took {0} Min and {1} Seconds to Query'.format((end - start)//60, (end-start)%60))
+    print('Took {0} Min and {1} Seconds to Query'.format(timer.elapsed//60, timer.elapsed%60))
 
     if storeExcel:
         stockList.to_excel(path)
@@ -349,7 +415,16 @@ def getStockList(storeExcel=False, path=None):
     return stockList
 
 
-def readStockData(symbol):
+def readStockData(symbol, store=None):
+    """
+    Read saved daily data for a stock
+    :param symbol: Ticker
+    :param store: BarStore to read from. Falls back to the excel archive when not given
+    :return: Dataframe indexed by Date
+    """
+    if store is not None:
+        return toDailyChart(store.readBars(symbol, DAILY, deriveDateTime=False))
+
     df = pandas.read_excel('D:/The Fastlane Project/Coding Projects/Stock Analysis/results/stock_data/{0}_Data.xlsx'.format(symbol), index_col=0)
     return df
 
@@ -0,0 +1,141 @@
+import datetime
+
+import numpy as np
+import pandas
+
+PREMARKET_START = datetime.time(4, 0)
+AFTER_HOURS_END = datetime.time(20, 0)
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
+
+
+def _candles(rng, count, start, volatility, baseVolume):
+    """
+    Random walk candles rounded to cents, so doji bars show up like in real data
+    :return: Opens, highs, lows, closes, volumes
+    """
+    closes = np.maximum(np.round(start * np.exp(rng.normal(0, volatility, count).cumsum()), 2), 0.01)
+    opens = np.empty(count)
+    opens[0] = round(start, 2)
+    opens[1:] = closes[:-1]
+    opens = np.maximum(np.round(opens * (1 + rng.normal(0, volatility / 4, count)), 2), 0.01)
+    highs = np.round(np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, volatility / 2, count))), 2)
+    lows = np.round(np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, volatility / 2, count))), 2)
+    volumes = rng.lognormal(np.log(baseVolume), 0.8, count).astype('int64')
+    return opens, highs, lows, closes, volumes
+
+
+def dailyBars(days, seed=0, start='2010-1-4', price=50.0):
+    """
+    Seeded daily chart shaped like getTDData: Counter and index columns, OHLCV, Datetime and a Date index
+    :param days: Number of business days
+    :param seed: Random seed
+    :param start: First date
+    :param price: Starting price
+    :return: Dataframe indexed by Date
+    """
+    rng = np.random.default_rng(seed)
+    dates = pandas.bdate_range(start, periods=days)
+    opens, highs, lows, closes, volumes = _candles(rng, days, price, 0.02, 2000000)
+
+    return pandas.DataFrame({
+        'Counter': np.arange(days),
+        'index': np.arange(days),
+        'Open': opens,
+        'High': highs,
+        'Low': lows,
+        'Close': closes,
+        'Volume': volumes,
+        'Datetime': dates,
+    }, index=pandas.DatetimeIndex(dates, name='Date'))
+
+
+def minuteBars(days=1, seed=0, start='2021-6-1', price=5.0, gap=0.2):
+    """
+    Seeded extended hours 1 minute bars (4:00 to 20:00) shaped like readIntradayDataAV output
+    Every day gaps up in premarket on heavy volume, then trades the regular session and after hours
+    :param days: Number of business days
+    :param seed: Random seed
+    :param start: First date
+    :param price: Starting price
+    :param gap: Premarket gap up as a fraction of the previous close
+    :return: Dataframe with Time, Open, High, Low, Close, Volume, Datetime and Date
+    """
+    rng = np.random.default_rng(seed)
+    minutes = pandas.timedelta_range(start='4:00:00', end='19:59:00', freq='min')
+    frames = []
+
+    for date in pandas.bdate_range(start, periods=days):
+        stamps = date + minutes
+        opens, highs, lows, closes, volumes = _candles(rng, len(stamps), price * (1 + gap), 0.004, 20000)
+
+        times = stamps.time
+        regular = (times >= MARKET_OPEN) & (times < MARKET_CLOSE)
+        volumes[regular] *= 5
+        volumes[times >= MARKET_CLOSE] //= 4
+
+        frames.append(pandas.DataFrame({
+            'Time': times,
+            'Open': opens,
+            'High': highs,
+            'Low': lows,
+            'Close': closes,
+            'Volume': volumes,
+            'Datetime': stamps,
+            'Date': stamps.date,
+        }))
+        price = float(closes[-1])
+
+    return pandas.concat(frames, ignore_index=True)
+
+
+def minuteDays(count, seed=0, start='2021-6-1'):
+    """
+    Independent single day minute charts, one per seed, for per ticker-day code like DipAndRip
+    :return: List of (trade date, dataframe)
+    """
+    charts = []
+    for i in range(count):
+        chart = minuteBars(1, seed + i, start, price=2.0 + (seed + i) % 20)
+        charts.append((chart['Date'].iloc[0], chart))
+    return charts
+
+
+def intradayCsv(days=22, seed=7, start='2021-6-1'):
+    """
+    Extended hours 1 minute bars (4:00 to 20:00) in the Alpha Vantage intraday csv layout, newest first
+    Prices have 4 decimals so parsing them has to round trip exactly
+    :return: Bytes of the csv
+    """
+    rng = np.random.default_rng(seed)
+    sessions = pandas.bdate_range(start, periods=days)
+    minutes = pandas.timedelta_range('4:00:00', '19:59:00', freq='min')
+    stamps = (sessions.values[:, None] + minutes.values[None, :]).ravel()[::-1]
+
+    closes = np.round(10 + rng.normal(0, 0.01, len(stamps)).cumsum(), 4)
+    opens = np.round(closes + rng.normal(0, 0.005, len(stamps)), 4)
+    highs = np.maximum(opens, closes) + 0.01
+    lows = np.minimum(opens, closes) - 0.01
+    volumes = rng.integers(0, 50000, len(stamps))
+
+    df = pandas.DataFrame({'time': pandas.DatetimeIndex(stamps).strftime('%Y-%m-%d %H:%M:%S'), 'open': opens,
+                           'high': highs, 'low': lows, 'close': closes, 'volume': volumes})
+    return df.to_csv(index=False).encode('utf-8')
+
+
+def universeFrame(count, seed=0):
+    """
+    Seeded screener export in finviz's typed layout: Ticker, Sector, Industry, Market Cap, Price and Volume
+    :param count: Number of stocks
+    :return: Dataframe
+    """
+    rng = np.random.default_rng(seed)
+    sectors = np.array(['Technology', 'Healthcare', 'Energy', 'Financial', 'Consumer Cyclical'])
+    return pandas.DataFrame({
+        'Ticker': ['S{0}'.format(i) for i in range(count)],
+        'Sector': sectors[rng.integers(0, len(sectors), count)],
+        'Industry': ['Industry {0}'.format(i) for i in rng.integers(0, 60, count)],
+        'Market Cap': np.round(rng.lognormal(np.log(1e9), 2.0, count), -3),
+        'Price': np.round(rng.lognormal(np.log(20), 1.2, count), 2),
+        'Volume': rng.lognormal(np.log(500000), 1.5, count).astype('int64').astype('float64'),
+    })
@@ -0,0 +1,342 @@
+import numpy as np
+import pandas
+
+MARGIN_OF_ERROR = 0.1
+
+# Upper bound on lines x pivots evaluated in one broadcast, about 32 MB of float64
+MAX_ELEMENTS = 1 << 22
+
+
+def scoreLines(x1, y1, x2, y2, pivotX, pivotY, marginOfError=MARGIN_OF_ERROR, maxElements=MAX_ELEMENTS):
+    """
+    Count how many pivots touch each line, in chunks so memory stays bounded
+    A pivot touches a line when its distance to the line is within marginOfError of the line value
+    :param x1, y1, x2, y2: Arrays with the two points (counter, price) of every line
+    :param pivotX: Counters of the pivots
+    :param pivotY: Prices of the pivots
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :param maxElements: Max number of line x pivot cells computed at once
+    :return: Touch count of every line
+    """
+    x1 = np.asarray(x1, dtype=np.float64)
+    y1 = np.asarray(y1, dtype=np.float64)
+    x2 = np.asarray(x2, dtype=np.float64)
+    y2 = np.asarray(y2, dtype=np.float64)
+    pivotX = np.asarray(pivotX, dtype=np.float64)
+    pivotY = np.asarray(pivotY, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (y2 - y1) / (x2 - x1)
+    yIntercepts = y2 - slopes * x2
+
+    scores = np.zeros(len(slopes), dtype=np.int64)
+    chunk = max(1, maxElements // max(1, len(pivotX)))
+
+    for start in range(0, len(slopes), chunk):
+        stop = start + chunk
+        with np.errstate(invalid='ignore'):
+            # Keep the pivot axis innermost and work in place, column broadcasts are slow in numpy
+            lineY = pivotX[None, :] * slopes[start:stop, None]
+            lineY += yIntercepts[start:stop, None]
+            distance = lineY - pivotY[None, :]
+            np.abs(distance, out=distance)
+            lineY *= marginOfError
+            touches = distance < lineY
+        scores[start:stop] = np.count_nonzero(touches, axis=1)
+
+    # Vertical lines (same counter twice) are not trendlines
+    scores[~np.isfinite(slopes)] = 0
+
+    return scores
+
+
+def scoreAnchoredLines(anchorX, anchorY, x2, y2, pivotX, pivotY, marginOfError=MARGIN_OF_ERROR,
+                       maxElements=MAX_ELEMENTS):
+    """
+    Touch counts for lines that all start at the same anchor pivot, in O(n log n)
+    For a fixed anchor each pivot touches the lines whose slope falls in an open interval, so a line's score is
+    the number of intervals holding its slope. Lines whose slope sits within rounding distance of an interval
+    end are rescored with scoreLines so the counts match it exactly.
+    :param anchorX: Counter of the anchor pivot
+    :param anchorY: Price of the anchor pivot
+    :param x2: Counters of the second point of every line
+    :param y2: Prices of the second point of every line
+    :param pivotX: Counters of the pivots
+    :param pivotY: Prices of the pivots
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :param maxElements: Max number of line x pivot cells computed at once when rescoring
+    :return: Touch count of every line
+    """
+    x2 = np.asarray(x2, dtype=np.float64)
+    y2 = np.asarray(y2, dtype=np.float64)
+    pivotX = np.asarray(pivotX, dtype=np.float64)
+    pivotY = np.asarray(pivotY, dtype=np.float64)
+    anchorX = float(anchorX)
+    anchorY = float(anchorY)
+    lines = len(x2)
+
+    if not (0.0 < marginOfError < 1.0) or anchorY <= 0 or not np.all(pivotY > 0) \
+            or not np.all(np.isfinite(pivotY)) or not np.all(np.isfinite(y2)):
+        return scoreLines(np.full(lines, anchorX), np.full(lines, anchorY), x2, y2, pivotX, pivotY,
+                          marginOfError, maxElements)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (y2 - anchorY) / (x2 - anchorX)
+    vertical = ~np.isfinite(slopes)
+    slopes[vertical] = 0.0
+
+    # Upper bound on the rounding error of the line values scoreLines computes
+    tolerance = 1e-12 * (np.abs(pivotY).max() + anchorY + np.abs(slopes).max() * (np.abs(pivotX).max() + abs(anchorX)))
+
+    dx = pivotX - anchorX
+    flat = dx == 0
+    moving = ~flat
+    dx = dx[moving]
+    # A pivot touches when y / (1 + margin) < line value < y / (1 - margin)
+    lowLine = pivotY[moving] / (1.0 + marginOfError) - anchorY
+    highLine = pivotY[moving] / (1.0 - marginOfError) - anchorY
+    rising = dx > 0
+    lows = np.where(rising, lowLine, highLine) / dx
+    highs = np.where(rising, highLine, lowLine) / dx
+    slack = tolerance / np.abs(dx)
+
+    def countInside(lo, hi):
+        lo = np.sort(lo)
+        hi = np.sort(hi)
+        return np.searchsorted(lo, slopes, side='left') - np.searchsorted(hi, slopes, side='right')
+
+    surely = countInside(lows + slack, highs - slack)
+    maybe = countInside(lows - slack, highs + slack)
+
+    # Pivots on the anchor's counter sit on every line at the anchor price
+    distance = np.abs(pivotY[flat] - anchorY)
+    surely += np.count_nonzero(distance < anchorY * marginOfError - tolerance)
+    maybe += np.count_nonzero(distance < anchorY * marginOfError + tolerance)
+
+    scores = surely.astype(np.int64)
+    unsure = np.flatnonzero(surely != maybe)
+    if len(unsure):
+        scores[unsure] = scoreLines(np.full(len(unsure), anchorX), np.full(len(unsure), anchorY), x2[unsure],
+                                    y2[unsure], pivotX, pivotY, marginOfError, maxElements)
+    scores[vertical] = 0
+
+    return scores
+
+
+def anchoredTrendLine(pivots, reverse=False, marginOfError=MARGIN_OF_ERROR):
+    """
+    Same search as generateTrendLine: anchor on the lowest (or highest) pivot, score the line to every other
+    pivot at once and keep the best line whose second point moves forward in time
+    :param pivots: List of (datetime, price, counter) tuples
+    :param reverse: Anchor on the highest pivot instead of the lowest
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :return: Dict with Date1, Pivot1, Date2, Pivot2 or empty dict
+    """
+    sortedPivots = sorted(pivots, key=lambda x: x[1], reverse=reverse)
+    if len(sortedPivots) < 2:
+        return {}
+
+    prices = np.array([p[1] for p in sortedPivots], dtype=np.float64)
+    counters = np.array([p[2] for p in sortedPivots], dtype=np.float64)
+
+    scores = scoreAnchoredLines(counters[0], prices[0], counters[1:], prices[1:], counters, prices, marginOfError)
+
+    p1 = sortedPivots[0]
+    prevDate = p1[0]
+    highScore = 0
+    pair = {}
+
+    for piv, trendPoint in zip(sortedPivots[1:], scores.tolist()):
+        if not (prevDate > piv[0]) and highScore < trendPoint:
+            highScore = trendPoint
+            pair = {
+                'Date1': p1[0],
+                'Pivot1': p1[1],
+                'Date2': piv[0],
+                'Pivot2': piv[1]
+            }
+            prevDate = pair['Date2']
+
+    return pair
+
+
+def convexHull(x, y, upper=False):
+    """
+    Lower or upper convex hull of the points with Andrew's monotone chain, O(n log n)
+    :param x: Counters of the points
+    :param y: Prices of the points
+    :param upper: Build the upper hull instead of the lower hull
+    :return: Positions of the hull vertices ordered by counter
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.lexsort((y, x)).tolist()
+    xs = x.tolist()
+    ys = y.tolist()
+    sign = -1.0 if upper else 1.0
+    hull = []
+
+    for i in order:
+        while len(hull) >= 2:
+            a, b = hull[-2], hull[-1]
+            cross = (xs[b] - xs[a]) * (ys[i] - ys[a]) - (ys[b] - ys[a]) * (xs[i] - xs[a])
+            if sign * cross > 0:
+                break
+            hull.pop()
+        hull.append(i)
+
+    return np.array(hull, dtype=np.int64)
+
+
+def hullTrendLine(pivots, reverse=False, marginOfError=MARGIN_OF_ERROR):
+    """
+    Only score the edges of the pivots' convex hull: lower hull edges for support lines,
+    upper hull edges for resistance lines (reverse). Every pivot lies on one side of a hull edge
+    so the edges are the lines price respected
+    Building the hull is O(n log n), scoring its h edges against every pivot is O(h n). h is usually a few dozen
+    at most, against the n lines the brute force search scores
+    :param pivots: List of (datetime, price, counter) tuples
+    :param reverse: Use the upper hull (resistance) instead of the lower hull (support)
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :return: Dict with Date1, Pivot1, Date2, Pivot2 or empty dict
+    """
+    if len(pivots) < 2:
+        return {}
+
+    prices = np.array([p[1] for p in pivots], dtype=np.float64)
+    counters = np.array([p[2] for p in pivots], dtype=np.float64)
+    hull = convexHull(counters, prices, upper=reverse)
+    if len(hull) < 2:
+        return {}
+
+    first, second = hull[:-1], hull[1:]
+    scores = scoreLines(counters[first], prices[first], counters[second], prices[second], counters, prices,
+                        marginOfError)
+    best = int(np.argmax(scores))
+    if scores[best] == 0:
+        return {}
+
+    p1 = pivots[first[best]]
+    p2 = pivots[second[best]]
+
+    return {
+        'Date1': p1[0],
+        'Pivot1': p1[1],
+        'Date2': p2[0],
+        'Pivot2': p2[1]
+    }
+
+
+def trendLine(pivots, reverse=False, mode='bruteforce', marginOfError=MARGIN_OF_ERROR):
+    """
+    Best trendline of the pivots with the search generateTrendLine's mode names
+    :param mode: 'bruteforce' for anchoredTrendLine, 'hull' for hullTrendLine
+    :return: Dict with Date1, Pivot1, Date2, Pivot2 or empty dict
+    """
+    if mode == 'bruteforce':
+        return anchoredTrendLine(pivots, reverse=reverse, marginOfError=marginOfError)
+    if mode == 'hull':
+        return hullTrendLine(pivots, reverse=reverse, marginOfError=marginOfError)
+
+    raise ValueError('Unknown trendline mode {0}'.format(mode))
+
+
+def compareHullMode(pivotSets, reverse=False, marginOfError=MARGIN_OF_ERROR):
+    """
+    Time hull mode against the anchored brute force search and measure how often they agree
+    :param pivotSets: List of pivot tuple lists, one per chart
+    :param reverse: Resistance (upper hull) instead of support (lower hull)
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :return: Dict with the timings of the anchored engine and hull mode, the speedup, the rate of identical
+             lines and the rate where hull's line touches at least as many pivots
+    """
+    import time
+
+    start = time.perf_counter()
+    bruteForce = [anchoredTrendLine(p, reverse, marginOfError) for p in pivotSets]
+    bruteForceTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hull = [hullTrendLine(p, reverse, marginOfError) for p in pivotSets]
+    hullTime = time.perf_counter() - start
+
+    def touches(pivots, pair):
+        if not pair:
+            return 0
+        counters = {p[0]: p[2] for p in pivots}
+        return int(scoreLines([counters[pair['Date1']]], [pair['Pivot1']], [counters[pair['Date2']]],
+                              [pair['Pivot2']], [p[2] for p in pivots], [p[1] for p in pivots],
+                              marginOfError)[0])
+
+    same = sum(h == b for h, b in zip(hull, bruteForce))
+    asGood = sum(touches(p, h) >= touches(p, b) for p, h, b in zip(pivotSets, hull, bruteForce))
+    charts = max(1, len(pivotSets))
+
+    return {
+        'Charts': len(pivotSets),
+        'Brute Force Seconds': bruteForceTime,
+        'Hull Seconds': hullTime,
+        'Speedup': bruteForceTime / hullTime if hullTime else float('inf'),
+        'Same Line Rate': same / charts,
+        'Score At Least As Good Rate': asGood / charts,
+    }
+
+
+def _keepTop(scores, first, second, k):
+    if len(scores) <= k:
+        return scores, first, second
+    keep = np.argpartition(-scores, k - 1)[:k]
+    return scores[keep], first[keep], second[keep]
+
+
+def findTopTrendLines(pivotArrays, k=5, allPairs=False, reverse=False, marginOfError=MARGIN_OF_ERROR,
+                      maxElements=MAX_ELEMENTS):
+    """
+    Score candidate trendlines against all pivots and return the k lines with the most touch points
+    :param pivotArrays: (timestamps, prices, counters) arrays from pivot_engine.getPivotArrays
+    :param k: Number of lines to return
+    :param allPairs: Score every pivot pair instead of only the pairs anchored on the extreme pivot
+    :param reverse: Anchor on the highest pivot instead of the lowest (anchored mode only)
+    :param marginOfError: Allowed distance as a fraction of the line value
+    :param maxElements: Max number of line x pivot cells computed at once when rescoring
+    :return: Dataframe of Date1, Pivot1, Date2, Pivot2, Score sorted by Score
+    """
+    times, prices, counters = pivotArrays
+    times = np.asarray(times)
+    prices = np.asarray(prices, dtype=np.float64)
+    counters = np.asarray(counters, dtype=np.float64)
+    columns = ['Date1', 'Pivot1', 'Date2', 'Pivot2', 'Score']
+
+    if len(prices) < 2:
+        return pandas.DataFrame(columns=columns)
+
+    bestScores = np.empty(0, dtype=np.int64)
+    bestFirst = np.empty(0, dtype=np.int64)
+    bestSecond = np.empty(0, dtype=np.int64)
+
+    if allPairs:
+        # One anchor at a time keeps memory at O(pivots) however many pairs there are
+        order = np.argsort(counters, kind='stable')
+        candidates = ((order[i], order[i + 1:]) for i in range(len(order) - 1))
+    else:
+        anchor = np.argsort(-prices if reverse else prices, kind='stable')[0]
+        candidates = [(anchor, np.flatnonzero((counters >= counters[anchor]) & (np.arange(len(prices)) != anchor)))]
+
+    for anchor, second in candidates:
+        scores = scoreAnchoredLines(counters[anchor], prices[anchor], counters[second], prices[second],
+                                    counters, prices, marginOfError, maxElements)
+        bestScores, bestFirst, bestSecond = _keepTop(np.concatenate([bestScores, scores]),
+                                                     np.concatenate([bestFirst, np.full(len(second), anchor)]),
+                                                     np.concatenate([bestSecond, second]), k)
+
+    order = np.lexsort((bestSecond, bestFirst, -bestScores))
+    bestScores, bestFirst, bestSecond = bestScores[order], bestFirst[order], bestSecond[order]
+
+    return pandas.DataFrame({
+        'Date1': times[bestFirst],
+        'Pivot1': prices[bestFirst],
+        'Date2': times[bestSecond],
+        'Pivot2': prices[bestSecond],
+        'Score': bestScores,
+    }, columns=columns)
+
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+import pandas
+
+DEFAULT_UNIVERSE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'finviz_stocks_list.csv')
+
+SUFFIXES = {'K': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+
+# Columns finviz writes as 49.13B, "2,844,685", 1.31% or - when missing
+SUFFIX_COLUMNS = ['Market Cap']
+COMMA_COLUMNS = ['Volume']
+PERCENT_COLUMNS = ['Change']
+NUMBER_COLUMNS = ['P/E', 'Price']
+
+RANGE_INDEXES = ['Market Cap', 'Price', 'Volume']
+CATEGORY_INDEXES = ['Sector', 'Industry']
+
+
+def _asText(values):
+    return values.astype(str).str.strip()
+
+
+def parseSuffixNumbers(values):
+    """
+    Parse numbers written with a K, M, B or T suffix such as 49.13B. Missing values (-) become NaN
+    :param values: Series of strings or numbers
+    :return: Series of float
+    """
+    if pandas.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+
+    text = _asText(values)
+    multiplier = text.str[-1:].str.upper().map(SUFFIXES)
+    number = pandas.to_numeric(text.where(multiplier.isna(), text.str[:-1]), errors='coerce')
+    return number * multiplier.fillna(1.0)
+
+
+def parseCommaNumbers(values):
+    """
+    Parse numbers written with thousands separators such as 2,844,685
+    :param values: Series of strings or numbers
+    :return: Series of float
+    """
+    if pandas.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+
+    return pandas.to_numeric(_asText(values).str.replace(',', '', regex=False), errors='coerce')
+
+
+def parsePercent(values):
+    """
+    Parse percents such as 1.31% to 1.31
+    :param values: Series of strings or numbers
+    :return: Series of float
+    """
+    if pandas.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+
+    return pandas.to_numeric(_asText(values).str.rstrip('%'), errors='coerce')
+
+
+def normalizeUniverse(df):
+    """
+    Type a finviz screener export or scrape
+    :param df: Dataframe with Ticker and any of the finviz columns
+    :return: Dataframe with float numeric columns and categorical Sector, Industry and Country
+    """
+    df = df.copy()
+    parsers = [(SUFFIX_COLUMNS, parseSuffixNumbers), (COMMA_COLUMNS, parseCommaNumbers),
+               (PERCENT_COLUMNS, parsePercent), (NUMBER_COLUMNS, parseCommaNumbers)]
+
+    for columns, parser in parsers:
+        for column in columns:
+            if column in df.columns:
+                df[column] = parser(df[column])
+
+    for column in CATEGORY_INDEXES + ['Country']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    df['Ticker'] = df['Ticker'].astype(str)
+    return df.reset_index(drop=True)
+
+
+class Universe:
+    """
+    Typed stock universe with sorted indexes for range and category filters
+    Range filters are two binary searches on a presorted column instead of a scan over every row
+    """
+    def __init__(self, df, normalize=True):
+        self.data = normalizeUniverse(df) if normalize else df.reset_index(drop=True)
+        self.rangeIndexes = {}
+        self.categoryIndexes = {}
+
+        for column in RANGE_INDEXES:
+            if column in self.data.columns:
+                values = self.data[column].to_numpy(dtype='float64')
+                order = np.argsort(values, kind='stable')
+                sortedValues = values[order]
+                # NaN sort last, keep them out of every range
+                count = len(sortedValues) - int(np.isnan(sortedValues).sum())
+                self.rangeIndexes[column] = (sortedValues[:count], order[:count])
+
+        for column in CATEGORY_INDEXES:
+            if column in self.data.columns:
+                self.categoryIndexes[column] = {key: np.asarray(positions) for key, positions
+                                                in self.data.groupby(column, observed=True).indices.items()}
+
+    def __len__(self):
+        return len(self.data)
+
+    def between(self, column, low=None, high=None):
+        """
+        Rows with low <= column < high
+        :param column: Market Cap, Price or Volume
+        :param low: Inclusive lower bound, None for no bound
+        :param high: Exclusive upper bound, None for no bound
+        :return: Array of row positions
+        """
+        sortedValues, order = self.rangeIndexes[column]
+        start = 0 if low is None else np.searchsorted(sortedValues, low, side='left')
+        end = len(sortedValues) if high is None else np.searchsorted(sortedValues, high, side='left')
+        return order[start:end]
+
+    def isIn(self, column, values):
+        """
+        Rows whose Sector or Industry is one of values
+        :return: Array of row positions
+        """
+        index = self.categoryIndexes[column]
+        if isinstance(values, str):
+            values = [values]
+        # Each value's positions are disjoint, listing a value twice would repeat them
+        found = [index[value] for value in dict.fromkeys(values) if value in index]
+        return np.concatenate(found) if found else np.empty(0, dtype='int64')
+
+    def positions(self, ranges=None, categories=None):
+        """
+        Rows matching every filter
+        :param ranges: Dict of column to (low, high)
+        :param categories: Dict of column to value or list of values
+        :return: Sorted array of row positions
+        """
+        matched = None
+        filters = [self.between(column, *bounds) for column, bounds in (ranges or {}).items()]
+        filters += [self.isIn(column, values) for column, values in (categories or {}).items()]
+
+        for found in filters:
+            matched = np.sort(found) if matched is None else np.intersect1d(matched, found, assume_unique=True)
+
+        return np.arange(len(self.data)) if matched is None else matched
+
+    def screen(self, ranges=None, categories=None):
+        """
+        Screen the universe, e.g. screen({'Market Cap': (None, 300000000)}, {'Sector': 'Technology'})
+        :return: Dataframe of matching rows
+        """
+        return self.data.iloc[self.positions(ranges, categories)]
+
+    def tickers(self, ranges=None, categories=None):
+        return self.data['Ticker'].to_numpy()[self.positions(ranges, categories)].tolist()
+
+
+def loadUniverse(csvPath=DEFAULT_UNIVERSE_PATH):
+    """
+    Load and type the finviz export
+    :param csvPath: finviz export
+    :return: Universe
+    """
+    return Universe(pandas.read_csv(csvPath))
+
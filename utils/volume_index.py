@@ -0,0 +1,236 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas
+
+from utils.bar_store import DAILY
+
+DEFAULT_INDEX_PATH = 'D:/The Fastlane Project/Coding Projects/Stock Analysis/results/volume_index'
+
+DAYS_FILE = 'days.parquet'
+STATE_FILE = 'state.json'
+
+INDEX_COLUMNS = ['Ticker', 'Date', 'Volume', 'Relative Volume']
+
+# Same cut findPotentialDipAndRipTrades uses
+DEFAULT_MIN_VOLUME = 1000000
+DEFAULT_MIN_RELATIVE_VOLUME = 3.0
+DEFAULT_WINDOW = 20
+
+
+def relativeVolume(volumes, window=DEFAULT_WINDOW):
+    """
+    Volume of every day over the average volume of the window days before it
+    :param volumes: Series of daily volume, oldest first
+    :return: Series of float, NaN until window days are known
+    """
+    average = volumes.rolling(window=window, min_periods=window).mean().shift(1)
+    return volumes / average
+
+
+class VolumeIndex:
+    """
+    Inverted index of high volume days built from daily bars: ticker -> dates and date -> tickers
+    A day is indexed when it trades at least minVolume shares or minRelativeVolume times its recent average,
+    queries can then ask for any stricter cut
+    Stored as one parquet table of indexed days plus a json state with the last date seen per ticker,
+    so updates only read the days that arrived since
+    """
+    def __init__(self, path=DEFAULT_INDEX_PATH, minVolume=DEFAULT_MIN_VOLUME,
+                 minRelativeVolume=DEFAULT_MIN_RELATIVE_VOLUME, window=DEFAULT_WINDOW):
+        self.path = path
+        self.minVolume = minVolume
+        self.minRelativeVolume = minRelativeVolume
+        self.window = window
+        self.lastDates = {}
+        self.days = pandas.DataFrame({'Ticker': pandas.Series(dtype=object),
+                                      'Date': pandas.Series(dtype='datetime64[ns]'),
+                                      'Volume': pandas.Series(dtype='int64'),
+                                      'Relative Volume': pandas.Series(dtype='float64')})
+        self.load()
+
+    def load(self):
+        statePath = os.path.join(self.path, STATE_FILE)
+        if not os.path.exists(statePath):
+            self.buildLookups()
+            return
+
+        with open(statePath) as f:
+            state = json.load(f)
+
+        settings = state['Settings']
+        self.minVolume = settings['Min Volume']
+        self.minRelativeVolume = settings['Min Relative Volume']
+        self.window = settings['Window']
+        self.lastDates = {ticker: pandas.Timestamp(date) for ticker, date in state['Last Dates'].items()}
+
+        daysPath = os.path.join(self.path, DAYS_FILE)
+        if os.path.exists(daysPath):
+            self.days = pandas.read_parquet(daysPath)
+            self.days['Ticker'] = self.days['Ticker'].astype(object)
+        self.buildLookups()
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        daysPath = os.path.join(self.path, DAYS_FILE)
+        days = self.days.copy()
+        days['Ticker'] = days['Ticker'].astype('category')
+        days.to_parquet('{0}.tmp'.format(daysPath), index=False)
+        os.replace('{0}.tmp'.format(daysPath), daysPath)
+
+        statePath = os.path.join(self.path, STATE_FILE)
+        state = {
+            'Settings': {'Min Volume': self.minVolume, 'Min Relative Volume': self.minRelativeVolume,
+                         'Window': self.window},
+            'Last Dates': {ticker: date.strftime('%Y-%m-%d') for ticker, date in self.lastDates.items()},
+        }
+        with open('{0}.tmp'.format(statePath), 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace('{0}.tmp'.format(statePath), statePath)
+
+    def buildLookups(self):
+        """
+        Sort the table by date then ticker and map every ticker and date to its rows
+        """
+        self.days = self.days.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+        self.byTicker = {ticker: np.asarray(rows) for ticker, rows in self.days.groupby('Ticker').indices.items()}
+        self.byDate = {date: np.asarray(rows) for date, rows in self.days.groupby('Date').indices.items()}
+
+    def addBars(self, ticker, bars):
+        """
+        Index the days of one ticker newer than the last date seen for it
+        :param ticker: Ticker
+        :param bars: Daily bars with Datetime (or Date) and Volume, including the window days before
+                     the new ones so their relative volume can be computed
+        :return: Number of days indexed
+        """
+        ticker = ticker.upper()
+        stamps = bars['Datetime'] if 'Datetime' in bars.columns else bars['Date']
+        days = pandas.DataFrame({'Date': pandas.to_datetime(stamps).dt.normalize().to_numpy(),
+                                 'Volume': bars['Volume'].to_numpy().astype('int64')})
+        days = days.sort_values('Date', kind='mergesort').drop_duplicates('Date', keep='last')
+        if days.empty:
+            return 0
+
+        days['Relative Volume'] = relativeVolume(days['Volume'], self.window)
+
+        last = self.lastDates.get(ticker)
+        isNew = days['Date'] > last if last is not None else np.ones(len(days), dtype=bool)
+        isHigh = (days['Volume'] >= self.minVolume) | (days['Relative Volume'] >= self.minRelativeVolume)
+        found = days[isNew & isHigh]
+
+        self.lastDates[ticker] = max(days['Date'].iloc[-1], last) if last is not None else days['Date'].iloc[-1]
+        if found.empty:
+            return 0
+
+        found.insert(loc=0, column='Ticker', value=ticker)
+        self.days = pandas.concat([self.days, found[INDEX_COLUMNS]], ignore_index=True)
+        return len(found)
+
+    def update(self, store, tickers=None, save=True):
+        """
+        Index the daily bars that arrived in a BarStore since the last update
+        :param store: BarStore with daily bars
+        :param tickers: Tickers to update, defaults to every ticker in the store
+        :param save: Persist the index afterwards
+        :return: Number of days indexed
+        """
+        added = 0
+
+        for ticker in tickers if tickers is not None else store.tickers(DAILY):
+            last = self.lastDates.get(ticker.upper())
+            # Enough calendar days before the last date to refill the relative volume window
+            start = last - datetime.timedelta(days=self.window * 2 + 10) if last is not None else None
+            bars = store.readBars(ticker, DAILY, start, deriveDateTime=False)
+            added += self.addBars(ticker, bars)
+
+        self.buildLookups()
+        if save:
+            self.save()
+        return added
+
+    def checkCuts(self, minVolume, minRelativeVolume):
+        """
+        Raise when a query could match days the index never kept, i.e. neither cut is at least as strict
+        as the cut the index was built with
+        """
+        if minVolume is not None and minVolume >= self.minVolume:
+            return
+        if minRelativeVolume is not None and minRelativeVolume >= self.minRelativeVolume:
+            return
+        raise ValueError('Index only holds days with volume >= {0} or relative volume >= {1}, got minVolume={2} '
+                         'and minRelativeVolume={3}'.format(self.minVolume, self.minRelativeVolume, minVolume,
+                                                            minRelativeVolume))
+
+    def _rows(self, rows, minVolume, minRelativeVolume):
+        self.checkCuts(minVolume, minRelativeVolume)
+        if minVolume is not None:
+            rows = rows[self.days['Volume'].to_numpy()[rows] >= minVolume]
+        if minRelativeVolume is not None:
+            rows = rows[self.days['Relative Volume'].to_numpy()[rows] >= minRelativeVolume]
+        return rows
+
+    def tickersOn(self, date, minVolume=DEFAULT_MIN_VOLUME, minRelativeVolume=None, tickers=None):
+        """
+        Tickers with a high volume day on date
+        :param date: Trade date
+        :param minVolume: Shares traded at least, None for no cut
+        :param minRelativeVolume: Relative volume at least, None for no cut
+        :param tickers: Only keep these tickers, e.g. a universe screen
+        :return: List of tickers
+        :raises ValueError: When neither cut is as strict as the index's own
+        """
+        rows = self._rows(self.byDate.get(pandas.Timestamp(date), np.empty(0, dtype='int64')),
+                          minVolume, minRelativeVolume)
+        found = self.days['Ticker'].to_numpy()[rows].tolist()
+        if tickers is not None:
+            keep = {ticker.upper() for ticker in tickers}
+            found = [ticker for ticker in found if ticker in keep]
+        return found
+
+    def datesFor(self, ticker, minVolume=DEFAULT_MIN_VOLUME, minRelativeVolume=None):
+        """
+        High volume days of a ticker, oldest first
+        :return: List of dates
+        """
+        rows = self._rows(self.byTicker.get(ticker.upper(), np.empty(0, dtype='int64')),
+                          minVolume, minRelativeVolume)
+        return [stamp.date() for stamp in pandas.DatetimeIndex(self.days['Date'].to_numpy()[rows])]
+
+    def tickerDates(self, minVolume=DEFAULT_MIN_VOLUME, minRelativeVolume=None, tickers=None, start=None, end=None):
+        """
+        Every indexed (ticker, date) pair passing the cuts, the input backTestDipAndRip takes
+        :param tickers: Only keep these tickers
+        :param start: First date
+        :param end: Last date
+        :return: List of (ticker, date)
+        """
+        self.checkCuts(minVolume, minRelativeVolume)
+        days = self.days
+        mask = np.ones(len(days), dtype=bool)
+        if minVolume is not None:
+            mask &= days['Volume'].to_numpy() >= minVolume
+        if minRelativeVolume is not None:
+            mask &= days['Relative Volume'].to_numpy() >= minRelativeVolume
+        if tickers is not None:
+            mask &= days['Ticker'].isin([ticker.upper() for ticker in tickers]).to_numpy()
+        if start is not None:
+            mask &= (days['Date'] >= pandas.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (days['Date'] <= pandas.Timestamp(end)).to_numpy()
+
+        found = days[mask]
+        return list(zip(found['Ticker'].tolist(), found['Date'].dt.date.tolist()))
+
+    def toDatesMap(self, minVolume=DEFAULT_MIN_VOLUME, minRelativeVolume=None):
+        """
+        Ticker and date strings frame in the layout findPotentialDipAndRipTrades saves
+        """
+        dates = {}
+        for ticker, date in self.tickerDates(minVolume, minRelativeVolume):
+            dates.setdefault(ticker, []).append(date.strftime('%Y-%m-%d'))
+        tickers = sorted(dates)
+        return pandas.DataFrame({'Ticker': tickers, 'Dates': [dates[ticker] for ticker in tickers]})